@@ -0,0 +1,45 @@
+"""
+Blob size and encode/decode speed of the json and binary storage codecs.
+
+    python -m benchmarks.codec
+"""
+import copy
+import timeit
+from furryninja_cassandra.codec import JsonCodec, BinaryCodec
+from .fixtures import IMAGE_ASSET, ImageAsset, image_asset
+
+__author__ = 'broken'
+
+NUMBER = 2000
+REPEAT = 5
+
+CODECS = [
+    ('json', JsonCodec()),
+    ('binary', BinaryCodec()),
+    ('binary+zlib', BinaryCodec(compress=True, compress_min_size=0))
+]
+
+
+def large_asset():
+    data = copy.deepcopy(IMAGE_ASSET)
+    data['description'] = ' '.join(['Lorem ipsum dolor sit amet, consectetur adipisici elit'] * 40)
+    data['attributes']['files'] = [{'url': 'http://goo.gl/%i' % index, 'mime_type': 'image/png', 'height': 1080, 'width': 1920} for index in xrange(50)]
+    return ImageAsset(**data)
+
+
+def ops_per_second(fn):
+    return NUMBER / min(timeit.repeat(fn, number=NUMBER, repeat=REPEAT))
+
+
+def main():
+    for name, asset in [('image', image_asset()), ('large', large_asset())]:
+        data = asset.entity_to_db()
+        for codec_name, codec in CODECS:
+            encoded = codec.encode(data)
+            encode = ops_per_second(lambda: codec.encode(data))
+            decode = ops_per_second(lambda: codec.decode(encoded))
+            print('%-6s %-12s %8i bytes   encode: %9.0f ops/s   decode: %9.0f ops/s' % (name, codec_name, len(encoded), encode, decode))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import copy
+import re
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.metadata import Metadata, KeyspaceMetadata, TableMetadata, ColumnMetadata
+from furryninja import Settings, Model, KeyProperty, AttributesProperty, IntegerProperty, StringProperty, key_ref
+from furryninja_cassandra.model import CassandraModelMixin
+from furryninja_cassandra.repository import CassandraRepository
+
+__author__ = 'broken'
+
+SELECT_TABLE = re.compile(r'SELECT .+? FROM (\w+)')
+
+
+Settings.set('db', {
+    'name': 'benchmark_keyspace'
+})
+
+
+IMAGE_ASSET = {
+    'name': 'Written speech',
+    'description': 'Lorem ipsum dolor sit amet, consectetur adipisici elit',
+    'title': 'Lorem Ipsum',
+    'version': '42',
+    'skills': [
+        'flying',
+        'superpowers'
+    ],
+    'publicationDate': {
+        'year': 2000
+    },
+    'topics': [
+        'G9dCxjCen-oJMYWaN2vjn18'
+    ],
+    'attributes': {
+        'imageFormat': [
+            'G9dCxjCen-4QD1ydlavEYj4',
+            'G9dCxjCen-P5Ep0LbmbM7yy'
+        ],
+        'imageType': [
+            'G9dCxjCen-N5EXYgamnvPVn'
+        ],
+        'files': [{
+            'url': 'http://goo.gl'
+        }]
+    }
+}
+
+
+class BenchmarkModelMixin(CassandraModelMixin):
+    _storage_type = ('json', 'blob')
+
+    @key_ref
+    def revision(self):
+        if hasattr(self, 'version'):
+            return self.version
+        return '1'
+
+
+class Tag(Model, BenchmarkModelMixin):
+    title = StringProperty()
+
+
+class ImageAsset(Model, BenchmarkModelMixin):
+    default_fields = ['topics', 'attributes.imageFormat', 'attributes.imageType']
+
+    title = StringProperty()
+    version = StringProperty(default='1')
+    description = StringProperty()
+    name = StringProperty()
+    skills = StringProperty(repeated=True)
+
+    topics = KeyProperty(kind=Tag, repeated=True)
+
+    publicationDate = AttributesProperty(attributes={
+        'year': IntegerProperty()
+    })
+
+    attributes = AttributesProperty(attributes={
+        'imageFormat': KeyProperty(kind=Tag, repeated=True),
+        'imageType': KeyProperty(kind=Tag, repeated=True),
+        'files': AttributesProperty(attributes={
+            'url': StringProperty(),
+            'bucket_key': StringProperty(),
+            'mime_type': StringProperty(),
+            'height': IntegerProperty(),
+            'width': IntegerProperty()
+        }, repeated=True)
+    })
+
+
+class VideoAsset(Model, CassandraModelMixin):
+    title = StringProperty()
+    num = IntegerProperty()
+
+
+def image_asset():
+    return ImageAsset(**copy.deepcopy(IMAGE_ASSET))
+
+
+# The tables of test_config/cassandra.schema.cql the benchmarks use: columns, partition key, clustering key.
+TABLES = {
+    'tag': ([('key', 'text'), ('revision', 'text'), ('blob', 'text'), ('create_date', 'timestamp'), ('last_update', 'timestamp')], ['key'], ['revision']),
+    'imageasset': ([('key', 'text'), ('revision', 'text'), ('blob', 'text'), ('update_token', 'text')], ['key'], ['revision']),
+    'videoasset': ([('key', 'text'), ('title', 'text'), ('num', 'int')], ['key'], []),
+    'edge': ([('key', 'text'), ('label', 'text'), ('indoc', 'text'), ('outdoc', 'text'), ('create_date', 'timestamp'), ('last_update', 'timestamp')], ['indoc'], ['outdoc', 'label'])
+}
+
+
+def schema_metadata(keyspace_name):
+    metadata = Metadata()
+    keyspace = metadata.keyspaces[keyspace_name] = KeyspaceMetadata(keyspace_name, True, 'SimpleStrategy', {'replication_factor': '1'})
+    for table_name, (columns, partition_key, clustering_key) in TABLES.items():
+        table = keyspace.tables[table_name] = TableMetadata(keyspace_name, table_name)
+        for name, cql_type in columns:
+            table.columns[name] = ColumnMetadata(table, name, cql_type)
+        table.partition_key = [table.columns[name] for name in partition_key]
+        table.clustering_key = [table.columns[name] for name in clustering_key]
+    return metadata
+
+
+class StubResultSet(object):
+    """
+    The parts of a driver ResultSet the repository reads, a single page.
+    """
+    paging_state = None
+
+    def __init__(self, rows):
+        self.current_rows = rows
+
+    def __iter__(self):
+        return iter(self.current_rows)
+
+    def __len__(self):
+        return len(self.current_rows)
+
+    def __getitem__(self, index):
+        return self.current_rows[index]
+
+
+class StubSession(object):
+    """
+    Answers a SELECT with the rows in ``results`` for its table (column names and
+    raw row tuples), passed through the row factory of the execution profile like
+    the driver does, as a single page. Everything else gets an empty result.
+    """
+    def __init__(self, cluster, keyspace=None):
+        self.cluster = cluster
+        self.keyspace = keyspace
+        self.results = {}
+        self.executed = 0
+
+    def execute(self, query, parameters=None, execution_profile=EXEC_PROFILE_DEFAULT, **kwargs):
+        self.executed += 1
+        return self.result(query, execution_profile=execution_profile)
+
+    def result(self, query, execution_profile=EXEC_PROFILE_DEFAULT):
+        match = SELECT_TABLE.match(getattr(query, 'query_string', None) or '')
+        if match is None or match.group(1) not in self.results:
+            return []
+
+        colnames, rows = self.results[match.group(1)]
+        return StubResultSet(self.cluster.profiles[execution_profile].row_factory(colnames, rows))
+
+
+class StubCluster(object):
+    session_class = StubSession
+
+    def __init__(self, contact_points=None, port=None, protocol_version=None, execution_profiles=None, **kwargs):
+        self.metadata = schema_metadata(Settings.get('db.name'))
+        self.profiles = execution_profiles or {}
+
+    def set_core_connections_per_host(self, host_distance, core_connections):
+        pass
+
+    def connect(self, keyspace=None):
+        return self.session_class(self, keyspace=keyspace)
+
+    def shutdown(self):
+        pass
+
+
+def repository(connection_class=StubCluster, **settings):
+    # The repository reads its settings from db once, put them back so they do not leak into the next benchmark.
+    db_settings = Settings.get('db')
+    Settings.set('db', dict(db_settings, **dict({'shared_connection': False, 'prepare_statements': False}, **settings)))
+    try:
+        return CassandraRepository(connection_class=connection_class)
+    finally:
+        Settings.set('db', db_settings)
@@ -0,0 +1,46 @@
+"""
+Rows per second for fetch hydration with the OrderedDict and the tuple row factory.
+
+    python -m benchmarks.hydration
+"""
+import timeit
+from cassandra.query import ordered_dict_factory
+from furryninja_cassandra.model import json_encoder
+from furryninja_cassandra.rows import indexed_tuple_factory
+from .fixtures import repository, image_asset, VideoAsset
+
+__author__ = 'broken'
+
+ROWS = 1000
+REPEAT = 5
+
+
+def json_rows():
+    assets = [image_asset() for _ in xrange(ROWS)]
+    return ['key', 'revision', 'blob', 'update_token'], [(asset.key.urlsafe(), '1', json_encoder.encode(asset.entity_to_db()), '1') for asset in assets]
+
+
+def simple_rows():
+    videos = [VideoAsset(**{'title': 'Lorem Ipsum', 'num': index}) for index in xrange(ROWS)]
+    return ['key', 'num', 'title'], [(video.key.urlsafe(), video.num, video.title) for video in videos]
+
+
+def rows_per_second(repo, row_factory, colnames, raw_rows):
+    def hydrate():
+        repo._models_from_rows(row_factory(colnames, raw_rows))
+
+    best = min(timeit.repeat(hydrate, number=1, repeat=REPEAT))
+    return ROWS / best
+
+
+def main():
+    repo = repository()
+
+    for name, (colnames, raw_rows) in [('json', json_rows()), ('simple', simple_rows())]:
+        before = rows_per_second(repo, ordered_dict_factory, colnames, raw_rows)
+        after = rows_per_second(repo, indexed_tuple_factory, colnames, raw_rows)
+        print('%-8s ordered_dict: %10.0f rows/s   tuple: %10.0f rows/s   (%.2fx)' % (name, before, after, after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+Load generator: a mix of get/fetch/insert_multi/update/delete from concurrent
+workers through CassandraRepository, against a stand-in session that injects
+log-normal request latency and occasional timeouts.
+
+    python -m benchmarks.load
+    python -m benchmarks.load --concurrency 32 --duration 30 --mix get=60,fetch=10,insert_multi=10,update=15,delete=5
+    python -m benchmarks.load --timeout-rate 0.005 --write-latency 4
+
+Per operation it reports throughput, p50/p99/p999 latency and the round trips
+one operation makes. The ``request`` line is the latency of single requests
+to the stand-in, the gap between its tail and the tail of an operation is
+what the sequential round trips of that operation (the read of update, the
+edge reads and writes of update and delete, the referenced keys of get) add.
+"""
+import argparse
+import math
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+from cassandra import OperationTimedOut
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.query import BatchStatement
+from furryninja_cassandra.model import json_encoder
+from .fixtures import StubSession, StubCluster, repository, image_asset, ImageAsset, Tag
+
+__author__ = 'broken'
+
+MIX = 'get=50,fetch=15,insert_multi=10,update=20,delete=5'
+
+
+def percentile(ordered, value):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(math.ceil(value * len(ordered))) - 1)]
+
+
+class Latency(object):
+    """
+    Log-normal request latency in seconds per kind of request (read, write or
+    batch) around the given medians. ``timeout_rate`` of the requests wait for
+    ``timeout`` and fail with OperationTimedOut.
+    """
+    def __init__(self, read=0.002, write=0.003, batch=0.005, sigma=0.6, timeout_rate=0.001, timeout=1.0, seed=None):
+        self.medians = {'read': read, 'write': write, 'batch': batch}
+        self.sigma = sigma
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def kind(query):
+        if isinstance(query, BatchStatement):
+            return 'batch'
+        return 'read' if (getattr(query, 'query_string', None) or '').startswith('SELECT') else 'write'
+
+    def sample(self, query):
+        with self.lock:
+            if self.random.random() < self.timeout_rate:
+                return self.timeout, True
+            return self.random.lognormvariate(math.log(self.medians[self.kind(query)]), self.sigma), False
+
+
+class LatencyResponseFuture(object):
+    has_more_pages = False
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = self._error = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def _set(self, result=None, error=None):
+        with self._lock:
+            self._result, self._error = result, error
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback, errback in callbacks:
+            self._call(callback, errback)
+
+    def _call(self, callback, errback):
+        if self._error is not None:
+            errback(self._error)
+        else:
+            callback(self._result)
+
+    def add_callbacks(self, callback, errback):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append((callback, errback))
+                return
+        self._call(callback, errback)
+
+    def result(self):
+        self._event.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class LatencySession(StubSession):
+    """
+    StubSession that takes as long as ``latency`` says, counts the requests of
+    the calling thread and records the latency of every request.
+    """
+    latency = Latency()
+
+    def __init__(self, cluster, keyspace=None):
+        super(LatencySession, self).__init__(cluster, keyspace=keyspace)
+        self.local = threading.local()
+        self.samples = []
+
+    @property
+    def requests(self):
+        return getattr(self.local, 'requests', 0)
+
+    def _request(self, query):
+        self.local.requests = self.requests + 1
+        delay, timed_out = self.latency.sample(query)
+        self.samples.append(delay)
+        return delay, timed_out
+
+    def execute(self, query, parameters=None, execution_profile=EXEC_PROFILE_DEFAULT, **kwargs):
+        delay, timed_out = self._request(query)
+        time.sleep(delay)
+        if timed_out:
+            raise OperationTimedOut()
+        return self.result(query, execution_profile=execution_profile)
+
+    def execute_async(self, query, parameters=None, execution_profile=EXEC_PROFILE_DEFAULT, **kwargs):
+        delay, timed_out = self._request(query)
+        future = LatencyResponseFuture()
+        if timed_out:
+            timer = threading.Timer(delay, future._set, kwargs={'error': OperationTimedOut()})
+        else:
+            timer = threading.Timer(delay, future._set, kwargs={'result': self.result(query, execution_profile=execution_profile)})
+        timer.daemon = True
+        timer.start()
+        return future
+
+
+class LatencyCluster(StubCluster):
+    session_class = LatencySession
+
+
+class Workload(object):
+    def __init__(self, repo, rows=20, insert_batch=10):
+        self.repo = repo
+        self.insert_batch = insert_batch
+
+        assets = [image_asset() for _ in xrange(rows)]
+        tags = [Tag(**{'title': 'Lorem Ipsum %i' % index}) for index in xrange(4)]
+        edges = self.repo.find_edges(assets[0])
+
+        # Every asset read references the same tags and has the same edges.
+        session = repo.session
+        session.results['imageasset'] = (['key', 'revision', 'blob', 'update_token'], [(asset.key.urlsafe(), '1', json_encoder.encode(asset.entity_to_db()), '1') for asset in assets])
+        session.results['tag'] = (['key', 'revision', 'blob'], [(tag.key.urlsafe(), '1', json_encoder.encode(tag.entity_to_db())) for tag in tags])
+        session.results['edge'] = (['label', 'outdoc'], [(edge.label, edge.outdoc.urlsafe()) for edge in edges])
+        self.keys = [asset.key for asset in assets]
+
+    # Every operation takes the random generator of its worker, seeded runs choose the same keys.
+    def get(self, rand):
+        self.repo.get(ImageAsset(key=rand.choice(self.keys)))
+
+    def fetch(self, rand):
+        self.repo.fetch(ImageAsset.query())
+
+    def insert_multi(self, rand):
+        self.repo.insert_multi([image_asset() for _ in xrange(self.insert_batch)])
+
+    def update(self, rand):
+        # Read, modify, write: a loaded model only writes the columns that changed.
+        asset = self.repo.get(ImageAsset(key=rand.choice(self.keys)))
+        asset.title = 'Hello, earth!'
+        self.repo.update(asset)
+
+    def delete(self, rand):
+        self.repo.delete(image_asset())
+
+
+def parse_mix(mix):
+    weights = []
+    for part in mix.split(','):
+        name, weight = part.split('=')
+        assert name in ['get', 'fetch', 'insert_multi', 'update', 'delete'], 'Unknown operation "%s"' % name
+        weights.append((name, float(weight)))
+    return weights
+
+
+def choose(weights, rand):
+    value = rand.random() * sum([weight for _, weight in weights])
+    for name, weight in weights:
+        value -= weight
+        if value < 0:
+            return name
+    return weights[-1][0]
+
+
+def run(workload, weights, concurrency, duration, seed=None):
+    """
+    The samples of every operation and how long the run took. Timeouts are what
+    the stand-in injects and count as errors, any other exception counts as one
+    too and is kept in ``failures`` (by type: count and first traceback).
+    """
+    session = workload.repo.session
+    samples = defaultdict(list)
+    failures = {}
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def worker(index):
+        rand = random.Random(None if seed is None else seed + index)
+        while time.time() < deadline:
+            operation = choose(weights, rand)
+            requests = session.requests
+            start = time.time()
+            try:
+                getattr(workload, operation)(rand)
+                error = False
+            except OperationTimedOut:
+                error = True
+            except Exception as e:
+                error = True
+                with lock:
+                    count, formatted = failures.get(type(e).__name__, (0, traceback.format_exc()))
+                    failures[type(e).__name__] = (count + 1, formatted)
+            with lock:
+                samples[operation].append((time.time() - start, session.requests - requests, error))
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in xrange(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.time() - start, failures
+
+
+def report(samples, elapsed, request_samples):
+    print('%-14s %8s %10s %8s %9s %9s %9s %12s' % ('operation', 'count', 'ops/s', 'errors', 'p50 ms', 'p99 ms', 'p999 ms', 'round trips'))
+
+    rows = [(name, [latency for latency, _, _ in values], [requests for _, requests, _ in values], len([error for _, _, error in values if error])) for name, values in sorted(samples.items())]
+    rows.append(('request', list(request_samples), [1] * len(request_samples), None))
+
+    for name, latencies, requests, errors in rows:
+        # A run too short to answer a single request has no samples to report.
+        if not latencies:
+            continue
+        ordered = sorted(latencies)
+        print('%-14s %8i %10.1f %8s %9.2f %9.2f %9.2f %12.2f' % (
+            name, len(ordered), len(ordered) / elapsed, '-' if errors is None else errors,
+            percentile(ordered, 0.5) * 1000, percentile(ordered, 0.99) * 1000, percentile(ordered, 0.999) * 1000,
+            float(sum(requests)) / len(requests)
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='furryninja-cassandra load generator')
+    parser.add_argument('--mix', default=MIX, help='operation weights, e.g. %s' % MIX)
+    parser.add_argument('--concurrency', type=int, default=16, help='worker threads')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to run')
+    parser.add_argument('--read-latency', type=float, default=2, help='median read latency in ms')
+    parser.add_argument('--write-latency', type=float, default=3, help='median write latency in ms')
+    parser.add_argument('--batch-latency', type=float, default=5, help='median batch latency in ms')
+    parser.add_argument('--sigma', type=float, default=0.6, help='spread of the log-normal latency')
+    parser.add_argument('--timeout-rate', type=float, default=0.001, help='share of requests that time out')
+    parser.add_argument('--timeout', type=float, default=1000, help='how long a timed out request takes in ms')
+    parser.add_argument('--seed', type=int, help='seed for reproducible runs')
+    args = parser.parse_args(argv)
+
+    LatencySession.latency = Latency(
+        read=args.read_latency / 1000.0, write=args.write_latency / 1000.0, batch=args.batch_latency / 1000.0,
+        sigma=args.sigma, timeout_rate=args.timeout_rate, timeout=args.timeout / 1000.0, seed=args.seed
+    )
+    repo = repository(connection_class=LatencyCluster, hydration='tuple')
+    workload = Workload(repo)
+    repo.session.samples = []
+
+    samples, elapsed, failures = run(workload, parse_mix(args.mix), args.concurrency, args.duration, seed=args.seed)
+    report(samples, elapsed, repo.session.samples)
+
+    # Anything but an injected timeout is a bug, the numbers above do not count.
+    for name, (count, formatted) in sorted(failures.items()):
+        sys.stderr.write('\n%s raised %i times, the first:\n%s' % (name, count, formatted))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+CPU microbenchmarks for statement building, storage encoding, edges and fetch
+hydration, run offline against the stub session.
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --compare before.json --threshold 0.1
+
+Every benchmark reports operations per second (best of ``--repeat`` runs) and
+``retained_objects``, the objects one operation leaves alive, its result
+included. That is not an allocation count, short lived garbage never shows up in
+it. Allocations are only measured where tracemalloc is available (Python 3), as
+the peak bytes of one operation, ``peak_bytes`` is null without it. The JSON
+written by ``--output`` is what ``--compare`` reads, a benchmark that got slower
+than the baseline by more than the threshold fails the run.
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import timeit
+from furryninja_cassandra.model import json_encoder
+from furryninja_cassandra.query import CassandraQuery
+from .fixtures import repository, image_asset, ImageAsset, Tag, VideoAsset
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+__author__ = 'broken'
+
+FETCH_ROWS = 100
+
+
+def peak_bytes(fn):
+    if tracemalloc is None:
+        return None
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def retained_objects(fn):
+    # The objects the garbage collector tracks after fn and not before, which works on Python 2.7 too.
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        result = fn()
+        after = len(gc.get_objects())
+    finally:
+        gc.enable()
+    del result
+    return after - before
+
+
+def measure(fn, number, repeat):
+    fn()
+    return {
+        'ops_per_second': number / min(timeit.repeat(fn, number=number, repeat=repeat)),
+        'retained_objects': retained_objects(fn),
+        'peak_bytes': peak_bytes(fn)
+    }
+
+
+def query_benchmarks():
+    asset = image_asset()
+    data = asset._storage_type_to_db()
+    query = ImageAsset.query(ImageAsset.title == 'Lorem Ipsum', ImageAsset.version == '42').limit(10)
+
+    def update():
+        cql_qry = CassandraQuery(ImageAsset.query(ImageAsset.key == asset.key.urlsafe())).update(data)
+        return cql_qry.statement, cql_qry.prepared_statement
+
+    return [
+        ('query.select', lambda: CassandraQuery(query).select().statement),
+        ('query.insert', lambda: CassandraQuery(ImageAsset.query()).insert(data).prepared_statement),
+        ('query.update', update)
+    ]
+
+
+def model_benchmarks():
+    repo = repository(hydration='ordered_dict')
+    asset = image_asset()
+    row = dict(asset._storage_type_to_db(), key=asset.key.urlsafe())
+    edges = repo.find_edges(asset)
+
+    return [
+        ('model.denormalize', lambda: repo.denormalize(asset)),
+        ('model.storage_type_to_db', lambda: asset._storage_type_to_db()),
+        ('model.db_to_storage_type', lambda: ImageAsset._db_to_storage_type(row)),
+        ('edges.find', lambda: repo.find_edges(asset)),
+        ('edges.set_for_model', lambda: repo.set_edges_for_model(asset, new_edges=edges, existing_edges=[]))
+    ]
+
+
+def fetch_rows(model_cls):
+    if model_cls is VideoAsset:
+        videos = [VideoAsset(**{'title': 'Lorem Ipsum', 'num': index}) for index in xrange(FETCH_ROWS)]
+        return ['key', 'num', 'title'], [(video.key.urlsafe(), video.num, video.title) for video in videos]
+
+    tags = [Tag(**{'title': 'Lorem Ipsum %i' % index}) for index in xrange(FETCH_ROWS)]
+    return ['key', 'revision', 'blob'], [(tag.key.urlsafe(), '1', json_encoder.encode(tag.entity_to_db())) for tag in tags]
+
+
+def fetch_benchmarks():
+    benchmarks = []
+    for hydration in ['ordered_dict', 'tuple']:
+        for name, model_cls in [('json', Tag), ('simple', VideoAsset)]:
+            repo = repository(hydration=hydration)
+            repo.session.results[model_cls.table().lower()] = fetch_rows(model_cls)
+            benchmarks.append(('fetch.%s.%s' % (name, hydration), lambda repo=repo, model_cls=model_cls: repo.fetch(model_cls.query())))
+    return benchmarks
+
+
+def benchmarks():
+    return query_benchmarks() + model_benchmarks() + fetch_benchmarks()
+
+
+def run(number, repeat, only=None):
+    results = {}
+    for name, fn in benchmarks():
+        if only and not name.startswith(only):
+            continue
+        # One fetch hydrates FETCH_ROWS models, it runs that many times less.
+        results[name] = measure(fn, max(1, number / FETCH_ROWS) if name.startswith('fetch.') else number, repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name in sorted(results.keys()):
+        if name not in baseline:
+            continue
+        change = results[name]['ops_per_second'] / baseline[name]['ops_per_second'] - 1
+        print('%-28s %+7.1f%%%s' % (name, change * 100, '   REGRESSION' if change < -threshold else ''))
+        if change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='furryninja-cassandra CPU microbenchmarks')
+    parser.add_argument('--number', type=int, default=2000, help='operations per run')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per benchmark, the best one counts')
+    parser.add_argument('--only', help='only run benchmarks whose name starts with this')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown that counts as a regression')
+    args = parser.parse_args(argv)
+
+    results = run(args.number, args.repeat, only=args.only)
+    for name in sorted(results.keys()):
+        peak = results[name]['peak_bytes']
+        print('%-28s %12.0f ops/s %8i retained objects   %s' % (name, results[name]['ops_per_second'], results[name]['retained_objects'], '%i peak bytes' % peak if peak is not None else 'no tracemalloc, allocations not measured'))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'created': time.time(),
+                'python': platform.python_version(),
+                'results': results
+            }, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(results, json.load(baseline)['results'], args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
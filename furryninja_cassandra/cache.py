@@ -0,0 +1,100 @@
+from collections import OrderedDict
+from threading import Lock
+import copy
+import time
+
+__author__ = 'broken'
+
+MISSING = object()
+
+
+class EntityCache(object):
+    """
+    Bounded LRU of decoded model data keyed by table and primary key.
+
+    Entries expire after ``ttl`` seconds. Keys that were not found can be
+    remembered for ``negative_ttl`` seconds, ``get`` returns ``MISSING`` for
+    those so the caller can raise without going to the database. Cached data
+    is copied on the way in and out, models are free to mutate what they get.
+
+    Every invalidation bumps ``generation``. Readers take the generation before
+    going to the database and pass it to ``set``, data read before a write
+    that invalidated the cache in the meantime is then dropped instead of cached.
+    """
+    def __init__(self, max_size=1000, ttl=60, negative_ttl=5, clock=time.time):
+        assert max_size > 0, 'max_size must be a positive integer, got %r' % max_size
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, data = entry
+            if expires <= self.clock():
+                self.misses += 1
+                return None
+
+            self.__entries[key] = entry
+            self.hits += 1
+
+        if data is MISSING:
+            return MISSING
+        return copy.deepcopy(data)
+
+    def set(self, key, data, ttl=None, generation=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self.__set(key, copy.deepcopy(data), ttl, generation)
+
+    def set_missing(self, key, generation=None):
+        if self.negative_ttl > 0:
+            self.__set(key, MISSING, self.negative_ttl, generation)
+
+    def __set(self, key, data, ttl, generation):
+        with self.__lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.__entries.pop(key, None)
+            self.__entries[key] = (self.clock() + ttl, data)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.__lock:
+            self.generation += 1
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.generation += 1
+            self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    @property
+    def stats(self):
+        return {
+            'size': len(self.__entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,63 @@
+import unittest
+from .cache import EntityCache, MISSING
+
+__author__ = 'broken'
+
+
+class TestEntityCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = EntityCache(max_size=2, ttl=60, negative_ttl=5, clock=lambda: self.now)
+
+    def test_get_returns_copies(self):
+        self.cache.set(('tag', ('a',)), {'title': 'A Tag', 'topics': ['b']})
+
+        data = self.cache.get(('tag', ('a',)))
+        data['topics'].append('c')
+
+        self.assertDictEqual(self.cache.get(('tag', ('a',))), {'title': 'A Tag', 'topics': ['b']})
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_entries_expire(self):
+        self.cache.set(('tag', ('a',)), {'title': 'A Tag'})
+        self.cache.set(('tag', ('b',)), {'title': 'B Tag'}, ttl=120)
+
+        self.now += 61
+        self.assertIsNone(self.cache.get(('tag', ('a',))))
+        self.assertDictEqual(self.cache.get(('tag', ('b',))), {'title': 'B Tag'})
+
+        self.cache.set(('tag', ('c',)), {'title': 'C Tag'}, ttl=0)
+        self.assertNotIn(('tag', ('c',)), self.cache)
+
+    def test_negative_entries(self):
+        self.cache.set_missing(('tag', ('a',)))
+        self.assertIs(self.cache.get(('tag', ('a',))), MISSING)
+
+        self.now += 6
+        self.assertIsNone(self.cache.get(('tag', ('a',))))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set(('tag', ('a',)), {})
+        self.cache.set(('tag', ('b',)), {})
+        self.cache.get(('tag', ('a',)))
+        self.cache.set(('tag', ('c',)), {})
+
+        self.assertIn(('tag', ('a',)), self.cache)
+        self.assertNotIn(('tag', ('b',)), self.cache)
+        self.assertDictEqual(self.cache.stats, {
+            'size': 2,
+            'max_size': 2,
+            'hits': 1,
+            'misses': 0,
+            'evictions': 1
+        })
+
+    def test_stale_reads_are_not_cached(self):
+        generation = self.cache.generation
+        self.cache.invalidate(('tag', ('a',)))
+
+        self.cache.set(('tag', ('a',)), {'title': 'Old'}, generation=generation)
+        self.assertNotIn(('tag', ('a',)), self.cache)
+
+        self.cache.set(('tag', ('a',)), {'title': 'New'}, generation=self.cache.generation)
+        self.assertIn(('tag', ('a',)), self.cache)
@@ -0,0 +1,115 @@
+import datetime
+import uuid
+import zlib
+import pytz
+import simplejson as json
+from simplejson import JSONEncoder
+from furryninja import Model, Key
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+__author__ = 'broken'
+
+
+class ModelJsonEncoder(JSONEncoder):
+    def default(self, o):
+        if isinstance(o, Key):
+            return o.urlsafe()
+        elif isinstance(o, Model):
+            return o.entity_values(unset=True)
+        elif isinstance(o, uuid.UUID):
+            return str(o)
+        elif isinstance(o, datetime.datetime):
+            return o.replace(tzinfo=pytz.UTC).strftime('%Y-%m-%dT%H:%M:%S.%f%z')
+        else:
+            return super(ModelJsonEncoder, self).default(o)
+
+json_encoder = ModelJsonEncoder()
+
+
+class JsonCodec(object):
+    def encode(self, data):
+        return json_encoder.encode(data)
+
+    def decode(self, value):
+        return json.loads(value)
+
+
+class BinaryCodec(object):
+    """
+    msgpack encoded blobs, optionally zlib compressed.
+
+    Encoded values start with the three bytes of MAGIC, a NUL byte (which can
+    never start a JSON document) and "fn", followed by a flags byte. That is
+    what lets decode_blob tell binary and JSON rows apart. The column has to be
+    of the CQL type blob.
+    """
+    MAGIC = '\x00fn'
+    COMPRESSED = 0x01
+
+    def __init__(self, compress=False, compress_level=6, compress_min_size=512):
+        self.compress = compress
+        self.compress_level = compress_level
+        self.compress_min_size = compress_min_size
+
+    def encode(self, data):
+        assert msgpack, 'The binary codec requires msgpack, pip install furryninja_cassandra[binary]'
+
+        flags = 0
+        payload = msgpack.packb(data, default=json_encoder.default, use_bin_type=False)
+        if self.compress and len(payload) >= self.compress_min_size:
+            payload = zlib.compress(payload, self.compress_level)
+            flags |= self.COMPRESSED
+        return self.MAGIC + chr(flags) + payload
+
+    @classmethod
+    def matches(cls, value):
+        return value[:len(cls.MAGIC)] == cls.MAGIC
+
+    def decode(self, value):
+        assert msgpack, 'The binary codec requires msgpack, pip install furryninja_cassandra[binary]'
+        assert self.matches(value), 'Value is not encoded with the binary codec'
+
+        header_size = len(self.MAGIC) + 1
+        flags = ord(value[header_size - 1])
+        payload = value[header_size:]
+        if flags & self.COMPRESSED:
+            payload = zlib.decompress(payload)
+        return msgpack.unpackb(payload, raw=False)
+
+
+_codecs = {
+    'json': JsonCodec(),
+    'binary': BinaryCodec(),
+    'binary+zlib': BinaryCodec(compress=True)
+}
+
+
+def register_codec(name, codec):
+    assert callable(getattr(codec, 'encode', None)) and callable(getattr(codec, 'decode', None)), 'codec must have encode and decode methods'
+    _codecs[name] = codec
+
+
+def get_codec(name):
+    assert name in _codecs, 'Unknown codec "%s"' % name
+    return _codecs[name]
+
+
+def decode_blob(value, codec=None):
+    """
+    Decode a blob written with ``codec``. The built-in codecs are told apart by
+    MAGIC, so a model can move between them and still read its old rows. A
+    custom codec decodes the values its ``matches`` accepts, or every value
+    when it has no ``matches``, the rest are read as the built-in codecs.
+    """
+    if codec is not None and not isinstance(codec, (JsonCodec, BinaryCodec)):
+        matches = getattr(codec, 'matches', None)
+        if not callable(matches) or matches(value):
+            return codec.decode(value)
+
+    if BinaryCodec.matches(value):
+        return _codecs['binary'].decode(value)
+    return _codecs['json'].decode(value)
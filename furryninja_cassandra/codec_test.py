@@ -0,0 +1,69 @@
+import unittest
+from .codec import JsonCodec, BinaryCodec, decode_blob, get_codec, register_codec
+
+__author__ = 'broken'
+
+ASSET = {
+    'key': 'G9dCxjCen-oJMYWaN2vjn18',
+    'title': 'Lorem Ipsum',
+    'skills': ['flying', 'superpowers'],
+    'publicationDate': {'year': 2000}
+}
+
+
+class TestCodec(unittest.TestCase):
+    def test_binary_round_trip(self):
+        codec = BinaryCodec()
+        encoded = codec.encode(ASSET)
+
+        self.assertTrue(BinaryCodec.matches(encoded))
+        self.assertDictEqual(codec.decode(encoded), ASSET)
+        self.assertLess(len(encoded), len(JsonCodec().encode(ASSET)))
+
+    def test_binary_compressed_round_trip(self):
+        codec = BinaryCodec(compress=True, compress_min_size=0)
+        data = dict(ASSET, description='Lorem ipsum dolor sit amet ' * 50)
+        encoded = codec.encode(data)
+
+        self.assertLess(len(encoded), len(BinaryCodec().encode(data)))
+        self.assertDictEqual(BinaryCodec().decode(encoded), data)
+
+    def test_decode_detects_format(self):
+        self.assertDictEqual(decode_blob(JsonCodec().encode(ASSET)), ASSET)
+        self.assertDictEqual(decode_blob(BinaryCodec().encode(ASSET)), ASSET)
+        self.assertDictEqual(decode_blob(BinaryCodec(compress=True, compress_min_size=0).encode(ASSET)), ASSET)
+
+    def test_decode_with_custom_codec(self):
+        class ReversedJsonCodec(object):
+            def encode(self, data):
+                return JsonCodec().encode(data)[::-1]
+
+            def decode(self, value):
+                return JsonCodec().decode(value[::-1])
+
+        class PrefixedCodec(ReversedJsonCodec):
+            def encode(self, data):
+                return '#' + super(PrefixedCodec, self).encode(data)
+
+            def decode(self, value):
+                return super(PrefixedCodec, self).decode(value[1:])
+
+            @staticmethod
+            def matches(value):
+                return value.startswith('#')
+
+        codec = ReversedJsonCodec()
+        self.assertDictEqual(decode_blob(codec.encode(ASSET), codec), ASSET)
+
+        codec = PrefixedCodec()
+        self.assertDictEqual(decode_blob(codec.encode(ASSET), codec), ASSET)
+        self.assertDictEqual(decode_blob(JsonCodec().encode(ASSET), codec), ASSET)
+        self.assertDictEqual(decode_blob(BinaryCodec().encode(ASSET), JsonCodec()), ASSET)
+
+    def test_registry(self):
+        codec = BinaryCodec(compress=True, compress_level=9)
+        register_codec('binary+zlib9', codec)
+
+        self.assertIs(get_codec('binary+zlib9'), codec)
+        with self.assertRaises(AssertionError):
+            get_codec('yaml')
@@ -0,0 +1,148 @@
+from threading import Lock
+import os
+from cassandra.policies import HostDistance, DCAwareRoundRobinPolicy, TokenAwarePolicy
+from .profiles import execution_profiles, profile_settings
+from .statement import PreparedStatementCache
+
+__author__ = 'broken'
+
+# Settings besides hosts, port and keyspace that shape a cluster or its session.
+CONNECTION_SETTINGS = ['protocol_version', 'hydration', 'local_dc', 'used_hosts_per_remote_dc', 'token_aware', 'core_connections_per_host', 'max_connections_per_host', 'max_requests_per_connection']
+
+_pid = os.getpid()
+
+
+def _forked():
+    global _pid
+    _pid = os.getpid()
+
+
+# os.getpid is a system call on every session access. Where the interpreter tells
+# about forks the pid is looked up once in a new child, elsewhere on every call.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forked)
+
+    def current_pid():
+        return _pid
+else:
+    current_pid = os.getpid
+
+
+def load_balancing_policy(settings):
+    policy = DCAwareRoundRobinPolicy(local_dc=settings.get('local_dc') or '', used_hosts_per_remote_dc=int(settings.get('used_hosts_per_remote_dc') or 0))
+    if settings.get('token_aware', True):
+        policy = TokenAwarePolicy(policy)
+    return policy
+
+
+def connect(connection_class, settings, profiles, row_factory):
+    # Policies hold per cluster state, every profile of every cluster gets its own.
+    cluster = connection_class(
+        contact_points=settings['host'],
+        port=settings['port'],
+        protocol_version=settings['protocol_version'],
+        execution_profiles=execution_profiles(profiles, row_factory, load_balancing_policy=lambda: load_balancing_policy(settings))
+    )
+
+    # From protocol v3 on requests are multiplexed over one connection per host,
+    # the driver only takes pool settings for protocol v1 and v2.
+    if settings['protocol_version'] < 3:
+        if settings.get('max_connections_per_host'):
+            cluster.set_max_connections_per_host(HostDistance.LOCAL, int(settings['max_connections_per_host']))
+        cluster.set_core_connections_per_host(HostDistance.LOCAL, int(settings['core_connections_per_host']))
+        if settings.get('max_requests_per_connection'):
+            cluster.set_max_requests_per_connection(HostDistance.LOCAL, int(settings['max_requests_per_connection']))
+
+    return cluster, cluster.connect(keyspace=settings['name'])
+
+
+class Connection(object):
+    """
+    A cluster, its session and its prepared statements, connected on first use.
+
+    Connecting is deferred so that pre-fork servers connect in the workers. A
+    process that finds a connection made before it was forked connects again,
+    the sockets and driver threads of the parent are of no use to it.
+    """
+    def __init__(self, connect, statement_cache_size=500):
+        self._connect = connect
+        self.statement_cache_size = statement_cache_size
+        self.cluster = None
+        self._session = None
+        self._statement_cache = None
+        self._pid = None
+        self._lock = Lock()
+
+    @property
+    def is_connected(self):
+        # _pid is only set while there is a session.
+        return self._pid is not None and self._pid == current_pid()
+
+    def _ensure_connected(self):
+        if not self.is_connected:
+            with self._lock:
+                if not self.is_connected:
+                    self.cluster, self._session = self._connect()
+                    self._statement_cache = PreparedStatementCache(self._session, max_size=self.statement_cache_size)
+                    self._pid = current_pid()
+
+    @property
+    def session(self):
+        if not self.is_connected:
+            self._ensure_connected()
+        return self._session
+
+    @property
+    def statement_cache(self):
+        self._ensure_connected()
+        return self._statement_cache
+
+    def shutdown(self):
+        with self._lock:
+            # A forked child does not own the cluster of its parent.
+            if self.is_connected:
+                self.cluster.shutdown()
+            self.cluster = self._session = self._statement_cache = self._pid = None
+
+
+class ConnectionRegistry(object):
+    """
+    The connections of a process, one per (hosts, port, keyspace), connection
+    class and the settings that shape the cluster and its session
+    (CONNECTION_SETTINGS and the execution profiles). Repositories configured
+    alike share a connection.
+    """
+    def __init__(self):
+        self._connections = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def key(settings, connection_class=None):
+        hosts = settings['host']
+        if isinstance(hosts, basestring):
+            hosts = [hosts]
+        config = tuple([settings.get(name) for name in CONNECTION_SETTINGS])
+        profiles = frozenset([(name, frozenset(options.items())) for name, options in profile_settings(settings).items()])
+        return tuple(sorted(hosts)), settings['port'], settings['name'], connection_class, config, profiles
+
+    def get(self, key, connect, statement_cache_size=500):
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection is None:
+                connection = self._connections[key] = Connection(connect, statement_cache_size=statement_cache_size)
+            return connection
+
+    def shutdown(self):
+        with self._lock:
+            connections, self._connections = self._connections.values(), {}
+        for connection in connections:
+            connection.shutdown()
+
+    def __len__(self):
+        return len(self._connections)
+
+    def __contains__(self, key):
+        return key in self._connections
+
+
+connections = ConnectionRegistry()
@@ -0,0 +1,101 @@
+import unittest
+import mock
+from cassandra.policies import TokenAwarePolicy, DCAwareRoundRobinPolicy
+from cassandra.query import ordered_dict_factory
+from .connection import Connection, ConnectionRegistry, connect, load_balancing_policy
+from .profiles import profile_settings
+
+__author__ = 'broken'
+
+SETTINGS = {
+    'name': 'test_keyspace',
+    'host': ['localhost'],
+    'port': 9042,
+    'protocol_version': 2,
+    'core_connections_per_host': 4,
+    'max_connections_per_host': 8,
+    'local_dc': 'eu-west'
+}
+
+
+class TestConnection(unittest.TestCase):
+    def setUp(self):
+        self.connect = mock.Mock(side_effect=lambda: (mock.Mock(), mock.Mock()))
+
+    def test_connect_on_first_use(self):
+        connection = Connection(self.connect)
+        self.assertFalse(self.connect.called)
+
+        session = connection.session
+        self.assertIs(connection.session, session)
+        self.assertIs(connection.statement_cache.session, session)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_reconnect_after_fork(self):
+        connection = Connection(self.connect)
+
+        with mock.patch('furryninja_cassandra.connection.current_pid', return_value=100):
+            session = connection.session
+            cluster = connection.cluster
+
+        with mock.patch('furryninja_cassandra.connection.current_pid', return_value=200):
+            self.assertFalse(connection.is_connected)
+            self.assertIsNot(connection.session, session)
+            self.assertEqual(self.connect.call_count, 2)
+
+            connection.shutdown()
+            self.assertIsNone(connection.cluster)
+            self.assertFalse(cluster.shutdown.called)
+
+
+class TestConnectionRegistry(unittest.TestCase):
+    def test_share_connection_per_key(self):
+        registry = ConnectionRegistry()
+        connect = mock.Mock(side_effect=lambda: (mock.Mock(), mock.Mock()))
+
+        key = ConnectionRegistry.key(SETTINGS)
+        self.assertEqual(key[:3], (('localhost',), 9042, 'test_keyspace'))
+        self.assertEqual(ConnectionRegistry.key(dict(SETTINGS, host='localhost')), key)
+        self.assertEqual(ConnectionRegistry.key(dict(SETTINGS, consistency_level='ONE')), ConnectionRegistry.key(dict(SETTINGS, consistency_level='ONE')))
+
+        connection = registry.get(key, connect)
+        self.assertIs(registry.get(key, connect), connection)
+        self.assertIsNot(registry.get(ConnectionRegistry.key(dict(SETTINGS, name='other_keyspace')), connect), connection)
+        self.assertEqual(len(registry), 2)
+
+        for settings in [dict(SETTINGS, hydration='tuple'), dict(SETTINGS, protocol_version=4), dict(SETTINGS, read_consistency_level='QUORUM')]:
+            self.assertIsNot(registry.get(ConnectionRegistry.key(settings), connect), connection)
+        self.assertIsNot(registry.get(ConnectionRegistry.key(SETTINGS, mock.Mock), connect), connection)
+        self.assertEqual(len(registry), 6)
+
+        connection.session
+        registry.shutdown()
+        self.assertEqual(len(registry), 0)
+        self.assertFalse(connection.is_connected)
+
+
+class TestConnect(unittest.TestCase):
+    def test_pool_settings(self):
+        connection_class = mock.Mock()
+        cluster, session = connect(connection_class, SETTINGS, profile_settings(SETTINGS), ordered_dict_factory)
+
+        cluster.set_max_connections_per_host.assert_called_once_with(mock.ANY, 8)
+        cluster.set_core_connections_per_host.assert_called_once_with(mock.ANY, 4)
+        self.assertFalse(cluster.set_max_requests_per_connection.called)
+        cluster.connect.assert_called_once_with(keyspace='test_keyspace')
+
+        profiles = connection_class.call_args[1]['execution_profiles']
+        self.assertIsInstance(profiles['read'].load_balancing_policy, TokenAwarePolicy)
+        self.assertIsNot(profiles['read'].load_balancing_policy, profiles['write'].load_balancing_policy)
+
+    def test_no_pool_settings_from_protocol_v3(self):
+        cluster, session = connect(mock.Mock(), dict(SETTINGS, protocol_version=4), profile_settings(SETTINGS), ordered_dict_factory)
+
+        self.assertFalse(cluster.set_core_connections_per_host.called)
+        self.assertFalse(cluster.set_max_connections_per_host.called)
+
+    def test_load_balancing_policy(self):
+        policy = load_balancing_policy(dict(SETTINGS, token_aware=False))
+
+        self.assertIsInstance(policy, DCAwareRoundRobinPolicy)
+        self.assertEqual(policy.local_dc, 'eu-west')
@@ -10,4 +10,8 @@ class ModelValidationException(Exception):
 
 
 class LightweightTransactionException(Exception):
+    pass
+
+
+class InvalidCursorException(Exception):
     pass
\ No newline at end of file
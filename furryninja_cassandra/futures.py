@@ -0,0 +1,41 @@
+from cassandra.cluster import ResultSet
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+__author__ = 'broken'
+
+
+def to_tornado_future(response_future, io_loop=None, first_page=False):
+    """
+    Bridge a driver ResponseFuture to a tornado Future.
+
+    Driver callbacks fire on the driver's event thread, so results are handed
+    back to the IOLoop with add_callback. Paged results are collected before
+    the future resolves. With ``first_page`` the future resolves with a
+    ResultSet of the first page only, its ``paging_state`` continues from there.
+    """
+    io_loop = io_loop or IOLoop.current()
+    future = Future()
+    pages = []
+
+    def on_result(page):
+        if first_page:
+            io_loop.add_callback(future.set_result, ResultSet(response_future, page))
+            return
+
+        # Extend the first page in place so row factory results keep their type.
+        if not pages:
+            pages.append(page if page is not None else [])
+        elif page:
+            pages[0].extend(page)
+
+        if response_future.has_more_pages:
+            response_future.start_fetching_next_page()
+        else:
+            io_loop.add_callback(future.set_result, pages[0])
+
+    def on_error(exc):
+        io_loop.add_callback(future.set_exception, exc)
+
+    response_future.add_callbacks(on_result, on_error)
+    return future
@@ -0,0 +1,50 @@
+from tornado.testing import AsyncTestCase, gen_test
+from .futures import to_tornado_future
+
+__author__ = 'broken'
+
+
+class FakeResponseFuture(object):
+    def __init__(self, pages=None, error=None):
+        self.pages = list(pages or [])
+        self.error = error
+        self.has_more_pages = False
+        self._callback = None
+        self._col_names = self._col_types = None
+        self._paging_state = None
+
+    def add_callbacks(self, callback, errback):
+        self._callback = callback
+        if self.error:
+            errback(self.error)
+        else:
+            self.start_fetching_next_page()
+
+    def start_fetching_next_page(self):
+        page = self.pages.pop(0) if self.pages else []
+        self.has_more_pages = bool(self.pages)
+        self._paging_state = 'page-%i' % len(self.pages) if self.pages else None
+        self._callback(page)
+
+
+class TestToTornadoFuture(AsyncTestCase):
+    @gen_test
+    def test_result(self):
+        rows = yield to_tornado_future(FakeResponseFuture(pages=[[{'key': 'a'}]]), io_loop=self.io_loop)
+        self.assertEqual(rows, [{'key': 'a'}])
+
+    @gen_test
+    def test_result_with_pages(self):
+        rows = yield to_tornado_future(FakeResponseFuture(pages=[[{'key': 'a'}], [{'key': 'b'}]]), io_loop=self.io_loop)
+        self.assertEqual(rows, [{'key': 'a'}, {'key': 'b'}])
+
+    @gen_test
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            yield to_tornado_future(FakeResponseFuture(error=ValueError('boom')), io_loop=self.io_loop)
+
+    @gen_test
+    def test_first_page(self):
+        result = yield to_tornado_future(FakeResponseFuture(pages=[[{'key': 'a'}], [{'key': 'b'}]]), io_loop=self.io_loop, first_page=True)
+        self.assertEqual(result.current_rows, [{'key': 'a'}])
+        self.assertEqual(result.paging_state, 'page-1')
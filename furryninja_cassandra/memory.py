@@ -0,0 +1,1249 @@
+from collections import namedtuple
+from functools import partial
+from hashlib import md5
+from threading import RLock
+import datetime
+import itertools
+import json
+import re
+import uuid
+from cassandra import InvalidRequest, cqltypes
+from cassandra.cluster import ExecutionProfile, EXEC_PROFILE_DEFAULT, QueryExhausted, ResultSet
+from cassandra.encoder import Encoder
+from cassandra.metadata import Metadata, KeyspaceMetadata, TableMetadata, ColumnMetadata
+from cassandra.protocol import SyntaxException
+from cassandra.query import BatchStatement, BoundStatement, PreparedStatement, SimpleStatement, FETCH_SIZE_UNSET, UNSET_VALUE, bind_params
+
+__author__ = 'broken'
+
+DEFAULT_FETCH_SIZE = 5000
+
+_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+|--[^\n]*|//[^\n]*)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<blob>0[xX][0-9a-fA-F]*)
+  | (?P<uuid>[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})
+  | (?P<number>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+  | (?P<marker>:\w+|\?)
+  | (?P<name>[A-Za-z_]\w*|"(?:[^"]|"")+")
+  | (?P<symbol><=|>=|!=|[=<>(),*\[\]{};:.])
+""", re.X)
+
+Token = namedtuple('Token', ['kind', 'value'])
+
+Literal = namedtuple('Literal', ['value'])
+Marker = namedtuple('Marker', ['index', 'name'])
+Relation = namedtuple('Relation', ['column', 'op', 'value'])
+
+Select = namedtuple('Select', ['table', 'columns', 'where', 'order_by', 'limit', 'allow_filtering'])
+Insert = namedtuple('Insert', ['table', 'columns', 'values', 'if_not_exists'])
+Update = namedtuple('Update', ['table', 'assignments', 'where', 'conditions', 'if_exists'])
+Delete = namedtuple('Delete', ['table', 'columns', 'where', 'conditions', 'if_exists'])
+CreateKeyspace = namedtuple('CreateKeyspace', ['name', 'if_not_exists'])
+CreateTable = namedtuple('CreateTable', ['table', 'columns', 'partition_key', 'clustering_key', 'descending', 'if_not_exists'])
+Use = namedtuple('Use', ['keyspace'])
+Truncate = namedtuple('Truncate', ['table'])
+
+BindMarkerSpec = namedtuple('BindMarkerSpec', ['keyspace_name', 'table_name', 'name', 'type'])
+
+
+def syntax_error(message):
+    return SyntaxException(0x2000, message, None)
+
+
+def tokenize(cql):
+    tokens = []
+    position = 0
+    while position < len(cql):
+        match = _TOKEN_RE.match(cql, position)
+        if match is None:
+            raise syntax_error('line 1:%i no viable alternative at character %r' % (position, cql[position]))
+        position = match.end()
+        if match.lastgroup != 'space':
+            tokens.append(Token(match.lastgroup, match.group()))
+    return tokens
+
+
+class Parser(object):
+    """
+    Recursive descent parser for the statements the backend understands. Bind
+    markers are numbered in order of appearance, ``markers`` keeps the column
+    and the context (value, IN list or LIMIT) of each to type them on prepare.
+    """
+    def __init__(self, cql):
+        self.cql = cql
+        self.tokens = tokenize(cql)
+        self.position = 0
+        self.markers = []
+
+    def peek(self, offset=0):
+        if self.position + offset < len(self.tokens):
+            return self.tokens[self.position + offset]
+        return None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise syntax_error('line 1:%i mismatched input at end of statement %r' % (len(self.cql), self.cql))
+        self.position += 1
+        return token
+
+    def is_keyword(self, *words):
+        for offset, word in enumerate(words):
+            token = self.peek(offset)
+            if token is None or token.kind != 'name' or token.value.lower() != word:
+                return False
+        return True
+
+    def accept_keyword(self, *words):
+        if self.is_keyword(*words):
+            self.position += len(words)
+            return True
+        return False
+
+    def expect_keyword(self, *words):
+        if not self.accept_keyword(*words):
+            raise syntax_error('line 1: expected %s in %r' % (' '.join(words).upper(), self.cql))
+
+    def accept_symbol(self, symbol):
+        token = self.peek()
+        if token is not None and token.kind == 'symbol' and token.value == symbol:
+            self.position += 1
+            return True
+        return False
+
+    def expect_symbol(self, symbol):
+        if not self.accept_symbol(symbol):
+            raise syntax_error('line 1: expected %r in %r' % (symbol, self.cql))
+
+    def identifier(self):
+        token = self.next()
+        if token.kind != 'name':
+            raise syntax_error('line 1: expected an identifier, got %r in %r' % (token.value, self.cql))
+        if token.value.startswith('"'):
+            return token.value[1:-1].replace('""', '"')
+        return token.value.lower()
+
+    def table_name(self):
+        name = self.identifier()
+        if self.accept_symbol('.'):
+            return name, self.identifier()
+        return None, name
+
+    def marker(self, token, column, context):
+        index = len(self.markers)
+        name = token.value[1:] if token.value != '?' else ('in(%s)' % column if context == 'in' else column)
+        self.markers.append((column, context, name))
+        return Marker(index, name)
+
+    def literal(self):
+        token = self.next()
+        if token.kind == 'string':
+            return token.value[1:-1].replace("''", "'")
+        if token.kind == 'number':
+            if '.' in token.value or 'e' in token.value.lower():
+                return float(token.value)
+            return int(token.value)
+        if token.kind == 'blob':
+            return bytearray.fromhex(token.value[2:])
+        if token.kind == 'uuid':
+            return uuid.UUID(token.value)
+        if token.kind == 'name' and token.value.lower() in ('true', 'false'):
+            return token.value.lower() == 'true'
+        if token.kind == 'name' and token.value.lower() == 'null':
+            return None
+        if token.kind == 'symbol' and token.value == '[':
+            return self.collection(']', list)
+        if token.kind == 'symbol' and token.value == '{':
+            return self.mapping_or_set()
+        raise syntax_error('line 1: unexpected %r in %r' % (token.value, self.cql))
+
+    def collection(self, end, collection_type):
+        items = []
+        if not self.accept_symbol(end):
+            items.append(self.literal())
+            while self.accept_symbol(','):
+                items.append(self.literal())
+            self.expect_symbol(end)
+        return collection_type(items)
+
+    def mapping_or_set(self):
+        if self.accept_symbol('}'):
+            return {}
+        first = self.literal()
+        if not self.accept_symbol(':'):
+            items = [first]
+            while self.accept_symbol(','):
+                items.append(self.literal())
+            self.expect_symbol('}')
+            return set(items)
+
+        mapping = {first: self.literal()}
+        while self.accept_symbol(','):
+            key = self.literal()
+            self.expect_symbol(':')
+            mapping[key] = self.literal()
+        self.expect_symbol('}')
+        return mapping
+
+    def value(self, column, context='value'):
+        token = self.peek()
+        if token is not None and token.kind == 'marker':
+            return self.marker(self.next(), column, context)
+        return Literal(self.literal())
+
+    def relation(self):
+        column = self.identifier()
+        if self.accept_keyword('in'):
+            token = self.peek()
+            if token is not None and token.kind == 'marker':
+                return Relation(column, 'IN', self.marker(self.next(), column, 'in'))
+            self.expect_symbol('(')
+            values = []
+            if not self.accept_symbol(')'):
+                values.append(self.value(column))
+                while self.accept_symbol(','):
+                    values.append(self.value(column))
+                self.expect_symbol(')')
+            return Relation(column, 'IN', values)
+
+        token = self.next()
+        if token.kind != 'symbol' or token.value not in ('=', '<', '>', '<=', '>='):
+            raise syntax_error('line 1: unsupported operator %r in %r' % (token.value, self.cql))
+        return Relation(column, token.value, self.value(column))
+
+    def where(self):
+        relations = []
+        if self.accept_keyword('where'):
+            relations.append(self.relation())
+            while self.accept_keyword('and'):
+                relations.append(self.relation())
+        return relations
+
+    def conditions(self):
+        # Returns the IF col = value conditions and whether IF EXISTS was given.
+        if not self.accept_keyword('if'):
+            return [], False
+        if self.accept_keyword('exists'):
+            return [], True
+
+        conditions = [self.relation()]
+        while self.accept_keyword('and'):
+            conditions.append(self.relation())
+        for condition in conditions:
+            if condition.op != '=':
+                raise InvalidRequest('Only = conditions are supported, got %s' % condition.op)
+        return conditions, False
+
+    def limit(self):
+        token = self.peek()
+        if token is not None and token.kind == 'marker':
+            return self.marker(self.next(), '[limit]', 'limit')
+        value = self.literal()
+        if not isinstance(value, int) or value <= 0:
+            raise InvalidRequest('LIMIT must be strictly positive')
+        return Literal(value)
+
+    def parse(self):
+        if self.is_keyword('select'):
+            statement = self.select()
+        elif self.is_keyword('insert'):
+            statement = self.insert()
+        elif self.is_keyword('update'):
+            statement = self.update()
+        elif self.is_keyword('delete'):
+            statement = self.delete()
+        elif self.is_keyword('create', 'keyspace'):
+            statement = self.create_keyspace()
+        elif self.is_keyword('create', 'table') or self.is_keyword('create', 'columnfamily'):
+            statement = self.create_table()
+        elif self.is_keyword('use'):
+            self.next()
+            statement = Use(self.identifier())
+        elif self.is_keyword('truncate'):
+            self.next()
+            self.accept_keyword('table')
+            statement = Truncate(self.table_name())
+        else:
+            raise syntax_error('line 1: unsupported statement %r' % self.cql)
+
+        self.accept_symbol(';')
+        if self.peek() is not None:
+            raise syntax_error('line 1: unexpected %r after the end of %r' % (self.peek().value, self.cql))
+        return statement
+
+    def select(self):
+        self.expect_keyword('select')
+        columns = None
+        if not self.accept_symbol('*'):
+            columns = [self.identifier()]
+            while self.accept_symbol(','):
+                columns.append(self.identifier())
+        self.expect_keyword('from')
+        table = self.table_name()
+        where = self.where()
+
+        order_by = None
+        if self.accept_keyword('order', 'by'):
+            column = self.identifier()
+            descending = self.accept_keyword('desc')
+            if not descending:
+                self.accept_keyword('asc')
+            order_by = (column, descending)
+
+        limit = self.limit() if self.accept_keyword('limit') else None
+        if self.is_keyword('offset'):
+            raise syntax_error("line 1: missing EOF at 'OFFSET' in %r" % self.cql)
+        allow_filtering = self.accept_keyword('allow', 'filtering')
+        return Select(table, columns, where, order_by, limit, allow_filtering)
+
+    def insert(self):
+        self.expect_keyword('insert', 'into')
+        table = self.table_name()
+        self.expect_symbol('(')
+        columns = [self.identifier()]
+        while self.accept_symbol(','):
+            columns.append(self.identifier())
+        self.expect_symbol(')')
+
+        self.expect_keyword('values')
+        self.expect_symbol('(')
+        values = [self.value(columns[0])]
+        for column in columns[1:]:
+            self.expect_symbol(',')
+            values.append(self.value(column))
+        self.expect_symbol(')')
+        return Insert(table, columns, values, self.accept_keyword('if', 'not', 'exists'))
+
+    def update(self):
+        self.expect_keyword('update')
+        table = self.table_name()
+        self.expect_keyword('set')
+
+        assignments = []
+        while True:
+            column = self.identifier()
+            self.expect_symbol('=')
+            assignments.append((column, self.value(column)))
+            if not self.accept_symbol(','):
+                break
+
+        where = self.where()
+        conditions, if_exists = self.conditions()
+        return Update(table, assignments, where, conditions, if_exists)
+
+    def delete(self):
+        self.expect_keyword('delete')
+        columns = []
+        if not self.is_keyword('from'):
+            columns.append(self.identifier())
+            while self.accept_symbol(','):
+                columns.append(self.identifier())
+        self.expect_keyword('from')
+        table = self.table_name()
+        where = self.where()
+        conditions, if_exists = self.conditions()
+        return Delete(table, columns, where, conditions, if_exists)
+
+    def skip_to_end(self):
+        while self.peek() is not None and not (self.peek().kind == 'symbol' and self.peek().value == ';'):
+            self.next()
+
+    def create_keyspace(self):
+        self.expect_keyword('create', 'keyspace')
+        if_not_exists = self.accept_keyword('if', 'not', 'exists')
+        name = self.identifier()
+        # Replication does not matter in memory.
+        self.skip_to_end()
+        return CreateKeyspace(name, if_not_exists)
+
+    def cql_type(self):
+        name = self.identifier()
+        if name == 'frozen':
+            self.expect_symbol('<')
+            inner = self.cql_type()
+            self.expect_symbol('>')
+            return inner
+
+        if self.accept_symbol('<'):
+            parameters = [self.cql_type()]
+            while self.accept_symbol(','):
+                parameters.append(self.cql_type())
+            self.expect_symbol('>')
+            return '%s<%s>' % (name, ', '.join(parameters))
+        return 'text' if name == 'varchar' else name
+
+    def key_columns(self):
+        if self.accept_symbol('('):
+            columns = [self.identifier()]
+            while self.accept_symbol(','):
+                columns.append(self.identifier())
+            self.expect_symbol(')')
+            return columns
+        return [self.identifier()]
+
+    def create_table(self):
+        self.next()
+        self.next()
+        if_not_exists = self.accept_keyword('if', 'not', 'exists')
+        table = self.table_name()
+        self.expect_symbol('(')
+
+        columns = []
+        partition_key = clustering_key = None
+        while True:
+            if self.accept_keyword('primary', 'key'):
+                self.expect_symbol('(')
+                partition_key = self.key_columns()
+                clustering_key = []
+                while self.accept_symbol(','):
+                    clustering_key.append(self.identifier())
+                self.expect_symbol(')')
+            else:
+                column = self.identifier()
+                columns.append((column, self.cql_type()))
+                if self.accept_keyword('primary', 'key'):
+                    partition_key, clustering_key = [column], []
+            if not self.accept_symbol(','):
+                break
+        self.expect_symbol(')')
+
+        if partition_key is None:
+            raise InvalidRequest('No PRIMARY KEY specifed for table %s' % table[1])
+
+        descending = set()
+        if self.accept_keyword('with'):
+            while self.peek() is not None and not (self.peek().kind == 'symbol' and self.peek().value == ';'):
+                if self.accept_keyword('clustering', 'order', 'by'):
+                    self.expect_symbol('(')
+                    while True:
+                        column = self.identifier()
+                        if self.accept_keyword('desc'):
+                            descending.add(column)
+                        else:
+                            self.accept_keyword('asc')
+                        if not self.accept_symbol(','):
+                            break
+                    self.expect_symbol(')')
+                else:
+                    self.next()
+        return CreateTable(table, columns, partition_key, clustering_key, descending, if_not_exists)
+
+
+def split_statements(cql):
+    statements = []
+    current = []
+    for token_match in _TOKEN_RE.finditer(cql):
+        if token_match.lastgroup == 'symbol' and token_match.group() == ';':
+            statements.append(''.join(current).strip())
+            current = []
+        elif token_match.lastgroup != 'space' or not token_match.group().startswith(('--', '//')):
+            current.append(token_match.group())
+    statements.append(''.join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+def cql_type_class(cql_type):
+    """
+    The driver type class of a CQL type string like ``text`` or ``map<text, int>``.
+    """
+    parser = Parser(cql_type)
+    type_string = parser.cql_type()
+
+    def resolve(type_string):
+        name, _, parameters = type_string.partition('<')
+        type_class = cqltypes._cqltypes.get(name)
+        if type_class is None:
+            raise InvalidRequest('Unknown type %s' % type_string)
+        if not parameters:
+            return type_class
+
+        depth, current, subtypes = 0, '', []
+        for char in parameters[:-1]:
+            if char == ',' and depth == 0:
+                subtypes.append(current.strip())
+                current = ''
+                continue
+            depth += {'<': 1, '>': -1}.get(char, 0)
+            current += char
+        subtypes.append(current.strip())
+        return type_class.apply_parameters([resolve(subtype) for subtype in subtypes])
+
+    return resolve(type_string)
+
+
+_TEXT_TYPES = ('text', 'varchar', 'ascii')
+_INTEGER_TYPES = ('int', 'bigint', 'varint', 'smallint', 'tinyint', 'counter')
+_EPOCH = datetime.datetime(1970, 1, 1)
+_TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d']
+
+
+def coerce(value, type_class, column):
+    """
+    Turn a literal parsed from CQL into the value the driver would return for
+    a column of ``type_class``. Values of bound markers are already of the right type.
+    """
+    if value is None or value is UNSET_VALUE:
+        return value
+
+    name = type_class.typename
+    try:
+        if name in _TEXT_TYPES:
+            if not isinstance(value, basestring):
+                raise TypeError
+            return value.decode('utf-8') if isinstance(value, str) else value
+        if name in _INTEGER_TYPES:
+            if isinstance(value, bool) or not isinstance(value, (int, long)):
+                raise TypeError
+            return value
+        if name in ('float', 'double', 'decimal'):
+            if isinstance(value, bool) or not isinstance(value, (int, long, float)):
+                raise TypeError
+            return float(value)
+        if name == 'boolean':
+            if not isinstance(value, bool):
+                raise TypeError
+            return value
+        if name == 'timestamp':
+            if isinstance(value, datetime.datetime):
+                return value
+            if isinstance(value, (int, long)) and not isinstance(value, bool):
+                return _EPOCH + datetime.timedelta(milliseconds=value)
+            if isinstance(value, basestring):
+                for timestamp_format in _TIMESTAMP_FORMATS:
+                    try:
+                        return datetime.datetime.strptime(value[:26].rstrip('Z'), timestamp_format)
+                    except ValueError:
+                        pass
+            raise TypeError
+        if name in ('uuid', 'timeuuid'):
+            return value if isinstance(value, uuid.UUID) else uuid.UUID(value)
+        if name == 'blob':
+            return str(value)
+        if name in ('list', 'set'):
+            items = [coerce(item, type_class.subtypes[0], column) for item in value]
+            return items if name == 'list' else sorted(set(items))
+        if name == 'map':
+            key_type, value_type = type_class.subtypes
+            return dict([(coerce(key, key_type, column), coerce(item, value_type, column)) for key, item in value.items()])
+    except (TypeError, ValueError, AttributeError):
+        raise InvalidRequest('Invalid %s constant (%r) for "%s" of type %s' % (type(value).__name__, value, column, type_class.cql_parameterized_type()))
+    return value
+
+
+class MemoryRow(object):
+    __slots__ = ('marker', 'values')
+
+    def __init__(self):
+        # Rows written by INSERT stay alive without regular columns, like in Cassandra.
+        self.marker = False
+        self.values = {}
+
+    @property
+    def is_live(self):
+        return self.marker or bool(self.values)
+
+
+class MemoryTable(object):
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.partition_key = [column.name for column in metadata.partition_key]
+        self.clustering_key = [column.name for column in metadata.clustering_key]
+        self.primary_key = self.partition_key + self.clustering_key
+        self.types = dict([(name, cql_type_class(column.cql_type)) for name, column in metadata.columns.items()])
+        regular = sorted([name for name in metadata.columns.keys() if name not in self.primary_key])
+        self.columns = self.primary_key + regular
+        self.reversed = bool(metadata.clustering_key) and metadata.clustering_key[0].is_reversed
+        self.partitions = {}
+
+    def column_type(self, column):
+        type_class = self.types.get(column)
+        if type_class is None:
+            raise InvalidRequest('Undefined column name %s' % column)
+        return type_class
+
+    def rows(self, partition_keys=None, descending=False):
+        """
+        ``(partition key, clustering key, row)`` of the live rows in ``partition_keys``
+        (all partitions if None), in partition key and then clustering key order.
+        """
+        keys = sorted(self.partitions.keys()) if partition_keys is None else sorted(set(partition_keys))
+        for partition_key in keys:
+            partition = self.partitions.get(partition_key)
+            if not partition:
+                continue
+            for clustering_key in sorted(partition.keys(), reverse=descending):
+                row = partition[clustering_key]
+                if row.is_live:
+                    yield partition_key, clustering_key, row
+
+    def get(self, partition_key, clustering_key):
+        row = self.partitions.get(partition_key, {}).get(clustering_key)
+        return row if row is not None and row.is_live else None
+
+    def values(self, partition_key, clustering_key, row):
+        values = dict(zip(self.partition_key, partition_key) + zip(self.clustering_key, clustering_key))
+        values.update(row.values)
+        return values
+
+    def write(self, partition_key, clustering_key, values, marker=False):
+        partition = self.partitions.setdefault(partition_key, {})
+        row = partition.get(clustering_key)
+        if row is None:
+            row = partition[clustering_key] = MemoryRow()
+        row.marker = row.marker or marker
+
+        for column, value in values.items():
+            if value is UNSET_VALUE:
+                continue
+            if value is None or (isinstance(value, (list, dict)) and not value):
+                row.values.pop(column, None)
+            else:
+                row.values[column] = value
+
+        if not row.is_live:
+            self.delete(partition_key, clustering_key)
+
+    def delete(self, partition_key, clustering_key=None, columns=None):
+        partition = self.partitions.get(partition_key)
+        if partition is None:
+            return
+
+        clustering_keys = [key for key in partition.keys() if key[:len(clustering_key)] == clustering_key] if clustering_key else partition.keys()
+        for key in clustering_keys:
+            if columns:
+                for column in columns:
+                    partition[key].values.pop(column, None)
+                if partition[key].is_live:
+                    continue
+            del partition[key]
+
+        if not partition:
+            del self.partitions[partition_key]
+
+
+class MemoryStore(object):
+    """
+    Schema and data of the in-memory cluster, shared by every session of the
+    clusters that use it. Every statement runs under one lock, batches apply
+    all their mutations or none.
+    """
+    def __init__(self):
+        self.metadata = Metadata()
+        self.tables = {}
+        self.prepared = {}
+        self.lock = RLock()
+
+    def load_schema(self, cql, keyspace=None):
+        """
+        Run the schema statements in ``cql``. ``keyspace`` loads the tables into
+        that keyspace instead of the one the statements create or use.
+        """
+        current = keyspace
+        for statement in split_statements(cql):
+            parsed = Parser(statement).parse()
+            if isinstance(parsed, CreateKeyspace):
+                self.create_keyspace(keyspace or parsed.name, if_not_exists=True)
+            elif isinstance(parsed, Use):
+                current = keyspace or parsed.keyspace
+            elif isinstance(parsed, CreateTable):
+                self.create_table(parsed, keyspace or parsed.table[0] or current)
+            else:
+                raise InvalidRequest('Only CREATE KEYSPACE, CREATE TABLE and USE can be loaded as schema, got %r' % statement)
+
+    def create_keyspace(self, name, if_not_exists=False):
+        with self.lock:
+            if name in self.metadata.keyspaces:
+                if not if_not_exists:
+                    raise InvalidRequest('Keyspace %s already exists' % name)
+                return
+            self.metadata.keyspaces[name] = KeyspaceMetadata(name, True, 'SimpleStrategy', {'replication_factor': '1'})
+
+    def create_table(self, statement, keyspace):
+        with self.lock:
+            keyspace_metadata = self.keyspace(keyspace)
+            name = statement.table[1]
+            if name in keyspace_metadata.tables:
+                if not statement.if_not_exists:
+                    raise InvalidRequest('Table %s.%s already exists' % (keyspace, name))
+                return
+
+            metadata = TableMetadata(keyspace, name)
+            for column, cql_type in statement.columns:
+                metadata.columns[column] = ColumnMetadata(metadata, column, cql_type, is_reversed=column in statement.descending)
+            for column in statement.partition_key + statement.clustering_key:
+                if column not in metadata.columns:
+                    raise InvalidRequest('Unknown definition %s referenced in PRIMARY KEY' % column)
+            metadata.partition_key = [metadata.columns[column] for column in statement.partition_key]
+            metadata.clustering_key = [metadata.columns[column] for column in statement.clustering_key]
+
+            keyspace_metadata.tables[name] = metadata
+            self.tables[(keyspace, name)] = MemoryTable(metadata)
+
+    def keyspace(self, name):
+        if name not in self.metadata.keyspaces:
+            raise InvalidRequest('Keyspace \'%s\' does not exist' % name)
+        return self.metadata.keyspaces[name]
+
+    def table(self, table_name, keyspace):
+        keyspace = table_name[0] or keyspace
+        if not keyspace:
+            raise InvalidRequest('No keyspace has been specified. USE a keyspace, or explicitly specify keyspace.tablename')
+        self.keyspace(keyspace)
+
+        table = self.tables.get((keyspace, table_name[1]))
+        if table is None:
+            raise InvalidRequest('unconfigured table %s' % table_name[1])
+        return table
+
+    def truncate(self):
+        with self.lock:
+            for table in self.tables.values():
+                table.partitions.clear()
+
+
+class Execution(object):
+    """
+    One statement with its bound values against the tables of ``store``.
+    ``check`` evaluates the conditions, ``apply`` writes, both are called under the store lock.
+    """
+    def __init__(self, store, keyspace, statement, values):
+        self.store = store
+        self.statement = statement
+        self.values = values
+        self.table = store.table(statement.table, keyspace)
+
+    def resolve(self, value, column, context='value'):
+        if isinstance(value, Marker):
+            value = self.values[value.index]
+            if value is UNSET_VALUE and context != 'value':
+                raise InvalidRequest('Invalid unset value for column %s' % column)
+            return value
+        if context == 'limit':
+            return value.value
+        return coerce(value.value, self.table.column_type(column), column)
+
+    def relation_values(self, relation):
+        if relation.op != 'IN':
+            return [self.resolve(relation.value, relation.column, context='where')]
+        if isinstance(relation.value, Marker):
+            return list(self.resolve(relation.value, relation.column, context='where') or [])
+        return [self.resolve(value, relation.column, context='where') for value in relation.value]
+
+    def key_values(self, columns, relations, required=True):
+        """
+        The possible values of the key made of ``columns``, from the = and IN
+        relations on them. None if a column is missing and not ``required``.
+        """
+        by_column = dict([(relation.column, relation) for relation in relations if relation.op in ('=', 'IN')])
+        choices = []
+        for column in columns:
+            if column not in by_column:
+                if required:
+                    raise InvalidRequest('Some key parts are missing: %s' % column)
+                return None
+            choices.append(self.relation_values(by_column[column]))
+        return [tuple(values) for values in itertools.product(*choices)]
+
+    def clustering_prefixes(self, relations, required=True):
+        by_column = dict([(relation.column, relation) for relation in relations if relation.op in ('=', 'IN')])
+        choices = []
+        for column in self.table.clustering_key:
+            if column not in by_column:
+                if required:
+                    raise InvalidRequest('Some clustering keys are missing: %s' % column)
+                break
+            choices.append(self.relation_values(by_column[column]))
+        return [tuple(values) for values in itertools.product(*choices)]
+
+    def matches(self, values, relations):
+        for relation in relations:
+            value = values.get(relation.column)
+            if relation.op == 'IN':
+                if value not in self.relation_values(relation):
+                    return False
+                continue
+
+            expected = self.resolve(relation.value, relation.column, context='where')
+            if relation.op == '=' and value != expected:
+                return False
+            if relation.op != '=' and (value is None or not {'<': value < expected, '>': value > expected, '<=': value <= expected, '>=': value >= expected}[relation.op]):
+                return False
+        return True
+
+    def check_columns(self, columns):
+        for column in columns:
+            self.table.column_type(column)
+
+    def applied_row(self, applied, existing=None):
+        columns = ['[applied]']
+        row = [applied]
+        if existing is not None:
+            columns += self.table.columns
+            row += [existing.get(column) for column in self.table.columns]
+        return columns, [(None, tuple(row))]
+
+    @property
+    def conditional(self):
+        return bool(getattr(self.statement, 'conditions', None) or getattr(self.statement, 'if_exists', False) or getattr(self.statement, 'if_not_exists', False))
+
+
+class SelectExecution(Execution):
+    def check_filtering(self, relations, partition_restricted):
+        # There are no secondary indexes, only the primary key can be restricted without ALLOW FILTERING.
+        restricted = set([relation.column for relation in relations])
+        if restricted - set(self.table.primary_key) or (restricted and not partition_restricted):
+            raise InvalidRequest('Cannot execute this query as it might involve data filtering and thus may have unpredictable performance. '
+                                 'If you want to execute this query despite the performance unpredictability, use ALLOW FILTERING')
+
+    def result(self):
+        statement = self.statement
+        table = self.table
+        columns = statement.columns or table.columns
+        self.check_columns(columns)
+        for relation in statement.where:
+            table.column_type(relation.column)
+
+        descending = table.reversed
+        if statement.order_by:
+            column, descending = statement.order_by
+            if not table.clustering_key or column != table.clustering_key[0]:
+                raise InvalidRequest('Order by is currently only supported on the clustered columns of the PRIMARY KEY, got %s' % column)
+
+        partition_keys = self.key_values(table.partition_key, statement.where, required=False)
+        if not statement.allow_filtering:
+            self.check_filtering(statement.where, partition_keys is not None)
+        limit = self.resolve(statement.limit, '[limit]', context='limit') if statement.limit else None
+
+        entries = []
+        for partition_key, clustering_key, row in table.rows(partition_keys, descending=descending):
+            values = table.values(partition_key, clustering_key, row)
+            if self.matches(values, statement.where):
+                entries.append(((partition_key, clustering_key), tuple([values.get(column) for column in columns])))
+                if limit is not None and len(entries) >= limit:
+                    break
+        return columns, entries, descending
+
+
+class WriteExecution(Execution):
+    def existing(self, partition_key, clustering_key):
+        row = self.table.get(partition_key, clustering_key)
+        return self.table.values(partition_key, clustering_key, row) if row is not None else None
+
+    def check(self):
+        """
+        (applied, existing values) of the condition of a conditional write.
+        """
+        statement = self.statement
+        keys = self.primary_keys()
+        if len(keys) != 1:
+            raise InvalidRequest('IN on the clustering key columns is not supported with conditional updates')
+
+        existing = self.existing(*keys[0])
+        if getattr(statement, 'if_not_exists', False):
+            return existing is None, existing
+        if existing is None:
+            return False, None
+        for condition in getattr(statement, 'conditions', []):
+            if existing.get(condition.column) != self.resolve(condition.value, condition.column, context='where'):
+                return False, existing
+        return True, existing
+
+    def result(self):
+        if not self.conditional:
+            self.apply()
+            return None, [], False
+
+        applied, existing = self.check()
+        if applied:
+            self.apply()
+        return self.applied_row(applied, None if applied else existing) + (False,)
+
+
+class InsertExecution(WriteExecution):
+    def __init__(self, *args, **kwargs):
+        super(InsertExecution, self).__init__(*args, **kwargs)
+        self.check_columns(self.statement.columns)
+        self.row = dict([(column, self.resolve(value, column)) for column, value in zip(self.statement.columns, self.statement.values)])
+        for column in self.table.primary_key:
+            if self.row.get(column) in (None, UNSET_VALUE):
+                raise InvalidRequest('Invalid null value in condition for column %s' % column if column in self.row else 'Some partition key parts are missing: %s' % column)
+
+    def primary_keys(self):
+        return [(tuple([self.row[column] for column in self.table.partition_key]), tuple([self.row[column] for column in self.table.clustering_key]))]
+
+    def apply(self):
+        partition_key, clustering_key = self.primary_keys()[0]
+        values = dict([(column, value) for column, value in self.row.items() if column not in self.table.primary_key])
+        self.table.write(partition_key, clustering_key, values, marker=True)
+
+
+class UpdateExecution(WriteExecution):
+    def __init__(self, *args, **kwargs):
+        super(UpdateExecution, self).__init__(*args, **kwargs)
+        assigned = [column for column, _ in self.statement.assignments]
+        self.check_columns(assigned)
+        for column in assigned:
+            if column in self.table.primary_key:
+                raise InvalidRequest('PRIMARY KEY part %s found in SET part' % column)
+        self.assignments = dict([(column, self.resolve(value, column)) for column, value in self.statement.assignments])
+        self.keys = self.primary_keys()
+
+    def primary_keys(self):
+        return list(itertools.product(self.key_values(self.table.partition_key, self.statement.where), self.clustering_prefixes(self.statement.where)))
+
+    def apply(self):
+        for partition_key, clustering_key in self.keys:
+            self.table.write(partition_key, clustering_key, self.assignments)
+
+
+class DeleteExecution(WriteExecution):
+    def __init__(self, *args, **kwargs):
+        super(DeleteExecution, self).__init__(*args, **kwargs)
+        self.check_columns(self.statement.columns)
+        self.partition_keys = self.key_values(self.table.partition_key, self.statement.where)
+        self.prefixes = self.clustering_prefixes(self.statement.where, required=False)
+
+    def primary_keys(self):
+        return list(itertools.product(self.partition_keys, self.prefixes))
+
+    def apply(self):
+        for partition_key in self.partition_keys:
+            for prefix in self.prefixes:
+                self.table.delete(partition_key, prefix, columns=self.statement.columns)
+
+
+EXECUTIONS = {
+    Select: SelectExecution,
+    Insert: InsertExecution,
+    Update: UpdateExecution,
+    Delete: DeleteExecution
+}
+
+
+class MemoryResponseFuture(object):
+    """
+    An already completed ResponseFuture. Pages are cut from the full result
+    on demand, ``paging_state`` is the serialized primary key of the last row
+    of the page so it stays valid across sessions.
+    """
+    def __init__(self, session, row_factory, columns=None, entries=None, fetch_size=None, paging_state=None, descending=False, table=None, error=None):
+        self.session = session
+        self.row_factory = row_factory
+        self.query = None
+        self._col_names = columns
+        self._col_types = None
+        self._entries = entries or []
+        self._fetch_size = fetch_size
+        self._descending = descending
+        self._table = table
+        self._error = error
+        self._callbacks = []
+        self._errbacks = []
+        self._paging_state = None
+        self._final_result = None
+        self._start = self._resume_index(paging_state) if paging_state else 0
+        if error is None:
+            self._set_page()
+
+    @property
+    def has_more_pages(self):
+        return self._paging_state is not None
+
+    def _encode_position(self, position):
+        partition_key, clustering_key = position
+        table = self._table
+        parts = [table.types[column].serialize(value, self.session.protocol_version).encode('hex') for column, value in zip(table.primary_key, partition_key + clustering_key)]
+        return json.dumps(parts)
+
+    def _resume_index(self, paging_state):
+        table = self._table
+        try:
+            parts = json.loads(paging_state)
+            values = [table.types[column].deserialize(part.decode('hex'), self.session.protocol_version) for column, part in zip(table.primary_key, parts)]
+        except (ValueError, TypeError, AttributeError):
+            raise InvalidRequest('Invalid value for the paging state')
+
+        partition_key = tuple(values[:len(table.partition_key)])
+        clustering_key = tuple(values[len(table.partition_key):])
+        for index, ((entry_partition, entry_clustering), _) in enumerate(self._entries):
+            if entry_partition > partition_key:
+                return index
+            if entry_partition == partition_key and (entry_clustering < clustering_key if self._descending else entry_clustering > clustering_key):
+                return index
+        return len(self._entries)
+
+    def _set_page(self):
+        end = len(self._entries)
+        if self._fetch_size and self._table is not None:
+            end = min(end, self._start + self._fetch_size)
+
+        page = self._entries[self._start:end]
+        self._paging_state = self._encode_position(page[-1][0]) if page and end < len(self._entries) else None
+        self._next = end
+        if self._col_names is None:
+            self._final_result = []
+        else:
+            self._final_result = self.row_factory(self._col_names, [row for _, row in page])
+
+    def start_fetching_next_page(self):
+        if not self.has_more_pages:
+            raise QueryExhausted()
+        self._start = self._next
+        self._set_page()
+        for callback in list(self._callbacks):
+            callback(self._final_result)
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return ResultSet(self, self._final_result)
+
+    def add_callback(self, fn, *args, **kwargs):
+        self._callbacks.append(partial(fn, *args, **kwargs))
+        if self._error is None:
+            fn(self._final_result, *args, **kwargs)
+        return self
+
+    def add_errback(self, fn, *args, **kwargs):
+        self._errbacks.append(partial(fn, *args, **kwargs))
+        if self._error is not None:
+            fn(self._error, *args, **kwargs)
+        return self
+
+    def add_callbacks(self, callback, errback, callback_args=(), callback_kwargs=None, errback_args=(), errback_kwargs=None):
+        self.add_callback(callback, *callback_args, **(callback_kwargs or {}))
+        self.add_errback(errback, *errback_args, **(errback_kwargs or {}))
+
+    def get_query_trace(self, max_wait=None):
+        return None
+
+    def get_all_query_traces(self, max_wait_per=None):
+        return []
+
+
+class MemorySession(object):
+    default_fetch_size = DEFAULT_FETCH_SIZE
+
+    def __init__(self, cluster, keyspace=None):
+        self.cluster = cluster
+        self.store = cluster.store
+        self.encoder = Encoder()
+        self.keyspace = None
+        self.is_shutdown = False
+        if keyspace:
+            self.set_keyspace(keyspace)
+
+    @property
+    def protocol_version(self):
+        return self.cluster.protocol_version
+
+    def set_keyspace(self, keyspace):
+        self.store.keyspace(keyspace)
+        self.keyspace = keyspace
+
+    def prepare(self, query):
+        statement = Parser(query)
+        parsed = statement.parse()
+        if type(parsed) not in EXECUTIONS:
+            raise InvalidRequest('Only SELECT, INSERT, UPDATE and DELETE can be prepared, got %r' % query)
+
+        keyspace = parsed.table[0] or self.keyspace
+        table = self.store.table(parsed.table, keyspace)
+        specs = []
+        for column, context, name in statement.markers:
+            if context == 'limit':
+                type_class = cqltypes.Int32Type
+            else:
+                type_class = table.column_type(column)
+                if context == 'in':
+                    type_class = cqltypes.ListType.apply_parameters([type_class])
+            specs.append(BindMarkerSpec(keyspace, table.metadata.name, name, type_class))
+
+        query_id = md5((u'%s:%s' % (keyspace, query)).encode('utf-8')).digest()
+        with self.store.lock:
+            self.store.prepared[query_id] = (parsed, specs, keyspace)
+        return PreparedStatement.from_message(query_id, specs, None, self.store.metadata, query, keyspace, self.protocol_version, None)
+
+    def _prepared(self, query_id, values):
+        if query_id not in self.store.prepared:
+            raise InvalidRequest('Prepared query with ID %s not found' % query_id.encode('hex'))
+
+        parsed, specs, keyspace = self.store.prepared[query_id]
+        values = list(values) + [UNSET_VALUE] * (len(specs) - len(values))
+        decoded = []
+        for value, spec in zip(values, specs):
+            if value is None or value is UNSET_VALUE:
+                decoded.append(value)
+            else:
+                decoded.append(spec.type.deserialize(value, self.protocol_version))
+        return parsed, decoded, keyspace
+
+    def _parse(self, query_string, parameters=None):
+        if parameters:
+            query_string = bind_params(query_string, parameters, self.encoder)
+        parser = Parser(query_string)
+        parsed = parser.parse()
+        if parser.markers:
+            raise InvalidRequest('Bind markers need a prepared statement: %r' % query_string)
+        return parsed
+
+    def _statement(self, query, parameters=None):
+        # The parsed statement, the bound values and the keyspace of ``query``.
+        if isinstance(query, basestring):
+            query = SimpleStatement(query)
+        if isinstance(query, BoundStatement):
+            return self._prepared(query.prepared_statement.query_id, query.values)
+        if isinstance(query, PreparedStatement):
+            bound = query.bind(parameters if parameters is not None else ())
+            return self._prepared(query.query_id, bound.values)
+        return self._parse(query.query_string, parameters), [], self.keyspace
+
+    def _run(self, query, parameters=None):
+        if isinstance(query, BatchStatement):
+            return self._run_batch(query)
+
+        parsed, values, keyspace = self._statement(query, parameters)
+        if isinstance(parsed, Use):
+            self.set_keyspace(parsed.keyspace)
+            return None, [], False, None
+        if isinstance(parsed, (CreateKeyspace, CreateTable)):
+            if isinstance(parsed, CreateKeyspace):
+                self.store.create_keyspace(parsed.name, if_not_exists=parsed.if_not_exists)
+            else:
+                self.store.create_table(parsed, parsed.table[0] or keyspace)
+            return None, [], False, None
+        if isinstance(parsed, Truncate):
+            with self.store.lock:
+                self.store.table(parsed.table, keyspace).partitions.clear()
+            return None, [], False, None
+
+        with self.store.lock:
+            execution = EXECUTIONS[type(parsed)](self.store, keyspace, parsed, values)
+            # Only SELECT results page, their paging state is a key of the table.
+            return execution.result() + (execution.table if isinstance(parsed, Select) else None,)
+
+    def _run_batch(self, batch):
+        executions = []
+        with self.store.lock:
+            for is_prepared, statement, values in batch._statements_and_parameters:
+                if is_prepared:
+                    parsed, values, keyspace = self._prepared(statement, values)
+                else:
+                    parsed, values, keyspace = self._parse(statement), [], self.keyspace
+                if not isinstance(parsed, (Insert, Update, Delete)):
+                    raise InvalidRequest('Only INSERT, UPDATE and DELETE statements are allowed in a batch')
+                executions.append(EXECUTIONS[type(parsed)](self.store, keyspace, parsed, values))
+
+            conditional = [execution for execution in executions if execution.conditional]
+            if not conditional:
+                for execution in executions:
+                    execution.apply()
+                return None, [], False, None
+
+            partitions = set([(execution.table, key[0]) for execution in executions for key in execution.primary_keys()])
+            if len(partitions) > 1:
+                raise InvalidRequest('Batch with conditions cannot span multiple tables or partitions')
+
+            for execution in conditional:
+                applied, existing = execution.check()
+                if not applied:
+                    return execution.applied_row(False, existing) + (False, None)
+            for execution in executions:
+                execution.apply()
+            return executions[0].applied_row(True) + (False, None)
+
+    def _profile(self, execution_profile):
+        if isinstance(execution_profile, ExecutionProfile):
+            return execution_profile
+        if execution_profile not in self.cluster.profiles:
+            raise ValueError('Invalid execution_profile: "%s"; valid profiles are: %s.' % (execution_profile, '", "'.join(map(str, self.cluster.profiles.keys()))))
+        return self.cluster.profiles[execution_profile]
+
+    def execute_async(self, query, parameters=None, trace=False, custom_payload=None, timeout=None, execution_profile=EXEC_PROFILE_DEFAULT, paging_state=None, **kwargs):
+        profile = self._profile(execution_profile)
+        if self.is_shutdown:
+            raise RuntimeError('Session is already shut down')
+
+        fetch_size = getattr(query, 'fetch_size', FETCH_SIZE_UNSET)
+        if fetch_size is FETCH_SIZE_UNSET:
+            fetch_size = self.default_fetch_size
+
+        try:
+            columns, entries, descending, table = self._run(query, parameters)
+            return MemoryResponseFuture(self, profile.row_factory, columns=columns, entries=entries, fetch_size=fetch_size, paging_state=paging_state, descending=descending, table=table)
+        except Exception as exc:
+            return MemoryResponseFuture(self, profile.row_factory, error=exc)
+
+    def execute(self, query, parameters=None, timeout=None, trace=False, custom_payload=None, execution_profile=EXEC_PROFILE_DEFAULT, paging_state=None, **kwargs):
+        return self.execute_async(query, parameters=parameters, execution_profile=execution_profile, paging_state=paging_state).result()
+
+    def shutdown(self):
+        self.is_shutdown = True
+
+
+class MemoryCluster(object):
+    """
+    Takes the arguments CassandraRepository passes to its ``connection_class``.
+    Clusters created with the same ``store`` see the same schema and data.
+    """
+    def __init__(self, contact_points=None, port=9042, protocol_version=2, execution_profiles=None, store=None, **kwargs):
+        self.contact_points = contact_points
+        self.port = port
+        self.protocol_version = protocol_version
+        self.store = store if store is not None else MemoryStore()
+        self.profiles = dict(execution_profiles or {})
+        if EXEC_PROFILE_DEFAULT not in self.profiles:
+            self.profiles[EXEC_PROFILE_DEFAULT] = ExecutionProfile()
+        self.sessions = []
+        self.is_shutdown = False
+
+    @property
+    def metadata(self):
+        return self.store.metadata
+
+    def set_core_connections_per_host(self, host_distance, core_connections):
+        pass
+
+    def set_max_connections_per_host(self, host_distance, max_connections):
+        pass
+
+    def set_max_requests_per_connection(self, host_distance, max_requests):
+        pass
+
+    def connect(self, keyspace=None):
+        session = MemorySession(self, keyspace=keyspace)
+        self.sessions.append(session)
+        return session
+
+    def shutdown(self):
+        for session in self.sessions:
+            session.shutdown()
+        self.is_shutdown = True
+
+
+def memory_cluster(schema=None, keyspace=None, store=None):
+    """
+    A ``connection_class`` for CassandraRepository that keeps everything in memory:
+
+        CassandraRepository(connection_class=memory_cluster('test_config/cassandra.schema.cql'))
+
+    Every cluster it creates shares one store, loaded with ``schema`` (a path
+    to a CQL file or CQL). ``keyspace`` loads the tables into that keyspace
+    instead of the one the schema names.
+
+    It runs the CQL CassandraQuery writes, prepared or not and in batches, with
+    IF NOT EXISTS, IF EXISTS, IF col = value and paging. It is not Cassandra:
+    there are no secondary indexes, so a SELECT that restricts a column outside
+    the primary key, or any column without the whole partition key, needs
+    ALLOW FILTERING as it would on Cassandra. The fake then filters every row.
+    Partitions come back in key order instead of token order and there is no TTL
+    or write timestamp.
+    """
+    store = store if store is not None else MemoryStore()
+    if schema:
+        if not schema.lstrip().lower().startswith(('create', 'use')):
+            with open(schema) as schema_file:
+                schema = schema_file.read()
+        store.load_schema(schema, keyspace=keyspace)
+    return partial(MemoryCluster, store=store)
@@ -0,0 +1,213 @@
+import datetime
+import os
+import unittest
+from cassandra import InvalidRequest
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.protocol import SyntaxException
+from cassandra.query import BatchStatement, SimpleStatement, ValueSequence, UNSET_VALUE, ordered_dict_factory
+from tornado.ioloop import IOLoop
+from .connection import connect
+from .futures import to_tornado_future
+from .memory import MemoryCluster, MemoryStore, memory_cluster, cql_type_class, split_statements
+from .profiles import profile_settings
+
+__author__ = 'broken'
+
+SCHEMA_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_config', 'cassandra.schema.cql')
+
+SETTINGS = {
+    'name': 'test_keyspace',
+    'host': ['localhost'],
+    'port': 9042,
+    'protocol_version': 2,
+    'core_connections_per_host': 4
+}
+
+
+class TestMemorySchema(unittest.TestCase):
+    def test_load_schema_file(self):
+        cluster = memory_cluster(SCHEMA_FILE_PATH)()
+        table = cluster.metadata.keyspaces['test_keyspace'].tables['edge']
+
+        self.assertEqual([column.name for column in table.partition_key], ['indoc'])
+        self.assertEqual([column.name for column in table.clustering_key], ['outdoc', 'label'])
+        self.assertEqual(table.columns['label'].cql_type, 'text')
+
+    def test_keyspace_override(self):
+        cluster = memory_cluster(SCHEMA_FILE_PATH, keyspace='other_keyspace')()
+        self.assertEqual(cluster.metadata.keyspaces.keys(), ['other_keyspace'])
+
+    def test_clusters_share_store(self):
+        connection_class = memory_cluster(SCHEMA_FILE_PATH)
+        connection_class().connect('test_keyspace').execute("INSERT INTO videoasset (key, num) VALUES ('a', 1)")
+        self.assertEqual(len(list(connection_class().connect('test_keyspace').execute('SELECT * FROM videoasset'))), 1)
+
+    def test_split_statements(self):
+        self.assertEqual(split_statements("use a; -- comment;\ncreate table b (k text primary key, v text);"), ['use a', 'create table b (k text primary key, v text)'])
+
+    def test_clustering_order(self):
+        store = MemoryStore()
+        store.load_schema("CREATE KEYSPACE ks WITH replication = {'class': 'SimpleStrategy', 'replication_factor': 1}; "
+                          "CREATE TABLE ks.events (key text, at int, value text, PRIMARY KEY (key, at)) WITH CLUSTERING ORDER BY (at DESC)")
+        session = MemoryCluster(store=store).connect('ks')
+        for at in [2, 1, 3]:
+            session.execute('INSERT INTO events (key, at) VALUES (%s, %s)', ('a', at))
+
+        self.assertEqual([row.at for row in session.execute("SELECT at FROM events WHERE key = 'a'")], [3, 2, 1])
+        self.assertEqual([row.at for row in session.execute("SELECT at FROM events WHERE key = 'a' ORDER BY at ASC")], [1, 2, 3])
+
+    def test_cql_type_class(self):
+        self.assertEqual(cql_type_class('map<text, list<int>>').cql_parameterized_type(), 'map<text, list<int>>')
+        self.assertEqual(cql_type_class('varchar').typename, 'text')
+
+
+class TestMemorySession(unittest.TestCase):
+    def setUp(self):
+        profiles = profile_settings({})
+        self.cluster, self.session = connect(memory_cluster(SCHEMA_FILE_PATH), SETTINGS, profiles, ordered_dict_factory)
+
+    def insert_videos(self, count):
+        for index in xrange(count):
+            self.session.execute('INSERT INTO videoasset (key, title, num) VALUES (%(key)s, %(title)s, %(num)s)', {'key': 'video-%i' % index, 'title': 'Video %i' % index, 'num': index})
+
+    def test_insert_select(self):
+        self.session.execute('INSERT INTO tag (key, revision, blob, create_date) VALUES (%s, %s, %s, %s)', ('a', '1', '{"title": "It\'s"}', datetime.datetime(2017, 1, 2, 3, 4, 5)))
+
+        rows = list(self.session.execute("SELECT * FROM tag WHERE key = 'a'"))
+        self.assertEqual(rows[0].keys(), ['key', 'revision', 'blob', 'create_date', 'last_update'])
+        self.assertEqual(rows[0]['blob'], u'{"title": "It\'s"}')
+        self.assertEqual(rows[0]['create_date'], datetime.datetime(2017, 1, 2, 3, 4, 5))
+        self.assertIsNone(rows[0]['last_update'])
+
+    def test_where_in_and_limit(self):
+        self.insert_videos(5)
+
+        rows = self.session.execute('SELECT key FROM videoasset WHERE key IN %s', (ValueSequence(['video-3', 'video-1', 'missing']),))
+        self.assertEqual([row['key'] for row in rows], ['video-1', 'video-3'])
+        self.assertEqual(len(list(self.session.execute('SELECT * FROM videoasset LIMIT 2'))), 2)
+        self.assertEqual([row['num'] for row in self.session.execute('SELECT num FROM videoasset WHERE num >= 3 ALLOW FILTERING')], [3, 4])
+
+    def test_prepared(self):
+        insert = self.session.prepare('INSERT INTO videoasset (key, title, num) VALUES (:key, :title, :num)')
+        self.session.execute(insert, {'key': 'a', 'title': 'A', 'num': 1})
+        self.session.execute(insert, {'key': 'a', 'title': 'A', 'num': None})
+
+        select = self.session.prepare('SELECT * FROM videoasset WHERE key IN :key LIMIT :limit')
+        self.assertEqual(select.routing_key_indexes, [0])
+        row = self.session.execute(select, {'key': ['a', 'b'], 'limit': 10})[0]
+        self.assertEqual((row['title'], row['num']), (u'A', None))
+
+    def test_unset(self):
+        session = memory_cluster(SCHEMA_FILE_PATH)(protocol_version=4).connect('test_keyspace')
+        update = session.prepare('UPDATE videoasset SET title = :title, num = :num WHERE key = :key')
+        session.execute(update, {'key': 'a', 'title': 'A', 'num': 1})
+        session.execute(update, {'key': 'a', 'title': UNSET_VALUE, 'num': 2})
+
+        row = session.execute("SELECT * FROM videoasset WHERE key = 'a'")[0]
+        self.assertEqual((row.title, row.num), (u'A', 2))
+
+    def test_update_delete(self):
+        self.session.execute("UPDATE edge SET key = 'e' WHERE indoc = 'a' AND outdoc = 'b' AND label = 'tags'")
+        self.session.execute("UPDATE edge SET key = 'e' WHERE indoc = 'a' AND outdoc = 'c' AND label = 'tags'")
+        self.assertEqual(len(list(self.session.execute("SELECT * FROM edge WHERE indoc = 'a'"))), 2)
+
+        self.session.execute("DELETE FROM edge WHERE indoc = 'a' AND outdoc = 'b'")
+        self.assertEqual([row['outdoc'] for row in self.session.execute("SELECT * FROM edge WHERE indoc = 'a'")], ['c'])
+
+        # Rows written by UPDATE only live while they have values.
+        self.session.execute("DELETE key FROM edge WHERE indoc = 'a' AND outdoc = 'c' AND label = 'tags'")
+        self.assertEqual(len(list(self.session.execute("SELECT * FROM edge WHERE indoc = 'a'"))), 0)
+
+    def test_conditional_writes(self):
+        insert = "INSERT INTO videoasset (key, num) VALUES ('a', 1) IF NOT EXISTS"
+        self.assertEqual(self.session.execute(insert)[0]['[applied]'], True)
+
+        row = self.session.execute(insert)[0]
+        self.assertEqual((row['[applied]'], row['num']), (False, 1))
+
+        update = "UPDATE videoasset SET num = 2 WHERE key = 'a' IF num = %s"
+        self.assertEqual(self.session.execute(update, (5,))[0]['[applied]'], False)
+        self.assertEqual(self.session.execute(update, (1,))[0]['[applied]'], True)
+        self.assertEqual(self.session.execute("UPDATE videoasset SET num = 3 WHERE key = 'b' IF EXISTS")[0]['[applied]'], False)
+        self.assertEqual(self.session.execute("SELECT num FROM videoasset WHERE key = 'a'")[0]['num'], 2)
+
+    def test_batch(self):
+        insert = self.session.prepare('INSERT INTO videoasset (key, num) VALUES (:key, :num)')
+        batch = BatchStatement()
+        batch.add(insert, {'key': 'a', 'num': 1})
+        batch.add('INSERT INTO videoasset (key, num) VALUES (%s, %s)', ('b', 2))
+        batch.add("DELETE FROM videoasset WHERE key = 'c'")
+        self.session.execute(batch)
+        self.assertEqual([row['key'] for row in self.session.execute('SELECT key FROM videoasset')], ['a', 'b'])
+
+        # A failing statement leaves the whole batch unapplied.
+        batch = BatchStatement()
+        batch.add(insert, {'key': 'c', 'num': 3})
+        batch.add("INSERT INTO videoasset (key, num) VALUES ('d', 'four')")
+        with self.assertRaises(InvalidRequest):
+            self.session.execute(batch)
+        self.assertEqual(len(list(self.session.execute('SELECT key FROM videoasset'))), 2)
+
+    def test_conditional_batch(self):
+        batch = BatchStatement()
+        batch.add("UPDATE edge SET key = 'e' WHERE indoc = 'a' AND outdoc = 'b' AND label = 'tags' IF key = 'x'")
+        batch.add("INSERT INTO edge (indoc, outdoc, label) VALUES ('a', 'c', 'tags')")
+        self.assertEqual(self.session.execute(batch)[0]['[applied]'], False)
+        self.assertEqual(len(list(self.session.execute("SELECT * FROM edge WHERE indoc = 'a'"))), 0)
+
+        batch.add("INSERT INTO edge (indoc, outdoc, label) VALUES ('b', 'c', 'tags')")
+        with self.assertRaises(InvalidRequest):
+            self.session.execute(batch)
+
+    def test_paging(self):
+        self.insert_videos(5)
+        statement = SimpleStatement('SELECT key FROM videoasset', fetch_size=2)
+
+        result = self.session.execute(statement)
+        self.assertEqual(len(result.current_rows), 2)
+        self.assertIsNotNone(result.paging_state)
+        self.assertEqual(len(list(result)), 5)
+
+        rows = []
+        paging_state = None
+        while True:
+            result = self.session.execute(statement, paging_state=paging_state)
+            rows.extend(result.current_rows)
+            paging_state = result.paging_state
+            if paging_state is None:
+                break
+        self.assertEqual([row['key'] for row in rows], ['video-%i' % index for index in xrange(5)])
+
+        with self.assertRaises(InvalidRequest):
+            self.session.execute(statement, paging_state='garbage')
+
+    def test_execute_async(self):
+        self.insert_videos(3)
+        future = self.session.execute_async(SimpleStatement('SELECT key FROM videoasset', fetch_size=2))
+        rows = IOLoop.current().run_sync(lambda: to_tornado_future(future))
+        self.assertEqual(len(rows), 3)
+
+        future = self.session.execute_async('SELECT * FROM missing')
+        with self.assertRaises(InvalidRequest):
+            future.result()
+
+    def test_errors(self):
+        with self.assertRaises(SyntaxException):
+            self.session.execute('SELECT * FROM videoasset LIMIT 10 OFFSET 10')
+        with self.assertRaises(InvalidRequest):
+            self.session.execute("INSERT INTO videoasset (key, num) VALUES ('a', 'one')")
+        with self.assertRaises(InvalidRequest):
+            self.session.execute("INSERT INTO videoasset (key, missing) VALUES ('a', 'one')")
+        with self.assertRaises(InvalidRequest):
+            self.session.execute("UPDATE edge SET key = 'e' WHERE indoc = 'a'")
+        with self.assertRaises(ValueError):
+            self.session.execute('SELECT * FROM videoasset', execution_profile='missing')
+        with self.assertRaises(InvalidRequest):
+            self.session.execute('SELECT num FROM videoasset WHERE num >= 3')
+        with self.assertRaises(InvalidRequest):
+            self.session.execute("SELECT * FROM edge WHERE outdoc = 'b'")
+        self.assertEqual(len(list(self.session.execute("SELECT * FROM edge WHERE indoc = 'a' AND outdoc = 'b'"))), 0)
+
+    def test_profile_row_factory(self):
+        self.insert_videos(1)
+        self.assertEqual(self.session.execute('SELECT key FROM videoasset', execution_profile=EXEC_PROFILE_DEFAULT)[0]['key'], 'video-0')
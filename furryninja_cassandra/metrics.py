@@ -0,0 +1,185 @@
+from functools import wraps
+from threading import Lock
+import logging
+import random
+import time
+from tornado.concurrent import is_future
+
+__author__ = 'broken'
+
+
+class Histogram(object):
+    """
+    Uniform reservoir of at most ``size`` samples, the percentiles stay accurate
+    for long running processes without keeping every sample.
+    """
+    def __init__(self, size=1028):
+        self.size = size
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.samples = []
+
+    def update(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            index = random.randint(0, self.count - 1)
+            if index < self.size:
+                self.samples[index] = value
+
+    @staticmethod
+    def _percentile(ordered, percentile):
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(round(percentile * (len(ordered) - 1))))]
+
+    def snapshot(self):
+        ordered = sorted(self.samples)
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self._percentile(ordered, 0.5),
+            'p95': self._percentile(ordered, 0.95),
+            'p99': self._percentile(ordered, 0.99)
+        }
+
+
+class NullMetrics(object):
+    enabled = False
+
+    def record(self, operation, table, duration, error=False):
+        pass
+
+    def record_rows(self, table, rows):
+        pass
+
+    def record_batch(self, statements):
+        pass
+
+    def snapshot(self):
+        return {}
+
+    def export(self):
+        pass
+
+
+class Metrics(object):
+    """
+    Counts, errors and latency histograms (in seconds) per operation and table,
+    rows returned per table and statements per batch.
+
+    ``snapshot`` is keyed by ``operation:table``, ``rows:table`` and ``batch``.
+    Exporters are objects with an ``export(snapshot)`` method, ``export`` hands
+    each of them a fresh snapshot.
+    """
+    enabled = True
+
+    def __init__(self, exporters=None, reservoir_size=1028):
+        self.exporters = list(exporters or [])
+        self.reservoir_size = reservoir_size
+        self.__timers = {}
+        self.__errors = {}
+        self.__rows = {}
+        self.__batches = {}
+        self.__lock = Lock()
+
+    def __histogram(self, histograms, key):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self.reservoir_size)
+        return histogram
+
+    def record(self, operation, table, duration, error=False):
+        key = '%s:%s' % (operation, table)
+        with self.__lock:
+            self.__histogram(self.__timers, key).update(duration)
+            if error:
+                self.__errors[key] = self.__errors.get(key, 0) + 1
+
+    def record_rows(self, table, rows):
+        with self.__lock:
+            self.__histogram(self.__rows, 'rows:%s' % table).update(rows)
+
+    def record_batch(self, statements):
+        with self.__lock:
+            self.__histogram(self.__batches, 'batch').update(statements)
+
+    def add_exporter(self, exporter):
+        assert callable(getattr(exporter, 'export', None)), 'exporter must have an export method'
+        self.exporters.append(exporter)
+
+    def snapshot(self):
+        with self.__lock:
+            snapshot = {}
+            for key, histogram in self.__timers.items():
+                snapshot[key] = dict(histogram.snapshot(), errors=self.__errors.get(key, 0))
+            for histograms in [self.__rows, self.__batches]:
+                for key, histogram in histograms.items():
+                    snapshot[key] = histogram.snapshot()
+            return snapshot
+
+    def export(self):
+        snapshot = self.snapshot()
+        for exporter in self.exporters:
+            exporter.export(snapshot)
+
+    def reset(self):
+        with self.__lock:
+            self.__timers.clear()
+            self.__errors.clear()
+            self.__rows.clear()
+            self.__batches.clear()
+
+
+class LoggingExporter(object):
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('cassandra.repo.metrics')
+        self.level = level
+
+    def export(self, snapshot):
+        for key in sorted(snapshot.keys()):
+            self.logger.log(self.level, '%s %s', key, ' '.join(['%s=%s' % item for item in sorted(snapshot[key].items())]))
+
+
+def instrumented(operation, table=None):
+    """
+    Time a repository method as ``operation``. ``table`` is called with the
+    arguments of the method to name the table. Coroutines are timed until their
+    future resolves. Nothing is measured while the repository metrics are disabled.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return fn(self, *args, **kwargs)
+
+            try:
+                table_name = table(self, *args, **kwargs) if table else None
+            except Exception:
+                # Bad arguments are for the method to report, not for the metrics.
+                table_name = None
+
+            start = time.time()
+            try:
+                result = fn(self, *args, **kwargs)
+            except Exception:
+                metrics.record(operation, table_name, time.time() - start, error=True)
+                raise
+
+            if is_future(result):
+                result.add_done_callback(lambda future: metrics.record(operation, table_name, time.time() - start, error=future.exception() is not None))
+            else:
+                metrics.record(operation, table_name, time.time() - start)
+            return result
+        return wrapper
+    return decorator
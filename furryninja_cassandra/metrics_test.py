@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import unittest
+import mock
+from tornado.concurrent import Future
+from .metrics import Histogram, Metrics, NullMetrics, LoggingExporter, instrumented
+
+__author__ = 'broken'
+
+
+class Repository(object):
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    @instrumented('get', table=lambda self, table, *args, **kwargs: table)
+    def get(self, table, fail=False):
+        if fail:
+            raise ValueError(table)
+        return table
+
+    @instrumented('get', table=lambda self, table, *args, **kwargs: table)
+    def get_async(self, table, future):
+        return future
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in xrange(1, 101):
+            histogram.update(value)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 100)
+        self.assertEqual(snapshot['min'], 1)
+        self.assertEqual(snapshot['max'], 100)
+        self.assertEqual(snapshot['mean'], 50.5)
+        self.assertEqual(snapshot['p50'], 51)
+        self.assertEqual(snapshot['p95'], 95)
+        self.assertEqual(snapshot['p99'], 99)
+
+    def test_reservoir_is_bounded(self):
+        histogram = Histogram(size=10)
+        for value in xrange(1000):
+            histogram.update(value)
+
+        self.assertEqual(len(histogram.samples), 10)
+        self.assertEqual(histogram.snapshot()['count'], 1000)
+        self.assertEqual(histogram.snapshot()['max'], 999)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_record(self):
+        metrics = Metrics()
+        metrics.record('get', 'tag', 0.1)
+        metrics.record('get', 'tag', 0.3, error=True)
+        metrics.record_rows('tag', 20)
+        metrics.record_batch(3)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['get:tag']['count'], 2)
+        self.assertEqual(snapshot['get:tag']['errors'], 1)
+        self.assertEqual(snapshot['get:tag']['max'], 0.3)
+        self.assertEqual(snapshot['rows:tag']['mean'], 20)
+        self.assertEqual(snapshot['batch']['count'], 1)
+
+        metrics.reset()
+        self.assertDictEqual(metrics.snapshot(), {})
+
+    def test_export(self):
+        exporter = mock.Mock()
+        metrics = Metrics(exporters=[exporter])
+        metrics.record('fetch', 'tag', 0.2)
+        metrics.export()
+
+        exporter.export.assert_called_once_with(metrics.snapshot())
+        self.assertRaises(AssertionError, metrics.add_exporter, object())
+
+    def test_logging_exporter(self):
+        logger = mock.Mock()
+        metrics = Metrics(exporters=[LoggingExporter(logger=logger)])
+        metrics.record('fetch', 'tag', 0.2)
+        metrics.export()
+
+        self.assertEqual(logger.log.call_count, 1)
+        self.assertEqual(logger.log.call_args[0][2], 'fetch:tag')
+
+    def test_instrumented(self):
+        repository = Repository(Metrics())
+        self.assertEqual(repository.get('tag'), 'tag')
+        self.assertRaises(ValueError, repository.get, 'tag', fail=True)
+
+        snapshot = repository.metrics.snapshot()
+        self.assertEqual(snapshot['get:tag']['count'], 2)
+        self.assertEqual(snapshot['get:tag']['errors'], 1)
+
+    def test_instrumented_future(self):
+        repository = Repository(Metrics())
+        future = Future()
+        self.assertIs(repository.get_async('tag', future), future)
+        self.assertDictEqual(repository.metrics.snapshot(), {})
+
+        future.set_exception(ValueError('tag'))
+        self.assertEqual(repository.metrics.snapshot()['get:tag']['errors'], 1)
+
+    def test_instrumented_disabled(self):
+        metrics = mock.Mock(spec=NullMetrics, enabled=False)
+        repository = Repository(metrics)
+        repository.get('tag')
+
+        self.assertFalse(metrics.record.called)
@@ -1,36 +1,93 @@
+import copy
 import datetime
 import uuid
-import pytz
-import simplejson as json
-from simplejson import JSONEncoder
-from furryninja import key_ref, Model, Key
+from decimal import Decimal
+from .codec import ModelJsonEncoder, json_encoder, get_codec, decode_blob
 
 __author__ = 'broken'
 
+STORAGE_TYPES = ['simple', 'json', 'binary']
 
-class ModelJsonEncoder(JSONEncoder):
-    def default(self, o):
-        if isinstance(o, Key):
-            return o.urlsafe()
-        elif isinstance(o, Model):
-            return o.entity_values(unset=True)
-        elif isinstance(o, uuid.UUID):
-            return str(o)
-        elif isinstance(o, datetime.datetime):
-            return o.replace(tzinfo=pytz.UTC).strftime('%Y-%m-%dT%H:%M:%S.%f%z')
-        else:
-            return super(ModelJsonEncoder, self).default(o)
+# Column values a model cannot change in place, a row snapshot shares them instead of copying.
+IMMUTABLE_TYPES = (basestring, int, long, float, type(None), Decimal, uuid.UUID, datetime.date, datetime.time)
+
+
+def _snapshot_row(row):
+    values = row if isinstance(row, tuple) else row.values()
+    if all([isinstance(value, IMMUTABLE_TYPES) for value in values]):
+        return row
 
-json_encoder = ModelJsonEncoder()
+    if isinstance(row, tuple):
+        return tuple([value if isinstance(value, IMMUTABLE_TYPES) else copy.deepcopy(value) for value in row])
+    return row.__class__([(name, value if isinstance(value, IMMUTABLE_TYPES) else copy.deepcopy(value)) for name, value in row.items()])
 
 
 class CassandraModelMixin(object):
     _storage_type = ('simple', )
+    # Seconds a model stays in the repository entity cache, None for the db.entity_cache_ttl setting and 0 to never cache it.
+    _cache_ttl = None
+    # What the model looked like in the database, see _db_changed_columns.
+    _db_snapshot = None
+    # The properties a projected fetch loaded, the repository refuses to write a projected model.
+    _db_projection = None
+
+    def _track_db_row(self, row, columns=None):
+        # Blob rows are strings, simple rows can hold collections the model goes on to mutate.
+        if self._storage_type[0] == 'simple':
+            row = _snapshot_row(row)
+        self._db_snapshot = ('row', row, columns)
+
+    def _track_db_data(self, data):
+        self._db_snapshot = ('data', copy.deepcopy(data))
+
+    def _track_db_values(self, values):
+        self._db_snapshot = ('values', copy.deepcopy(values))
+
+    def _db_snapshot_values(self):
+        kind = self._db_snapshot[0]
+        if kind == 'values':
+            return self._db_snapshot[1]
+
+        if kind == 'row':
+            row, columns = self._db_snapshot[1:]
+            data = self._db_to_storage_type(row) if columns is None else self._db_values_to_storage_type(row, columns)
+        else:
+            data = copy.deepcopy(self._db_snapshot[1])
+
+        values = self.__class__(**data).entity_to_db()
+        self._db_snapshot = ('values', values)
+        return values
+
+    def _db_changed_columns(self, values=None):
+        """
+        The names of the columns that changed since the model was loaded, None when
+        the model was not loaded from the database. Values are compared before they
+        are encoded, so an unchanged json or binary model is never serialized.
+        """
+        if self._db_snapshot is None:
+            return None
+
+        values = self.entity_to_db() if values is None else values
+        snapshot = self._db_snapshot_values()
+        if self._storage_type[0] in ['json', 'binary']:
+            return set([self._storage_type[1]]) if values != snapshot else set()
+        return set([name for name, value in values.items() if name not in snapshot or snapshot[name] != value])
+
+    @classmethod
+    def _storage_codec(cls):
+        if len(cls._storage_type) > 2:
+            codec = cls._storage_type[2]
+            return get_codec(codec) if isinstance(codec, basestring) else codec
+        return get_codec(cls._storage_type[0])
+
+    @classmethod
+    def _decode_blob(cls, value):
+        return decode_blob(value, cls._storage_codec())
 
     def _storage_type_to_db(self, serialize_fn=None):
-        assert self._storage_type[0] in ['simple', 'json'], '_storage_type must be an iterable with a first element of "simple" or "json"'
+        assert self._storage_type[0] in STORAGE_TYPES, '_storage_type must be an iterable with a first element of "simple", "json" or "binary"'
 
-        if self._storage_type[0] == 'json':
+        if self._storage_type[0] in ['json', 'binary']:
             assert self._storage_type[1], '_storage_type second element must a string'
 
             if callable(serialize_fn):
@@ -38,7 +95,7 @@ class CassandraModelMixin(object):
             else:
                 model = self.entity_to_db()
             return {
-                self._storage_type[1]: json_encoder.encode(model)
+                self._storage_type[1]: self._storage_codec().encode(model)
             }
 
         if callable(serialize_fn):
@@ -48,13 +105,87 @@ class CassandraModelMixin(object):
 
     @classmethod
     def _db_to_storage_type(cls, row):
-        assert cls._storage_type[0] in ['simple', 'json'], '_storage_type must be an iterable with a first element of "simple" or "json"'
+        assert cls._storage_type[0] in STORAGE_TYPES, '_storage_type must be an iterable with a first element of "simple", "json" or "binary"'
 
-        if cls._storage_type[0] == 'json':
+        if cls._storage_type[0] in ['json', 'binary']:
             assert cls._storage_type[1], '_storage_type second element must a string'
 
             if not row.get(cls._storage_type[1], None):
                 raise KeyError('Argument "row" is missing required key "%s"' % cls._storage_type[1])
 
-            return json.loads(row[cls._storage_type[1]])
-        return row
\ No newline at end of file
+            return cls._decode_blob(row[cls._storage_type[1]])
+        return row
+
+    @classmethod
+    def _db_values_to_storage_type(cls, row, columns):
+        assert cls._storage_type[0] in STORAGE_TYPES, '_storage_type must be an iterable with a first element of "simple", "json" or "binary"'
+
+        if cls._storage_type[0] in ['json', 'binary']:
+            assert cls._storage_type[1], '_storage_type second element must a string'
+
+            position = columns.positions.get(cls._storage_type[1])
+            if position is None or not row[position]:
+                raise KeyError('Argument "row" is missing required key "%s"' % cls._storage_type[1])
+
+            return cls._decode_blob(row[position])
+        return dict(zip(columns.names, row))
+
+
+class LazyModel(object):
+    """
+    Stands in for a model loaded by ``fetch(..., lazy=True)``.
+
+    The raw row is kept and only decoded the first time an attribute is read
+    or set. With a ``projection`` only those top level properties (and the key)
+    are set on the model, the rest keep their defaults. The blob of a json or
+    binary model is still decoded whole, the projection saves building the
+    other properties, not decoding them. A projected model is read only, the
+    repository refuses to insert or update it.
+
+    A lazy model is a proxy, ``type()`` and ``isinstance`` see ``LazyModel``,
+    the repository builds it before using it. Copying or pickling it builds it
+    too and yields the model itself. Referenced keys are never resolved on a
+    lazy model, with or without a projection, call
+    ``resolve_referenced_keys_multi`` for the models that need them.
+    """
+    __slots__ = ('_model_cls', '_decode', '_projection', '_model')
+
+    def __init__(self, model_cls, decode, projection=None):
+        object.__setattr__(self, '_model_cls', model_cls)
+        object.__setattr__(self, '_decode', decode)
+        object.__setattr__(self, '_projection', projection)
+        object.__setattr__(self, '_model', None)
+
+    @property
+    def _db_projection(self):
+        return self._projection
+
+    @property
+    def is_materialized(self):
+        return self._model is not None
+
+    def materialize(self):
+        if self._model is None:
+            data = self._decode()
+            if self._projection:
+                data = dict([(name, data[name]) for name in ['key'] + self._projection if name in data])
+            model = self._model_cls(**data)
+            if self._projection:
+                model._db_projection = self._projection
+            object.__setattr__(self, '_model', model)
+            object.__setattr__(self, '_decode', None)
+        return self._model
+
+    def __getattr__(self, name):
+        return getattr(self.materialize(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.materialize(), name, value)
+
+    def __reduce_ex__(self, protocol):
+        return self.materialize().__reduce_ex__(protocol)
+
+    def __repr__(self):
+        if self._model is None:
+            return '<LazyModel %s>' % self._model_cls.__name__
+        return repr(self._model)
@@ -1,8 +1,12 @@
+import copy
 import unittest
+import mock
 from furryninja import Model
 from furryninja.model import StringProperty
-from furryninja_cassandra.model import CassandraModelMixin
+from furryninja_cassandra.model import CassandraModelMixin, LazyModel
 from furryninja_cassandra.repository import CassandraRepository
+from furryninja_cassandra.rows import column_index
+from furryninja_cassandra.codec import BinaryCodec
 
 __author__ = 'broken'
 
@@ -11,11 +15,21 @@ class Book(Model, CassandraModelMixin):
     title = StringProperty()
 
 
+class Shelf(Model, CassandraModelMixin):
+    title = StringProperty()
+    books = StringProperty(repeated=True)
+
+
 class Asset(Model, CassandraModelMixin):
     _storage_type = ('json', 'blob')
     title = StringProperty()
 
 
+class BinaryAsset(Model, CassandraModelMixin):
+    _storage_type = ('binary', 'blob', BinaryCodec(compress=True, compress_min_size=0))
+    title = StringProperty()
+
+
 class TestCassandraModel(unittest.TestCase):
     def test_storage_type_simple_to_db(self):
         book = Book(**{'title': 'A storm of swords'})
@@ -49,4 +63,119 @@ class TestCassandraModel(unittest.TestCase):
             'blob': '{"key": "%s", "title": "A storm of swords"}' % entity.key.urlsafe()
         }
 
-        self.assertDictEqual(entity.__class__._db_to_storage_type(row), entity.entity_to_db())
\ No newline at end of file
+        self.assertDictEqual(entity.__class__._db_to_storage_type(row), entity.entity_to_db())
+
+    def test_db_values_to_storage_type_simple(self):
+        entity = Book(**{'title': 'A storm of swords'})
+        row = (entity.key.urlsafe(), 'A storm of swords')
+
+        self.assertDictEqual(entity.__class__._db_values_to_storage_type(row, column_index(['key', 'title'])), entity.entity_to_db())
+
+    def test_db_values_to_storage_type_json(self):
+        entity = Asset(**{'title': 'A storm of swords'})
+        row = (entity.key.urlsafe(), '{"key": "%s", "title": "A storm of swords"}' % entity.key.urlsafe())
+
+        self.assertDictEqual(entity.__class__._db_values_to_storage_type(row, column_index(['key', 'blob'])), entity.entity_to_db())
+
+    def test_storage_type_binary(self):
+        entity = BinaryAsset(**{'title': 'A storm of swords'})
+        denormalized = CassandraRepository.denormalize(entity)
+
+        self.assertTrue(BinaryCodec.matches(denormalized['blob']))
+        self.assertDictEqual(entity.__class__._db_to_storage_type(denormalized), entity.entity_to_db())
+
+    def test_db_to_storage_type_binary_reads_json_rows(self):
+        entity = BinaryAsset(**{'title': 'A storm of swords'})
+        row = {
+            'blob': '{"key": "%s", "title": "A storm of swords"}' % entity.key.urlsafe()
+        }
+
+        self.assertDictEqual(entity.__class__._db_to_storage_type(row), entity.entity_to_db())
+
+    def test_db_changed_columns(self):
+        book = Book(**{'title': 'A storm of swords'})
+        self.assertIsNone(book._db_changed_columns())
+
+        book._track_db_row({'key': book.key.urlsafe(), 'title': 'A storm of swords'})
+        self.assertSetEqual(book._db_changed_columns(), set())
+
+        book.title = 'A feast for crows'
+        self.assertSetEqual(book._db_changed_columns(), set(['title']))
+
+    def test_db_changed_columns_json(self):
+        entity = Asset(**{'title': 'A storm of swords'})
+        entity._track_db_data({'key': entity.key.urlsafe(), 'title': 'A storm of swords'})
+        self.assertSetEqual(entity._db_changed_columns(), set())
+
+        entity.title = 'A feast for crows'
+        self.assertSetEqual(entity._db_changed_columns(), set(['blob']))
+
+        entity._track_db_values(entity.entity_to_db())
+        self.assertSetEqual(entity._db_changed_columns(), set())
+
+    def test_track_db_row_copies_only_collections(self):
+        book = Book(**{'title': 'A storm of swords'})
+        row = {'key': book.key.urlsafe(), 'title': 'A storm of swords'}
+        book._track_db_row(row)
+        self.assertIs(book._db_snapshot[1], row)
+
+        row = (book.key.urlsafe(), 'A storm of swords')
+        book._track_db_row(row, column_index(['key', 'title']))
+        self.assertIs(book._db_snapshot[1], row)
+
+        shelf = Shelf(**{'title': 'Fantasy', 'books': ['A storm of swords']})
+        row = {'key': shelf.key.urlsafe(), 'title': 'Fantasy', 'books': ['A storm of swords']}
+        shelf._track_db_row(row)
+        self.assertIs(shelf._db_snapshot[1]['title'], row['title'])
+        self.assertIsNot(shelf._db_snapshot[1]['books'], row['books'])
+
+        row['books'].append('A feast for crows')
+        shelf.books = ['A storm of swords', 'A feast for crows']
+        self.assertSetEqual(shelf._db_changed_columns(), set(['books']))
+
+
+class TestLazyModel(unittest.TestCase):
+    def test_decode_on_first_access(self):
+        entity = Asset(**{'title': 'A storm of swords'})
+        row = {
+            'blob': '{"key": "%s", "title": "A storm of swords"}' % entity.key.urlsafe()
+        }
+        decode = mock.Mock(side_effect=lambda: Asset._db_to_storage_type(row))
+        lazy = LazyModel(Asset, decode)
+
+        self.assertIs(type(lazy), LazyModel)
+        self.assertIs(lazy._model_cls, Asset)
+        self.assertFalse(lazy.is_materialized)
+        self.assertEqual(decode.call_count, 0)
+
+        self.assertEqual(lazy.title, 'A storm of swords')
+        self.assertEqual(lazy.key.urlsafe(), entity.key.urlsafe())
+        self.assertTrue(lazy.is_materialized)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_copy_builds_the_model(self):
+        entity = Asset(**{'title': 'A storm of swords'})
+        lazy = LazyModel(Asset, lambda: entity.entity_to_db())
+
+        model = copy.deepcopy(lazy)
+        self.assertIs(type(model), Asset)
+        self.assertEqual(model.title, 'A storm of swords')
+        self.assertEqual(model.key.urlsafe(), entity.key.urlsafe())
+        self.assertTrue(lazy.is_materialized)
+
+    def test_projection(self):
+        class Article(Model, CassandraModelMixin):
+            _storage_type = ('json', 'blob')
+            title = StringProperty()
+            body = StringProperty()
+
+        entity = Article(**{'title': 'A storm of swords', 'body': 'Lorem ipsum'})
+        lazy = LazyModel(Article, lambda: entity.entity_to_db(), projection=['title'])
+        self.assertEqual(lazy._db_projection, ['title'])
+        self.assertFalse(lazy.is_materialized)
+
+        self.assertEqual(lazy.title, 'A storm of swords')
+        self.assertIsNone(lazy.body)
+        self.assertEqual(lazy.key.urlsafe(), entity.key.urlsafe())
+        self.assertEqual(lazy.materialize()._db_projection, ['title'])
+        self.assertIsNone(LazyModel(Article, lambda: entity.entity_to_db())._db_projection)
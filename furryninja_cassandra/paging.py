@@ -0,0 +1,113 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from hashlib import md5
+from .exceptions import InvalidCursorException
+from .profiles import READ_PROFILE
+
+__author__ = 'broken'
+
+DEFAULT_PAGE_SIZE = 100
+
+
+def _statement_fingerprint(cql_qry):
+    # Prepared statements share their text across values, the values are part of what a cursor continues.
+    values = json.dumps(cql_qry.condition_values, sort_keys=True, default=str)
+    return md5(cql_qry.statement.encode('utf-8') + '\x00' + values).digest()[:4]
+
+
+def encode_cursor(cql_qry, paging_state):
+    """
+    An urlsafe string to continue ``cql_qry`` from ``paging_state`` with, None without a paging state.
+    """
+    if not paging_state:
+        return None
+    return urlsafe_b64encode(_statement_fingerprint(cql_qry) + paging_state).rstrip('=')
+
+
+def decode_cursor(cql_qry, cursor):
+    """
+    The paging state in ``cursor``. A cursor only continues a query with the same statement and values.
+    """
+    if not cursor:
+        return None
+
+    try:
+        data = urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4))
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursorException('Malformed cursor %r' % cursor)
+
+    if len(data) <= 4 or data[:4] != _statement_fingerprint(cql_qry):
+        raise InvalidCursorException('Cursor %r does not belong to %r' % (cursor, cql_qry.statement))
+    return data[4:]
+
+
+class ModelPage(list):
+    """
+    The models of one page, ``cursor`` continues after the last of them and is None on the last page.
+    """
+    __slots__ = ('cursor',)
+
+    def __init__(self, models, cursor=None):
+        super(ModelPage, self).__init__(models)
+        self.cursor = cursor
+
+
+class ModelPager(object):
+    """
+    Iterate over the models matching a query one driver page at a time.
+
+    Only the rows and models of the current page are kept alive. After a page
+    has been consumed ``paging_state`` holds the state to resume from and
+    ``cursor`` the same as an urlsafe string, pass either to a new pager (with
+    the same query) to continue where this one stopped.
+    """
+    def __init__(self, repository, cql_qry, fields=None, page_size=DEFAULT_PAGE_SIZE, paging_state=None, cursor=None, execution_profile=READ_PROFILE):
+        assert page_size > 0, 'page_size must be a positive integer, got %r' % page_size
+        self.repository = repository
+        self.cql_qry = cql_qry
+        self.fields = fields
+        self.page_size = page_size
+        self.paging_state = paging_state or decode_cursor(cql_qry, cursor)
+        self.exhausted = False
+        self.execution_profile = execution_profile
+
+    @property
+    def cursor(self):
+        return encode_cursor(self.cql_qry, self.paging_state)
+
+    def pages(self):
+        while not self.exhausted:
+            result = self.repository._execute_page(self.cql_qry, self.page_size, paging_state=self.paging_state, execution_profile=self.execution_profile)
+            page = self._page(result.current_rows)
+
+            self.paging_state = result.paging_state
+            self.exhausted = not self.paging_state
+            yield page
+
+    def _page(self, rows):
+        page = self.repository._models_from_rows(rows)
+        self.repository.resolve_referenced_keys_multi(page, fields=self.fields, execution_profile=self.execution_profile)
+        return page
+
+    def __iter__(self):
+        for page in self.pages():
+            for model in page:
+                yield model
+
+
+class ReferrerPager(ModelPager):
+    """
+    Iterate over the keys of the models that reference a key, one page of the
+    reverse edge table at a time. With ``hydrate`` the models of each page are
+    loaded instead, keys whose model is gone are left out. Without a label, a
+    model that references the key under several labels can show up once per label.
+    """
+    def __init__(self, repository, cql_qry, hydrate=False, **kwargs):
+        super(ReferrerPager, self).__init__(repository, cql_qry, **kwargs)
+        self.hydrate = hydrate
+
+    def _page(self, rows):
+        keys = self.repository._referrer_keys(rows)
+        if not self.hydrate:
+            return keys
+        return self.repository._models_for_keys(keys, fields=self.fields, execution_profile=self.execution_profile)
@@ -0,0 +1,116 @@
+import unittest
+import mock
+from .exceptions import InvalidCursorException
+from .paging import ModelPage, ModelPager, ReferrerPager, decode_cursor, encode_cursor
+
+__author__ = 'broken'
+
+
+class FakeResultSet(object):
+    def __init__(self, current_rows, paging_state):
+        self.current_rows = current_rows
+        self.paging_state = paging_state
+
+
+class TestCursor(unittest.TestCase):
+    def setUp(self):
+        self.cql_qry = mock.Mock(statement='SELECT * FROM imageasset', condition_values={})
+
+    def test_round_trip(self):
+        cursor = encode_cursor(self.cql_qry, '\x00\x10paging\xff')
+        self.assertRegexpMatches(cursor, r'^[A-Za-z0-9_-]+$')
+        self.assertEqual(decode_cursor(self.cql_qry, cursor), '\x00\x10paging\xff')
+        self.assertEqual(decode_cursor(self.cql_qry, unicode(cursor)), '\x00\x10paging\xff')
+
+    def test_no_paging_state(self):
+        self.assertIsNone(encode_cursor(self.cql_qry, None))
+        self.assertIsNone(decode_cursor(self.cql_qry, None))
+
+    def test_invalid(self):
+        cursor = encode_cursor(self.cql_qry, 'paging')
+        with self.assertRaises(InvalidCursorException):
+            decode_cursor(mock.Mock(statement='SELECT * FROM tag', condition_values={}), cursor)
+        with self.assertRaises(InvalidCursorException):
+            decode_cursor(self.cql_qry, 'not a cursor')
+
+    def test_bound_values(self):
+        statement = 'SELECT * FROM imageasset WHERE title = %(title)s'
+        cql_qry = mock.Mock(statement=statement, condition_values={'title': 'a'})
+        cursor = encode_cursor(cql_qry, 'paging')
+
+        self.assertEqual(decode_cursor(mock.Mock(statement=statement, condition_values={'title': u'a'}), cursor), 'paging')
+        with self.assertRaises(InvalidCursorException):
+            decode_cursor(mock.Mock(statement=statement, condition_values={'title': 'b'}), cursor)
+
+    def test_model_page(self):
+        page = ModelPage(['a', 'b'], 'cursor')
+        self.assertEqual(page, ['a', 'b'])
+        self.assertEqual(page.cursor, 'cursor')
+
+
+class TestModelPager(unittest.TestCase):
+    def setUp(self):
+        pages = {
+            None: FakeResultSet([{'key': 'a'}, {'key': 'b'}], 'page-2'),
+            'page-2': FakeResultSet([{'key': 'c'}], None)
+        }
+
+        self.repo = mock.Mock()
+        self.repo._execute_page.side_effect = lambda cql_qry, page_size, paging_state=None, execution_profile=None: pages[paging_state]
+        self.repo._models_from_rows.side_effect = lambda rows: [row['key'] for row in rows]
+
+    def test_iterate_models(self):
+        pager = ModelPager(self.repo, 'cql_qry', page_size=2)
+
+        self.assertEqual(list(pager), ['a', 'b', 'c'])
+        self.assertEqual(self.repo._execute_page.call_count, 2)
+        self.assertEqual(self.repo.resolve_referenced_keys_multi.call_count, 2)
+        self.assertIsNone(pager.paging_state)
+        self.assertTrue(pager.exhausted)
+
+    def test_resume_from_paging_state(self):
+        pager = ModelPager(self.repo, 'cql_qry', page_size=2)
+        pages = pager.pages()
+
+        self.assertEqual(next(pages), ['a', 'b'])
+        self.assertEqual(pager.paging_state, 'page-2')
+
+        resumed = ModelPager(self.repo, 'cql_qry', page_size=2, paging_state=pager.paging_state)
+        self.assertEqual(list(resumed), ['c'])
+
+    def test_resume_from_cursor(self):
+        cql_qry = mock.Mock(statement='SELECT * FROM imageasset', condition_values={})
+        pager = ModelPager(self.repo, cql_qry, page_size=2)
+        next(pager.pages())
+
+        resumed = ModelPager(self.repo, cql_qry, page_size=2, cursor=pager.cursor)
+        self.assertEqual(resumed.paging_state, 'page-2')
+        self.assertEqual(list(resumed), ['c'])
+        self.assertIsNone(resumed.cursor)
+
+
+class TestReferrerPager(unittest.TestCase):
+    def setUp(self):
+        pages = {
+            None: FakeResultSet([{'indoc': 'a'}, {'indoc': 'b'}], 'page-2'),
+            'page-2': FakeResultSet([{'indoc': 'c'}], None)
+        }
+
+        self.repo = mock.Mock()
+        self.repo._execute_page.side_effect = lambda cql_qry, page_size, paging_state=None, execution_profile=None: pages[paging_state]
+        self.repo._referrer_keys.side_effect = lambda rows: [row['indoc'] for row in rows]
+        self.repo._models_for_keys.side_effect = lambda keys, fields=None, execution_profile=None: [key.upper() for key in keys]
+
+    def test_iterate_keys(self):
+        pager = ReferrerPager(self.repo, 'cql_qry', page_size=2)
+
+        self.assertEqual(list(pager), ['a', 'b', 'c'])
+        self.assertFalse(self.repo._models_for_keys.called)
+        self.assertFalse(self.repo.resolve_referenced_keys_multi.called)
+
+    def test_hydrate_per_page(self):
+        pager = ReferrerPager(self.repo, 'cql_qry', hydrate=True, fields=['topics'], page_size=2)
+
+        self.assertEqual(list(pager.pages()), [['A', 'B'], ['C']])
+        self.assertEqual(self.repo._models_for_keys.call_count, 2)
+        self.assertEqual(self.repo._models_for_keys.call_args[1]['fields'], ['topics'])
@@ -0,0 +1,79 @@
+from collections import namedtuple
+from string import lower
+from furryninja import Key, KeyProperty
+from furryninja.model import AttributesProperty
+from .exceptions import PrimaryKeyException
+
+__author__ = 'broken'
+
+CASSANDRA_TYPE_MAP = {
+    'text': str,
+    'int': int
+}
+
+
+def column_type(column):
+    # Driver 3.x names the CQL type ``cql_type``, older drivers ``typestring``.
+    return getattr(column, 'cql_type', None) or column.typestring
+
+
+class TablePlan(object):
+    """
+    Everything the repository needs to know about the table of a model class,
+    compiled once from the cluster metadata.
+    """
+    def __init__(self, table_name, metadata):
+        self.table_name = lower(table_name)
+        self.metadata = metadata
+        self.partition_key = [column.name for column in metadata.partition_key]
+        self.clustering_key = [column.name for column in metadata.clustering_key]
+        self.primary_key = self.partition_key + self.clustering_key
+        self.columns = set(metadata.columns.keys())
+        self.converters = [(column.name, column_type(column), CASSANDRA_TYPE_MAP.get(column_type(column))) for column in metadata.primary_key]
+
+    def primary_key_values(self, model):
+        fields = {}
+        for name, type_string, converter in self.converters:
+            if not hasattr(model, name):
+                raise PrimaryKeyException('Missing mandatory PRIMARY KEY part %r' % name)
+
+            value = getattr(model, name)
+            if isinstance(value, Key):
+                value = value.urlsafe()
+            elif value is not None:
+                assert converter, 'Unknown type_string "%s"' % type_string
+                value = converter(value)
+            fields[name] = value
+
+        return fields
+
+    def primary_key_filters(self, model):
+        return [getattr(model.__class__, field) == getattr(model, field) for field in self.primary_key]
+
+
+KeyPath = namedtuple('KeyPath', ['label', 'prop', 'repeated', 'nested', 'repeated_parents'])
+
+
+def compile_key_paths(model_cls):
+    """
+    Find every KeyProperty reachable from ``model_cls``, including those nested
+    in AttributesProperty, so edges can be extracted without reflection.
+    """
+    def find(props, path, parents, key_paths):
+        for name, prop in props:
+            current_path = path + [name]
+            if isinstance(prop, AttributesProperty):
+                find(prop._attributes_map.items(), current_path, parents + [prop], key_paths)
+            elif isinstance(prop, KeyProperty):
+                key_paths.append(KeyPath(
+                    label='.'.join(current_path),
+                    prop=prop,
+                    repeated=prop._repeated,
+                    nested=bool(parents),
+                    repeated_parents=tuple([parent for parent in parents if parent._repeated])
+                ))
+
+    props = [(name, getattr(model_cls, name)) for name in set(dir(model_cls)) if name != model_cls._key_property_name]
+    key_paths = []
+    find(props, [], [], key_paths)
+    return key_paths
@@ -0,0 +1,52 @@
+import unittest
+from furryninja import Model, StringProperty, IntegerProperty
+from .exceptions import PrimaryKeyException
+from .plan import TablePlan
+
+__author__ = 'broken'
+
+
+class Column(object):
+    def __init__(self, name, cql_type):
+        self.name = name
+        self.cql_type = cql_type
+
+
+class TableMetadata(object):
+    partition_key = [Column('key', 'text')]
+    clustering_key = [Column('revision', 'int')]
+    primary_key = partition_key + clustering_key
+    columns = dict([(column.name, column) for column in primary_key + [Column('title', 'text')]])
+
+
+class Article(Model):
+    revision = IntegerProperty(default=1)
+    title = StringProperty()
+
+
+class TestTablePlan(unittest.TestCase):
+    def test_plan(self):
+        plan = TablePlan('Article', TableMetadata())
+
+        self.assertEqual(plan.table_name, 'article')
+        self.assertEqual(plan.partition_key, ['key'])
+        self.assertEqual(plan.clustering_key, ['revision'])
+        self.assertEqual(plan.primary_key, ['key', 'revision'])
+        self.assertEqual(plan.columns, set(['key', 'revision', 'title']))
+
+    def test_primary_key_values(self):
+        plan = TablePlan('article', TableMetadata())
+        article = Article(**{'title': 'A magic title'})
+
+        self.assertDictEqual(plan.primary_key_values(article), {
+            'key': article.key.urlsafe(),
+            'revision': 1
+        })
+
+    def test_primary_key_values_missing_part(self):
+        class Note(Model):
+            title = StringProperty()
+
+        plan = TablePlan('note', TableMetadata())
+        with self.assertRaises(PrimaryKeyException):
+            plan.primary_key_values(Note())
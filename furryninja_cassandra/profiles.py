@@ -0,0 +1,98 @@
+from cassandra import ConsistencyLevel
+from cassandra.cluster import ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.policies import RetryPolicy, FallthroughRetryPolicy, DowngradingConsistencyRetryPolicy
+
+__author__ = 'broken'
+
+READ_PROFILE = 'read'
+WRITE_PROFILE = 'write'
+
+PROFILE_OPTIONS = ['consistency_level', 'serial_consistency_level', 'request_timeout', 'retry_policy', 'fetch_size']
+
+RETRY_POLICIES = {
+    'default': RetryPolicy,
+    'fallthrough': FallthroughRetryPolicy,
+    'downgrading_consistency': DowngradingConsistencyRetryPolicy
+}
+
+
+def consistency_level(value):
+    if isinstance(value, basestring):
+        assert value.upper() in ConsistencyLevel.name_to_value, 'Unknown consistency level "%s"' % value
+        return ConsistencyLevel.name_to_value[value.upper()]
+    return int(value)
+
+
+def is_serial(value):
+    return value is not None and consistency_level(value) in [ConsistencyLevel.SERIAL, ConsistencyLevel.LOCAL_SERIAL]
+
+
+def retry_policy(value):
+    if isinstance(value, basestring):
+        assert value in RETRY_POLICIES, 'Unknown retry policy "%s"' % value
+        return RETRY_POLICIES[value]()
+    return value
+
+
+def profile_settings(settings):
+    """
+    The options of every execution profile, keyed by profile name.
+
+    The db settings named in PROFILE_OPTIONS apply to every profile. The read and
+    write profiles take ``read_consistency_level`` and ``write_consistency_level``
+    on top of that. A serial ``consistency_level`` only applies to reads, the
+    default and write profiles take it as their ``serial_consistency_level``, ``execution_profiles`` can override any option of any profile
+    and add new ones. The default profile is keyed by EXEC_PROFILE_DEFAULT.
+    """
+    base = dict([(name, settings[name]) for name in PROFILE_OPTIONS if settings.get(name) is not None])
+
+    # Plain writes cannot run at a serial level, the default and write profiles keep it for conditional writes.
+    writes = dict(base)
+    if is_serial(writes.get('consistency_level')):
+        writes.setdefault('serial_consistency_level', writes.pop('consistency_level'))
+
+    profiles = {
+        EXEC_PROFILE_DEFAULT: dict(writes),
+        READ_PROFILE: dict(base),
+        WRITE_PROFILE: dict(writes)
+    }
+    if settings.get('read_consistency_level') is not None:
+        profiles[READ_PROFILE]['consistency_level'] = settings['read_consistency_level']
+    if settings.get('write_consistency_level') is not None:
+        profiles[WRITE_PROFILE]['consistency_level'] = settings['write_consistency_level']
+
+    for name, options in (settings.get('execution_profiles') or {}).items():
+        unknown = set(options.keys()).difference(PROFILE_OPTIONS)
+        assert not unknown, 'Unknown execution profile options %s' % ', '.join(sorted(unknown))
+
+        name = EXEC_PROFILE_DEFAULT if name == 'default' else name
+        profiles.setdefault(name, dict(base)).update(options)
+
+    return profiles
+
+
+def execution_profile(options, row_factory, load_balancing_policy=None):
+    # fetch_size is not a profile option in the driver, the repository sets it on the statements.
+    kwargs = {'row_factory': row_factory}
+    if load_balancing_policy is not None:
+        kwargs['load_balancing_policy'] = load_balancing_policy
+    if options.get('consistency_level') is not None:
+        kwargs['consistency_level'] = consistency_level(options['consistency_level'])
+    if options.get('serial_consistency_level') is not None:
+        kwargs['serial_consistency_level'] = consistency_level(options['serial_consistency_level'])
+    if options.get('request_timeout') is not None:
+        kwargs['request_timeout'] = float(options['request_timeout'])
+    if options.get('retry_policy') is not None:
+        kwargs['retry_policy'] = retry_policy(options['retry_policy'])
+    return ExecutionProfile(**kwargs)
+
+
+def execution_profiles(profiles, row_factory, load_balancing_policy=None):
+    """
+    Driver ExecutionProfiles for ``profiles``, ``load_balancing_policy`` is called
+    once per profile to create its policy.
+    """
+    return dict([
+        (name, execution_profile(options, row_factory, load_balancing_policy=load_balancing_policy() if load_balancing_policy else None))
+        for name, options in profiles.items()
+    ])
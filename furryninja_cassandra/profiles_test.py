@@ -0,0 +1,66 @@
+import unittest
+from cassandra import ConsistencyLevel
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.policies import FallthroughRetryPolicy
+from cassandra.query import ordered_dict_factory
+from .profiles import READ_PROFILE, WRITE_PROFILE, profile_settings, execution_profile, execution_profiles
+
+__author__ = 'broken'
+
+
+class TestExecutionProfiles(unittest.TestCase):
+    def test_profile_settings(self):
+        profiles = profile_settings({
+            'name': 'test_keyspace',
+            'consistency_level': 'QUORUM',
+            'request_timeout': 5,
+            'read_consistency_level': 'LOCAL_ONE',
+            'write_consistency_level': 'LOCAL_QUORUM',
+            'execution_profiles': {
+                'analytics': {'consistency_level': 'ALL', 'fetch_size': 1000}
+            }
+        })
+
+        self.assertDictEqual(profiles, {
+            EXEC_PROFILE_DEFAULT: {'consistency_level': 'QUORUM', 'request_timeout': 5},
+            READ_PROFILE: {'consistency_level': 'LOCAL_ONE', 'request_timeout': 5},
+            WRITE_PROFILE: {'consistency_level': 'LOCAL_QUORUM', 'request_timeout': 5},
+            'analytics': {'consistency_level': 'ALL', 'request_timeout': 5, 'fetch_size': 1000}
+        })
+
+    def test_serial_consistency_level(self):
+        profiles = profile_settings({'consistency_level': ConsistencyLevel.SERIAL})
+
+        self.assertDictEqual(profiles, {
+            EXEC_PROFILE_DEFAULT: {'serial_consistency_level': ConsistencyLevel.SERIAL},
+            READ_PROFILE: {'consistency_level': ConsistencyLevel.SERIAL},
+            WRITE_PROFILE: {'serial_consistency_level': ConsistencyLevel.SERIAL}
+        })
+
+        profiles = profile_settings({'consistency_level': 'local_serial', 'serial_consistency_level': 'SERIAL'})
+        self.assertEqual(profiles[WRITE_PROFILE], {'serial_consistency_level': 'SERIAL'})
+
+    def test_unknown_profile_option(self):
+        with self.assertRaises(AssertionError):
+            profile_settings({'execution_profiles': {'analytics': {'consistency': 'ALL'}}})
+
+    def test_execution_profile(self):
+        profile = execution_profile({
+            'consistency_level': 'local_quorum',
+            'serial_consistency_level': ConsistencyLevel.LOCAL_SERIAL,
+            'request_timeout': '2.5',
+            'retry_policy': 'fallthrough',
+            'fetch_size': 1000
+        }, ordered_dict_factory)
+
+        self.assertEqual(profile.consistency_level, ConsistencyLevel.LOCAL_QUORUM)
+        self.assertEqual(profile.serial_consistency_level, ConsistencyLevel.LOCAL_SERIAL)
+        self.assertEqual(profile.request_timeout, 2.5)
+        self.assertIsInstance(profile.retry_policy, FallthroughRetryPolicy)
+        self.assertIs(profile.row_factory, ordered_dict_factory)
+
+    def test_execution_profiles(self):
+        profiles = execution_profiles(profile_settings({'consistency_level': ConsistencyLevel.ONE}), ordered_dict_factory)
+
+        self.assertEqual(set(profiles.keys()), set([EXEC_PROFILE_DEFAULT, READ_PROFILE, WRITE_PROFILE]))
+        self.assertTrue(all([profile.consistency_level == ConsistencyLevel.ONE for profile in profiles.values()]))
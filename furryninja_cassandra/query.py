@@ -1,9 +1,12 @@
+import re
 from string import lower
 from cassandra.query import ValueSequence
 from furryninja import Query, FilterInNode, Key
 
 __author__ = 'broken'
 
+_PLACEHOLDER_RE = re.compile(r'%\((\w+)\)s')
+
 
 class CassandraQuery(object):
     def __init__(self, query=None):
@@ -47,18 +50,13 @@ class CassandraQuery(object):
             return ' LIMIT %i' % self.query.limit()
         return ''
 
-    def _offset(self):
-        if self.query.offset():
-            return ' OFFSET %i' % self.query.offset()
-        return ''
-
     def _order_by(self):
         prop, direction = self.query.order_by()
         if prop:
             return ' ORDER BY %s %s' % (prop, direction)
         return ''
 
-    def select(self, fields=None):
+    def select(self, fields=None, paged=False):
         query_fields = ', '.join(fields) if fields else '*'
         query_string = 'SELECT %s FROM %s' % (query_fields, lower(self.query.table))
 
@@ -66,8 +64,9 @@ class CassandraQuery(object):
         query_string += where_string
 
         query_string += self._order_by()
-        query_string += self._limit()
-        query_string += self._offset()
+        if not paged:
+            assert not self.query.offset(), 'Cassandra has no OFFSET, continue from the cursor of the previous page instead'
+            query_string += self._limit()
 
         self.__cql_stmt += query_string
         self.__condition_values.update(condition_values)
@@ -122,6 +121,10 @@ class CassandraQuery(object):
     def statement(self):
         return self.__cql_stmt
 
+    @property
+    def prepared_statement(self):
+        return _PLACEHOLDER_RE.sub(r':\1', self.__cql_stmt)
+
     @property
     def condition_values(self):
         return self.__condition_values
\ No newline at end of file
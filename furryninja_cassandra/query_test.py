@@ -25,13 +25,18 @@ class TestCassandraQuery(unittest.TestCase):
         self.assertEqual(cassandra_qry.statement, 'SELECT * FROM imageasset LIMIT 42')
 
         qry.offset(10)
-        cassandra_qry = CassandraQuery(qry).select()
-        self.assertEqual(cassandra_qry.statement, 'SELECT * FROM imageasset LIMIT 42 OFFSET 10')
+        with self.assertRaises(AssertionError):
+            CassandraQuery(qry).select()
 
         qry.offset(0).limit(50)
         cassandra_qry = CassandraQuery(qry).select()
         self.assertEqual(cassandra_qry.statement, 'SELECT * FROM imageasset LIMIT 50')
 
+    def test_query_to_paged_select_statement(self):
+        qry = ImageAsset.query().limit(42).offset(10)
+        cassandra_qry = CassandraQuery(qry).select(paged=True)
+        self.assertEqual(cassandra_qry.statement, 'SELECT * FROM imageasset')
+
     def test_query_to_select_statement_with_fields(self):
         qry = ImageAsset.query()
         cassandra_qry = CassandraQuery(qry).select(fields=['key', 'title'])
@@ -168,4 +173,16 @@ class TestCassandraQuery(unittest.TestCase):
         }).update_if('update_token', 'abcdef')
 
         self.assertEqual(cassandra_qry.statement, 'UPDATE imageasset SET blob = %(blob)s, last_update = %(last_update)s WHERE key = %(key)s if update_token = %(if_update_token)s')
-        self.assertEqual(cassandra_qry.condition_values['if_update_token'], 'abcdef')
\ No newline at end of file
+        self.assertEqual(cassandra_qry.condition_values['if_update_token'], 'abcdef')
+
+    def test_prepared_statement(self):
+        qry = ImageAsset.query(ImageAsset.title == 'Lorem Ipsum', ImageAsset.description == 'Lorem')
+        cassandra_qry = CassandraQuery(qry).select()
+        self.assertEqual(cassandra_qry.prepared_statement, 'SELECT * FROM imageasset WHERE title = :title AND description = :description LIMIT 50')
+
+        asset = ImageAsset()
+        qry = asset.query(ImageAsset.key == asset.key)
+        cassandra_qry = CassandraQuery(qry).update({
+            'blob': '<--blob-->'
+        }).update_if('update_token', 'abcdef')
+        self.assertEqual(cassandra_qry.prepared_statement, 'UPDATE imageasset SET blob = :blob WHERE key = :key if update_token = :if_update_token')
\ No newline at end of file
@@ -1,30 +1,121 @@
 # -*- coding: utf-8 -*-
 from collections import OrderedDict
-from itertools import ifilter
+from string import lower
 import datetime
 import pytz
 import logging
 
 from cassandra import ConsistencyLevel
-from cassandra.cluster import Cluster
-from cassandra.policies import HostDistance
-from cassandra.query import ordered_dict_factory, BatchStatement, SimpleStatement
-from furryninja.model import AttributesProperty, DateTimeProperty
+from collections import deque
+from functools import partial
+from cassandra.cluster import Cluster, EXEC_PROFILE_DEFAULT
+from cassandra.query import ordered_dict_factory, BatchStatement, BatchType, SimpleStatement, UNSET_VALUE
+from furryninja.model import DateTimeProperty
+from tornado import gen
 
 from furryninja.repository import Repository
 from furryninja import Settings, KeyProperty, Key, Model, StringProperty, QueryNotFoundException
-from .model import CassandraModelMixin
+from .model import CassandraModelMixin, LazyModel
 from .query import CassandraQuery
+from .connection import Connection, connect, connections
+from .cache import EntityCache, MISSING
+from .futures import to_tornado_future
+from .metrics import Metrics, NullMetrics, instrumented
+from .paging import DEFAULT_PAGE_SIZE, ModelPage, ModelPager, ReferrerPager, decode_cursor, encode_cursor
+from .plan import TablePlan, CASSANDRA_TYPE_MAP, column_type, compile_key_paths
+from .profiles import READ_PROFILE, WRITE_PROFILE, profile_settings
+from .rows import indexed_tuple_factory, row_columns, row_value
 from .exceptions import PrimaryKeyException, ModelValidationException, LightweightTransactionException
 
 logger = logging.getLogger('cassandra.repo')
 
 
+def _built(model):
+    return model.materialize() if isinstance(model, LazyModel) else model
+
+
+def _model_table(self, model, *args, **kwargs):
+    return lower(model.table())
+
+
+def _models_table(self, models, *args, **kwargs):
+    return lower(models[0].table()) if models else None
+
+
+def _query_table(self, query, *args, **kwargs):
+    return lower(query.table)
+
+
+def _edge_table(self, *args, **kwargs):
+    return lower(self._edge_model.table())
+
+
+def _log_query(query, args, kwargs):
+    # Formatting statements is not free, only pay for it when the line is written.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[CQL] (furryninja-cassandra) %s <args: %s> <kwargs: %s>", query, args, kwargs)
+
+
 def _execute_query(session, query, *args, **kwargs):
-    logger.info("[CQL] (furryninja-cassandra) %s <args: %s> <kwargs: %s>", query, args, kwargs)
+    _log_query(query, args, kwargs)
     return session.execute(query, *args, **kwargs)
 
 
+def _execute_concurrent(session, statements_and_parameters, concurrency, execution_profile=EXEC_PROFILE_DEFAULT):
+    # execute_concurrent takes no execution profile, this keeps up to ``concurrency``
+    # requests in flight itself and returns the results in order.
+    pending = deque()
+    results = []
+    for query, parameters in statements_and_parameters:
+        if len(pending) >= concurrency:
+            results.append(pending.popleft().result())
+
+        _log_query(query, (), {'parameters': parameters, 'execution_profile': execution_profile})
+        pending.append(session.execute_async(query, parameters, execution_profile=execution_profile))
+
+    while pending:
+        results.append(pending.popleft().result())
+    return results
+
+
+def _execute_query_async(session, query, *args, **kwargs):
+    _log_query(query, args, kwargs)
+    return to_tornado_future(session.execute_async(query, *args, **kwargs))
+
+
+def _execute_page_async(session, query, *args, **kwargs):
+    _log_query(query, args, kwargs)
+    return to_tornado_future(session.execute_async(query, *args, **kwargs), first_page=True)
+
+
+class _ReferenceWalker(object):
+    """
+    Runs the reference resolution of furryninja's Repository with every model it gets
+    handed to ``lookup``, anything else it needs comes from the repository.
+    """
+    def __init__(self, repository, lookup):
+        self._repository = repository
+        self._lookup = lookup
+
+    def __getattr__(self, name):
+        return getattr(self._repository, name)
+
+    def get(self, model, fields=None, *args, **kwargs):
+        return self._lookup(self, _built(model), fields)
+
+    def get_multi(self, models, fields=None, *args, **kwargs):
+        result = []
+        for model in models:
+            try:
+                result.append(self.get(model, fields=fields))
+            except QueryNotFoundException:
+                result.append(None)
+        return result
+
+    def resolve_referenced_keys(self, model, fields=None, *args, **kwargs):
+        return Repository.resolve_referenced_keys.__func__(self, model, fields=fields)
+
+
 class Edge(Model, CassandraModelMixin):
     _storage_type = ('simple',)
 
@@ -35,72 +126,233 @@ class Edge(Model, CassandraModelMixin):
     last_update = DateTimeProperty(auto_now=True)
 
 
+class ReverseEdge(Model, CassandraModelMixin):
+    """
+    The edges again, partitioned by outdoc, to find the models that reference a key.
+    """
+    _storage_type = ('simple',)
+
+    label = StringProperty()
+    indoc = KeyProperty()
+    outdoc = KeyProperty()
+
+
 class CassandraRepository(Repository):
     _edge_model = Edge
+    _reverse_edge_model = ReverseEdge
 
-    def __init__(self, connection_class=Cluster, construct_primary_key=None, edge_model=None):
+    def __init__(self, connection_class=Cluster, construct_primary_key=None, edge_model=None, metrics=None, reverse_edge_model=None):
         super(CassandraRepository, self).__init__()
 
-        self.settings = dict(host='localhost', port=9042, protocol_version=2)
+        self.settings = dict(host='localhost', port=9042, protocol_version=2, prepare_statements=True, statement_cache_size=500, reference_batch_size=100, hydration='ordered_dict', entity_cache_size=0, entity_cache_ttl=60, entity_cache_negative_ttl=5, batch_max_statements=100, batch_max_bytes=5120, write_concurrency=8, read_concurrency=32, shared_connection=True, core_connections_per_host=10, local_dc=None, used_hosts_per_remote_dc=0, token_aware=True, metrics=False, reverse_edges=False, traversal_max_fan_out=1000, update_if_raises=False)
         self.settings.update(Settings.get('db'))
 
         assert self.settings.get('name', None), 'Missing required setting db.name'
+        assert self.settings['hydration'] in ['ordered_dict', 'tuple'], 'db.hydration must be "ordered_dict" or "tuple"'
 
         if edge_model:
             self._edge_model = edge_model
+        if reverse_edge_model:
+            self._reverse_edge_model = reverse_edge_model
 
         if not isinstance(self.settings.get('port'), int):
             self.settings['port'] = int(self.settings.get('port'))
         if not isinstance(self.settings.get('protocol_version'), int):
             self.settings['protocol_version'] = int(self.settings.get('protocol_version'))
-
-        cluster = connection_class(
-            contact_points=self.settings['host'],
-            port=self.settings['port'],
-            protocol_version=self.settings['protocol_version']
-        )
-        cluster.set_core_connections_per_host(HostDistance.LOCAL, 10)
-        self.session = cluster.connect(keyspace=self.settings['name'])
-        self.session.row_factory = ordered_dict_factory
+        if not isinstance(self.settings.get('statement_cache_size'), int):
+            self.settings['statement_cache_size'] = int(self.settings.get('statement_cache_size'))
+        if not isinstance(self.settings.get('reference_batch_size'), int):
+            self.settings['reference_batch_size'] = int(self.settings.get('reference_batch_size'))
+        if not isinstance(self.settings.get('entity_cache_size'), int):
+            self.settings['entity_cache_size'] = int(self.settings.get('entity_cache_size'))
+        for setting in ['batch_max_statements', 'batch_max_bytes', 'write_concurrency', 'read_concurrency', 'traversal_max_fan_out']:
+            if not isinstance(self.settings.get(setting), int):
+                self.settings[setting] = int(self.settings.get(setting))
+
+        # Row factories are part of the execution profiles, the driver refuses session.row_factory once profiles are used.
+        self.profiles = profile_settings(self.settings)
+        row_factory = indexed_tuple_factory if self.settings['hydration'] == 'tuple' else ordered_dict_factory
+
+        connect_fn = partial(connect, connection_class, dict(self.settings), self.profiles, row_factory)
+        if self.settings['shared_connection']:
+            self.connection = connections.get(connections.key(self.settings, connection_class), connect_fn, statement_cache_size=self.settings['statement_cache_size'])
+        else:
+            self.connection = Connection(connect_fn, statement_cache_size=self.settings['statement_cache_size'])
+
+        self.entity_cache = None
+        if self.settings['entity_cache_size'] > 0:
+            self.entity_cache = EntityCache(
+                max_size=self.settings['entity_cache_size'],
+                ttl=float(self.settings['entity_cache_ttl']),
+                negative_ttl=float(self.settings['entity_cache_negative_ttl'])
+            )
+
+        # Instrumentation is a no-op unless db.metrics is set or a metrics object is passed in.
+        if metrics is None:
+            metrics = Metrics() if self.settings['metrics'] else NullMetrics()
+        self.metrics = metrics
+
+        self._table_plans = {}
+        self._key_paths = {}
 
         if construct_primary_key:
             self.construct_primary_key = construct_primary_key
 
+    @property
+    def session(self):
+        return self.connection.session
+
+    @property
+    def statement_cache(self):
+        return self.connection.statement_cache
+
     def _get_table_metadata(self, table_name):
         return self.session.cluster.metadata.keyspaces[Settings.get('db.name')].tables[table_name]
 
+    def _table_plan(self, model):
+        return self._cached_table_plan(model.__class__, model.table)
+
+    def _table_plan_for_table(self, table_name):
+        return self._cached_table_plan(lower(table_name), lambda: table_name)
+
+    def _cached_table_plan(self, cache_key, table_name_fn):
+        plan = self._table_plans.get(cache_key)
+
+        # The driver swaps in new TableMetadata when the schema changes, which invalidates the plan.
+        tables = self.session.cluster.metadata.keyspaces[self.settings['name']].tables
+        if plan is None or tables.get(plan.table_name) is not plan.metadata:
+            table_name = lower(table_name_fn())
+            plan = TablePlan(table_name, tables[table_name])
+            self._table_plans[cache_key] = plan
+        return plan
+
     def _get_primary_key_fields(self, model):
-        metadata = self._get_table_metadata(model.table())
-        return [field.name for field in metadata.primary_key]
+        return self._table_plan(model).primary_key
+
+    def _primary_key_values(self, model, plan):
+        if self.construct_primary_key is CassandraRepository._construct_primary_key:
+            return plan.primary_key_values(model)
+        return self.construct_primary_key(model, plan.metadata)
+
+    def _prepare(self, cql_qry):
+        return self.statement_cache.get(cql_qry.prepared_statement)
+
+    def _add_to_batch(self, batch, cql_qry):
+        if self.settings['prepare_statements']:
+            batch.add(self._prepare(cql_qry), parameters=cql_qry.condition_values)
+        else:
+            batch.add(cql_qry.statement, parameters=cql_qry.condition_values)
 
-    def _execute(self, cql_qry, serial_consistency_level=None):
+    def _statement(self, cql_qry, serial_consistency_level=None, execution_profile=EXEC_PROFILE_DEFAULT):
         assert isinstance(cql_qry, CassandraQuery), 'cql_qry should be of type CassandraQuery'
 
         if self.settings.get('serial_consistency_level', None) and not serial_consistency_level:
             serial_consistency_level = int(self.settings.get('serial_consistency_level'))
 
-        stmt = SimpleStatement(cql_qry.statement, serial_consistency_level=serial_consistency_level)
-        result = _execute_query(self.session, stmt, parameters=cql_qry.condition_values)
+        if self.settings['prepare_statements']:
+            stmt = self._prepare(cql_qry).bind(cql_qry.condition_values)
+            stmt.serial_consistency_level = serial_consistency_level
+            parameters = None
+        else:
+            stmt = SimpleStatement(cql_qry.statement, serial_consistency_level=serial_consistency_level)
+            parameters = cql_qry.condition_values
 
+        fetch_size = self.profiles.get(execution_profile, {}).get('fetch_size')
+        if fetch_size:
+            stmt.fetch_size = int(fetch_size)
+        return stmt, parameters
+
+    @staticmethod
+    def _applied(result):
+        # The sync paths get a driver ResultSet, the async ones the rows of its first page.
+        rows = getattr(result, 'current_rows', result)
+        if isinstance(rows, list) and len(rows) > 0:
+            columns = row_columns(result)
+            if columns is not None or isinstance(rows[0], OrderedDict):
+                return row_value(rows[0], columns, '[applied]')
+        return None
+
+    def _update_applied(self, result):
+        # A failed update_if has always returned quietly, db.update_if_raises opts in to the exception.
+        if self._applied(result) is not False:
+            return True
+        if self.settings['update_if_raises']:
+            raise LightweightTransactionException('Failed to apply transaction')
+        return False
+
+    @staticmethod
+    def _check_batch_applied(result):
         # Cassandra is amazing. But someone did something stupid here.
-        if isinstance(result, list) and len(result) > 0 and isinstance(result[0], OrderedDict):
-            if result[0].get('[applied]', None) and result[0]['[applied]'] is False:
-                raise LightweightTransactionException('Failed to apply transaction')
+        applied = CassandraRepository._applied(result)
+        if applied is not None and applied is False:
+            raise LightweightTransactionException('Failed to apply transaction')
 
-        return result
+    def _execute(self, cql_qry, serial_consistency_level=None, execution_profile=EXEC_PROFILE_DEFAULT):
+        stmt, parameters = self._statement(cql_qry, serial_consistency_level=serial_consistency_level, execution_profile=execution_profile)
+        return _execute_query(self.session, stmt, parameters=parameters, execution_profile=execution_profile)
     execute = _execute
 
-    def _execute_batch(self, batch):
-        result = _execute_query(self.session, batch)
-
-        # Cassandra is amazing. But someone did something stupid here.
-        if isinstance(result, list) and len(result) > 0 and isinstance(result[0], OrderedDict):
-            if result[0].get('[applied]', None) is not None and result[0]['[applied]'] is False:
-                raise LightweightTransactionException('Failed to apply transaction')
+    def _execute_batch(self, batch, execution_profile=EXEC_PROFILE_DEFAULT):
+        if self.metrics.enabled:
+            self.metrics.record_batch(len(batch))
+        result = _execute_query(self.session, batch, execution_profile=execution_profile)
 
+        self._check_batch_applied(result)
         return result
     execute_batch = _execute_batch
 
+    def _execute_batches(self, batches, execution_profile=EXEC_PROFILE_DEFAULT):
+        if len(batches) == 1:
+            self._execute_batch(batches[0], execution_profile=execution_profile)
+            return
+
+        if self.metrics.enabled:
+            for batch in batches:
+                self.metrics.record_batch(len(batch))
+        results = _execute_concurrent(self.session, [(batch, None) for batch in batches], self.settings['write_concurrency'], execution_profile=execution_profile)
+        for result in results:
+            self._check_batch_applied(result)
+
+    def _execute_page(self, cql_qry, page_size, paging_state=None, execution_profile=EXEC_PROFILE_DEFAULT):
+        stmt, parameters = self._statement(cql_qry, execution_profile=execution_profile)
+        stmt.fetch_size = page_size
+        result = _execute_query(self.session, stmt, parameters=parameters, paging_state=paging_state, execution_profile=execution_profile)
+        if self.metrics.enabled:
+            self.metrics.record_rows(lower(cql_qry.query.table), len(result.current_rows))
+        return result
+
+    @gen.coroutine
+    def _execute_page_async(self, cql_qry, page_size, paging_state=None, execution_profile=EXEC_PROFILE_DEFAULT):
+        stmt, parameters = self._statement(cql_qry, execution_profile=execution_profile)
+        stmt.fetch_size = page_size
+        result = yield _execute_page_async(self.session, stmt, parameters=parameters, paging_state=paging_state, execution_profile=execution_profile)
+        if self.metrics.enabled:
+            self.metrics.record_rows(lower(cql_qry.query.table), len(result.current_rows))
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def _execute_async(self, cql_qry, serial_consistency_level=None, execution_profile=EXEC_PROFILE_DEFAULT):
+        stmt, parameters = self._statement(cql_qry, serial_consistency_level=serial_consistency_level, execution_profile=execution_profile)
+        result = yield _execute_query_async(self.session, stmt, parameters=parameters, execution_profile=execution_profile)
+        raise gen.Return(result)
+    execute_async = _execute_async
+
+    @gen.coroutine
+    def _execute_batch_async(self, batch, execution_profile=EXEC_PROFILE_DEFAULT):
+        if self.metrics.enabled:
+            self.metrics.record_batch(len(batch))
+        result = yield _execute_query_async(self.session, batch, execution_profile=execution_profile)
+
+        self._check_batch_applied(result)
+        raise gen.Return(result)
+    execute_batch_async = _execute_batch_async
+
+    @gen.coroutine
+    def _execute_batches_async(self, batches, execution_profile=EXEC_PROFILE_DEFAULT):
+        concurrency = self.settings['write_concurrency']
+        for start in xrange(0, len(batches), concurrency):
+            yield [self._execute_batch_async(batch, execution_profile=execution_profile) for batch in batches[start:start + concurrency]]
+
     @staticmethod
     def _construct_primary_key(model, metadata):
         fields = {}
@@ -112,7 +364,7 @@ class CassandraRepository(Repository):
             if isinstance(value, Key):
                 value = value.urlsafe()
             elif value is not None:
-                value = CassandraRepository._cassandra_type_string_to_type(key_part.typestring)(value)
+                value = CassandraRepository._cassandra_type_string_to_type(column_type(key_part))(value)
             fields[key_part.name] = value
 
         return fields
@@ -125,15 +377,15 @@ class CassandraRepository(Repository):
     validate_model = __validate_model
 
     @staticmethod
-    def _cassandra_type_string_to_type(type_string):
-        type_map = {
-            'text': str,
-            'int': int
-        }
+    def __validate_writable(model):
+        if model._db_projection:
+            raise ModelValidationException('%s was fetched with the projection %r, writing it would reset the other properties' % (model.__class__.__name__, model._db_projection))
 
-        assert type_string in type_map, 'Unknown type_string "%s"' % type_string
+    @staticmethod
+    def _cassandra_type_string_to_type(type_string):
+        assert type_string in CASSANDRA_TYPE_MAP, 'Unknown type_string "%s"' % type_string
 
-        return type_map[type_string]
+        return CASSANDRA_TYPE_MAP[type_string]
 
     @staticmethod
     def denormalize(model):
@@ -142,192 +394,998 @@ class CassandraRepository(Repository):
 
         return model.entity_to_db()
 
-    def set_edges_for_model(self, model, new_edges=None, existing_edges=None):
-        assert new_edges
-        if not existing_edges:
-            existing_edges = []
+    @staticmethod
+    def _edge_id(edge):
+        if isinstance(edge, tuple):
+            return edge
+        if isinstance(edge, dict):
+            label, outdoc = edge['label'], edge['outdoc']
+        else:
+            label, outdoc = edge.label, edge.outdoc
+        return label, outdoc.urlsafe() if isinstance(outdoc, Key) else outdoc
 
-        model_edges_combinations = dict([('%s-%s' % (e.label, e.outdoc.urlsafe()), e) for e in existing_edges])
+    @staticmethod
+    def _edge_deletes(model, edge_ids):
+        return [{'indoc': model.key.urlsafe(), 'label': label, 'outdoc': outdoc} for label, outdoc in sorted(edge_ids)]
 
-        for edge in new_edges:
-            combinations_id = '%s-%s' % (edge.label, edge.outdoc)
-            if not combinations_id in model_edges_combinations:
+    @staticmethod
+    def _diff_edges(model, new_edges, existing_edges=None):
+        """
+        Diff the edges found on ``model`` against the stored ones as sets of (label, outdoc) pairs.
+        ``existing_edges`` may hold edge models, edge rows or pairs. Returns the edges to insert
+        and the edges to delete, an unchanged model gives neither.
+        """
+        existing = set([CassandraRepository._edge_id(edge) for edge in existing_edges or []])
+        found = OrderedDict([(CassandraRepository._edge_id(edge), edge) for edge in new_edges])
+
+        inserts = []
+        for edge_id, edge in found.items():
+            if edge_id not in existing:
                 edge.indoc = model.key
-                self.insert_edge(edge)
-            else:
-                del model_edges_combinations[combinations_id]
-        self.delete_edge(model_edges_combinations.values())
+                inserts.append(edge)
+        return inserts, CassandraRepository._edge_deletes(model, existing.difference(found))
+
+    @instrumented('set_edges', table=_model_table)
+    def set_edges_for_model(self, model, new_edges=None, existing_edges=None, execution_profile=WRITE_PROFILE):
+        model = _built(model)
+        assert new_edges
+        inserts, deletes = self._diff_edges(model, new_edges, existing_edges)
+
+        for edge in inserts:
+            self.insert_edge(edge, execution_profile=execution_profile)
+        self.delete_edge(deletes, execution_profile=execution_profile)
+
+    @instrumented('set_edges', table=_model_table)
+    @gen.coroutine
+    def set_edges_for_model_async(self, model, new_edges=None, existing_edges=None, execution_profile=WRITE_PROFILE):
+        model = _built(model)
+        assert new_edges
+        inserts, deletes = self._diff_edges(model, new_edges, existing_edges)
+
+        futures = [self._execute_edge_queries_async(self._insert_edge_queries(edge), execution_profile=execution_profile) for edge in inserts]
+        if deletes:
+            futures.append(self.delete_edge_async(deletes, execution_profile=execution_profile))
+        yield futures
+
+    def _get_key_paths(self, model_cls):
+        key_paths = self._key_paths.get(model_cls)
+        if key_paths is None:
+            key_paths = self._key_paths[model_cls] = compile_key_paths(model_cls)
+        return key_paths
 
     def find_edges(self, model):
+        model = _built(model)
         def edge(label, outdoc):
             return self._edge_model(**{
                 'label': label,
-                'outdoc': outdoc
+                'outdoc': outdoc.key if isinstance(outdoc, Model) else outdoc
             })
 
-        def find(obj, node, path, edges):
-            for name in node:
-                current_path = path + [name]
-                attr = obj._attributes_map.get(name) if isinstance(obj, AttributesProperty) else getattr(obj, name)
-                if isinstance(attr, AttributesProperty):
-                    value = attr._get_value(model)
-                    if isinstance(value, list):
-                        for item in value:
-                            find(attr, item.keys(), current_path, edges)
-                    else:
-                        find(attr, value._attributes_map.keys(), current_path, edges)
-                if isinstance(attr, KeyProperty):
-                    if attr._repeated:
-                        for value in attr._get_value(model):
-                            if value is not None:
-                                edges.append(edge('.'.join(current_path), value.key if isinstance(value, Model) else value))
-                    else:
-                        value = attr._get_value(model)
-                        if value is not None:
-                            edges.append(edge('.'.join(current_path), value.key if isinstance(value, Model) else value))
-
         found_edges = []
-        find(model.__class__, ifilter(lambda x: x != model.__class__._key_property_name, set(dir(model.__class__))), [], found_edges)
-        sorted(found_edges)
+        for key_path in self._get_key_paths(model.__class__):
+            # Keys below a repeated AttributesProperty only exist when it has items.
+            if key_path.repeated_parents and not all(parent._get_value(model) for parent in key_path.repeated_parents):
+                continue
+
+            value = key_path.prop._get_value(model)
+            if key_path.repeated:
+                for item in value or []:
+                    if item is not None:
+                        found_edges.append(edge(key_path.label, item))
+            elif value is not None:
+                found_edges.append(edge(key_path.label, value))
+
         return dict([('%s-%s' % (e.label, e.outdoc.urlsafe()), e) for e in found_edges]).values()
 
-    def fetch(self, query, fields=None):
-        result = []
-        cql_qry = CassandraQuery(query).select()
-        rows = self._execute(cql_qry)
+    def _walk_references(self, walks, lookup):
+        # The walk inherited from furryninja's Repository finds the keys, every get it makes is answered by lookup.
+        walker = _ReferenceWalker(self, lookup)
+        for model, fields in walks:
+            walker.resolve_referenced_keys(model, fields=fields)
 
+    def _referenced_keys(self, walks, loaded):
+        pending = OrderedDict()
+
+        def discover(walker, model, fields):
+            if model.key.urlsafe() not in loaded:
+                key, walked_fields = pending.setdefault(model.key.urlsafe(), (model.key, []))
+                if fields not in walked_fields:
+                    walked_fields.append(fields)
+            raise QueryNotFoundException
+
+        self._walk_references(walks, discover)
+        return pending
+
+    @staticmethod
+    def _loaded_walks(pending, loaded):
+        # The models just loaded are walked as get would, their own references come in the next batch.
+        walks = []
+        for urlsafe_key, (key, walked_fields) in pending.iteritems():
+            model_data = loaded.setdefault(urlsafe_key, None)
+            if model_data is not None:
+                walks.extend([(Model._lookup_model(key.kind)(**model_data), fields) for fields in walked_fields])
+        return walks
+
+    def _attach_referenced_models(self, models, fields, loaded):
+        def attach(walker, model, fields):
+            model_data = loaded.get(model.key.urlsafe())
+            if model_data is None:
+                raise QueryNotFoundException
+            model.populate(**model_data)
+            model._track_db_data(model_data)
+            walker.resolve_referenced_keys(model, fields=fields)
+            return model
+
+        self._walk_references([(model, fields) for model in models], attach)
+
+    def _referenced_key_queries(self, keys):
+        groups = OrderedDict()
+        for key in keys:
+            model_cls = Model._lookup_model(key.kind)
+            probe = model_cls(key=key.urlsafe())
+
+            key_parts = []
+            for field in self._get_primary_key_fields(probe):
+                if field != 'key':
+                    value = getattr(probe, field)
+                    key_parts.append((field, value.urlsafe() if isinstance(value, Key) else value))
+            groups.setdefault((model_cls, tuple(key_parts)), []).append(key.urlsafe())
+
+        # Chunks are only told apart by their IN values, a short last chunk prepares no statement of its own.
+        batch_size = self.settings['reference_batch_size']
+        for (model_cls, key_parts), urlsafe_keys in groups.iteritems():
+            for index in xrange(0, len(urlsafe_keys), batch_size):
+                chunk = urlsafe_keys[index:index + batch_size]
+                where = [getattr(model_cls, field) == value for field, value in key_parts]
+                where.append(model_cls.key.IN(chunk))
+                yield CassandraQuery(model_cls.query(*where)).select()
+
+    def _collect_referenced_models(self, rows, loaded):
+        for referenced in self._models_from_rows(rows):
+            loaded[referenced.key.urlsafe()] = referenced
+
+    def _collect_referenced_data(self, rows, loaded):
+        columns = row_columns(rows)
         for row in rows:
-            model_cls = Model._lookup_model(Key.from_string(row['key']).kind)
-            model_data = model_cls._db_to_storage_type(row)
-            model = model_cls(**model_data)
-            self.resolve_referenced_keys(model, fields=fields)
-            result.append(model)
-        return result
+            model_cls = Model._lookup_model(Key.from_string(row_value(row, columns, 'key')).kind)
+            loaded[row_value(row, columns, 'key')] = self._model_data(model_cls, row, columns)
+
+    def resolve_referenced_keys_multi(self, models, fields=None, execution_profile=READ_PROFILE):
+        """
+        Resolve the referenced keys of ``models`` as furryninja's Repository does, with the
+        keys of every level loaded together in IN queries of db.reference_batch_size keys.
+        """
+        models = [_built(model) for model in models]
+        loaded = {}
+        pending = self._referenced_keys([(model, fields) for model in models], loaded)
+        if not pending:
+            return models
+
+        while pending:
+            for cql_qry in self._referenced_key_queries([key for key, _ in pending.values()]):
+                self._collect_referenced_data(self._execute(cql_qry, execution_profile=execution_profile), loaded)
+            pending = self._referenced_keys(self._loaded_walks(pending, loaded), loaded)
+        self._attach_referenced_models(models, fields, loaded)
+        return models
 
-    def get(self, model, fields=None):
-        self.__validate_model(model)
+    def resolve_referenced_keys(self, model, fields=None, execution_profile=READ_PROFILE):
+        model = _built(model)
+        self.resolve_referenced_keys_multi([model], fields=fields, execution_profile=execution_profile)
+        return model
 
-        query = model.query(*[getattr(model.__class__, field) == getattr(model, field) for field in self._get_primary_key_fields(model)]).limit(1)
-        cql_qry = CassandraQuery(query).select()
-        rows = self._execute(cql_qry)
+    @gen.coroutine
+    def resolve_referenced_keys_multi_async(self, models, fields=None, execution_profile=READ_PROFILE):
+        models = [_built(model) for model in models]
+        loaded = {}
+        pending = self._referenced_keys([(model, fields) for model in models], loaded)
+        if not pending:
+            raise gen.Return(models)
+
+        while pending:
+            results = yield [self._execute_async(cql_qry, execution_profile=execution_profile) for cql_qry in self._referenced_key_queries([key for key, _ in pending.values()])]
+            for rows in results:
+                self._collect_referenced_data(rows, loaded)
+            pending = self._referenced_keys(self._loaded_walks(pending, loaded), loaded)
+        self._attach_referenced_models(models, fields, loaded)
+        raise gen.Return(models)
+
+    @gen.coroutine
+    def resolve_referenced_keys_async(self, model, fields=None, execution_profile=READ_PROFILE):
+        model = _built(model)
+        yield self.resolve_referenced_keys_multi_async([model], fields=fields, execution_profile=execution_profile)
+        raise gen.Return(model)
+
+    def _primary_key_query(self, model):
+        return model.query(*self._table_plan(model).primary_key_filters(model)).limit(1)
+
+    @staticmethod
+    def _model_data(model_cls, row, columns=None):
+        if columns is None:
+            return model_cls._db_to_storage_type(row)
+        return model_cls._db_values_to_storage_type(row, columns)
+
+    def _model_from_row(self, row, columns=None):
+        model_cls = Model._lookup_model(Key.from_string(row_value(row, columns, 'key')).kind)
+        model = model_cls(**self._model_data(model_cls, row, columns))
+        model._track_db_row(row, columns)
+        return model
 
+    def _models_from_rows(self, rows):
+        columns = row_columns(rows)
+        return [self._model_from_row(row, columns) for row in rows]
+
+    def _lazy_models_from_rows(self, rows, projection=None, projected_columns=False):
+        columns = row_columns(rows)
+
+        def lazy_model(row):
+            model_cls = Model._lookup_model(Key.from_string(row_value(row, columns, 'key')).kind)
+            if model_cls._storage_type[0] == 'simple':
+                model = self._model_from_row(row, columns)
+                if projected_columns:
+                    model._db_projection = projection
+                return model
+            return LazyModel(model_cls, lambda: self._model_data(model_cls, row, columns), projection=projection)
+        return [lazy_model(row) for row in rows]
+
+    def _projected_columns(self, query, projection):
+        plan = self._table_plan_for_table(query.table)
+        if not projection or not set(projection).issubset(plan.columns):
+            return None
+        selected = list(plan.primary_key)
+        for name in ['key'] + projection:
+            if name in plan.columns and name not in selected:
+                selected.append(name)
+        return selected
+
+    @staticmethod
+    def _fetch_page_size(query):
+        # Pages are cut by the driver's fetch size, the statement has no LIMIT to count across pages.
+        assert not query.offset(), 'Cassandra has no OFFSET, continue from the cursor of the previous page instead'
+        return query.limit() or DEFAULT_PAGE_SIZE
+
+    @instrumented('fetch', table=_query_table)
+    def fetch(self, query, fields=None, lazy=False, cursor=None, execution_profile=READ_PROFILE):
+        """
+        A page of the models matching ``query``, ``query.limit()`` of them, starting after
+        ``cursor`` if given. The ModelPage returned carries the cursor of the next page in
+        ``cursor``, None on the last page. Cursors are urlsafe strings, only a query with the
+        same statement and values accepts them.
+
+        With ``lazy`` the models are built on first access and referenced keys are left
+        unresolved, ``fields`` only picks the properties to build then.
+        """
+        page_size = self._fetch_page_size(query)
+        if not lazy:
+            cql_qry = CassandraQuery(query).select(paged=True)
+            result = self._execute_page(cql_qry, page_size, paging_state=decode_cursor(cql_qry, cursor), execution_profile=execution_profile)
+
+            page = ModelPage(self._models_from_rows(result.current_rows), encode_cursor(cql_qry, result.paging_state))
+            return self.resolve_referenced_keys_multi(page, fields=fields, execution_profile=execution_profile)
+
+        projection = list(OrderedDict.fromkeys([field.split('.')[0] for field in fields])) if fields else None
+        columns = self._projected_columns(query, projection)
+        cql_qry = CassandraQuery(query).select(columns, paged=True)
+        result = self._execute_page(cql_qry, page_size, paging_state=decode_cursor(cql_qry, cursor), execution_profile=execution_profile)
+
+        return ModelPage(self._lazy_models_from_rows(result.current_rows, projection=projection, projected_columns=columns is not None), encode_cursor(cql_qry, result.paging_state))
+
+    def iter_fetch(self, query, fields=None, page_size=DEFAULT_PAGE_SIZE, paging_state=None, cursor=None, execution_profile=READ_PROFILE):
+        cql_qry = CassandraQuery(query).select(paged=True)
+        return ModelPager(self, cql_qry, fields=fields, page_size=page_size, paging_state=paging_state, cursor=cursor, execution_profile=execution_profile)
+
+    @instrumented('fetch', table=_query_table)
+    @gen.coroutine
+    def fetch_async(self, query, fields=None, cursor=None, execution_profile=READ_PROFILE):
+        cql_qry = CassandraQuery(query).select(paged=True)
+        result = yield self._execute_page_async(cql_qry, self._fetch_page_size(query), paging_state=decode_cursor(cql_qry, cursor), execution_profile=execution_profile)
+
+        page = ModelPage(self._models_from_rows(result.current_rows), encode_cursor(cql_qry, result.paging_state))
+        yield self.resolve_referenced_keys_multi_async(page, fields=fields, execution_profile=execution_profile)
+        raise gen.Return(page)
+
+    def _entity_cache_key(self, model):
+        plan = self._table_plan(model)
+        values = self._primary_key_values(model, plan)
+        return plan.table_name, tuple([values.get(name) for name in plan.primary_key])
+
+    def _cached_model_data(self, model):
+        if self.entity_cache is None:
+            return None, None
+
+        model_data = self.entity_cache.get(self._entity_cache_key(model))
+        if model_data is MISSING:
+            raise QueryNotFoundException
+        return model_data, self.entity_cache.generation
+
+    def _model_data_from_get(self, model, rows, generation=None):
+        # Indexing a driver ResultSet swaps its rows for a plain list, read the column index first.
+        columns = row_columns(rows)
+        rows = getattr(rows, 'current_rows', rows)
+        if self.metrics.enabled:
+            self.metrics.record_rows(lower(model.table()), 1 if rows else 0)
         if not rows:
+            if self.entity_cache is not None:
+                self.entity_cache.set_missing(self._entity_cache_key(model), generation=generation)
             raise QueryNotFoundException
 
-        row = rows[0]
-        model_data = model.__class__._db_to_storage_type(row)
+        model_data = self._model_data(model.__class__, rows[0], columns)
+        if self.entity_cache is not None:
+            self.entity_cache.set(self._entity_cache_key(model), model_data, ttl=model._cache_ttl, generation=generation)
+        return model_data
+
+    def _invalidate_cached(self, models):
+        if self.entity_cache is not None:
+            for model in models:
+                self.entity_cache.invalidate(self._entity_cache_key(model))
+
+    def _get_query(self, model):
+        return CassandraQuery(self._primary_key_query(model)).select()
+
+    @instrumented('get', table=_model_table)
+    def get(self, model, fields=None, execution_profile=READ_PROFILE):
+        model = _built(model)
+        self.__validate_model(model)
+
+        model_data, generation = self._cached_model_data(model)
+        if model_data is None:
+            rows = self._execute(self._get_query(model), execution_profile=execution_profile)
+            model_data = self._model_data_from_get(model, rows, generation=generation)
+
         model.populate(**model_data)
-        self.resolve_referenced_keys(model, fields=fields)
+        model._track_db_data(model_data)
+        self.resolve_referenced_keys(model, fields=fields, execution_profile=execution_profile)
         return model
 
-    def delete(self, model):
+    @instrumented('get', table=_model_table)
+    @gen.coroutine
+    def get_async(self, model, fields=None, execution_profile=READ_PROFILE):
+        model = _built(model)
         self.__validate_model(model)
 
-        edge_query = self._edge_model.query(self._edge_model.indoc == model.key)
-        cql_qry = CassandraQuery(edge_query).select()
+        model_data, generation = self._cached_model_data(model)
+        if model_data is None:
+            rows = yield self._execute_async(self._get_query(model), execution_profile=execution_profile)
+            model_data = self._model_data_from_get(model, rows, generation=generation)
+
+        model.populate(**model_data)
+        model._track_db_data(model_data)
+        yield self.resolve_referenced_keys_async(model, fields=fields, execution_profile=execution_profile)
+        raise gen.Return(model)
+
+    def _get_multi_pending(self, models):
+        result = [None] * len(models)
+        pending = []
+        for index, model in enumerate(models):
+            self.__validate_model(model)
+
+            try:
+                model_data, _ = self._cached_model_data(model)
+            except QueryNotFoundException:
+                continue
+
+            if model_data is None:
+                pending.append(index)
+            else:
+                model.populate(**model_data)
+                model._track_db_data(model_data)
+                result[index] = model
+        return result, pending
+
+    def _populate_from_get(self, model, rows, generation=None):
+        try:
+            model_data = self._model_data_from_get(model, rows, generation=generation)
+        except QueryNotFoundException:
+            return None
+
+        model.populate(**model_data)
+        model._track_db_data(model_data)
+        return model
+
+    @instrumented('get_multi', table=_models_table)
+    def get_multi(self, models, fields=None, execution_profile=READ_PROFILE):
+        """
+        Load ``models`` by primary key with at most ``db.read_concurrency`` queries in flight.
+        Returns the models in the given order, with None for every model that was not found.
+        """
+        models = [_built(model) for model in models]
+        generation = self.entity_cache.generation if self.entity_cache is not None else None
+        result, pending = self._get_multi_pending(models)
+
+        if pending:
+            statements = [self._statement(self._get_query(models[index]), execution_profile=execution_profile) for index in pending]
+            results = _execute_concurrent(self.session, statements, self.settings['read_concurrency'], execution_profile=execution_profile)
+            for index, rows in zip(pending, results):
+                result[index] = self._populate_from_get(models[index], rows, generation=generation)
+
+        self.resolve_referenced_keys_multi([model for model in result if model is not None], fields=fields, execution_profile=execution_profile)
+        return result
+
+    @instrumented('get_multi', table=_models_table)
+    @gen.coroutine
+    def get_multi_async(self, models, fields=None, execution_profile=READ_PROFILE):
+        models = [_built(model) for model in models]
+        generation = self.entity_cache.generation if self.entity_cache is not None else None
+        result, pending = self._get_multi_pending(models)
+
+        concurrency = self.settings['read_concurrency']
+        for start in xrange(0, len(pending), concurrency):
+            window = pending[start:start + concurrency]
+            results = yield [self._execute_async(self._get_query(models[index]), execution_profile=execution_profile) for index in window]
+            for index, rows in zip(window, results):
+                result[index] = self._populate_from_get(models[index], rows, generation=generation)
 
-        existing_edges = self._execute(cql_qry)
-        self.delete_edge(existing_edges)
+        yield self.resolve_referenced_keys_multi_async([model for model in result if model is not None], fields=fields, execution_profile=execution_profile)
+        raise gen.Return(result)
 
-        query = model.query(*[getattr(model.__class__, field) == getattr(model, field) for field in self._get_primary_key_fields(model)]).limit(1)
-        cql_qry = CassandraQuery(query).delete()
-        self._execute(cql_qry)
+    def _existing_edges_query(self, model):
+        # Only the pairs the edge diff works on, from the single edge partition of the model.
+        return CassandraQuery(self._edge_model.query(self._edge_model.indoc == model.key)).select(['label', 'outdoc'], paged=True)
+
+    @staticmethod
+    def _edge_ids(rows):
+        columns = row_columns(rows)
+        return set([(row_value(row, columns, 'label'), row_value(row, columns, 'outdoc')) for row in rows])
+
+    def _existing_edges(self, model, execution_profile=WRITE_PROFILE):
+        return self._edge_ids(self._execute(self._existing_edges_query(model), execution_profile=execution_profile))
+
+    @gen.coroutine
+    def _existing_edges_async(self, model, execution_profile=WRITE_PROFILE):
+        rows = yield self._execute_async(self._existing_edges_query(model), execution_profile=execution_profile)
+        raise gen.Return(self._edge_ids(rows))
+
+    @instrumented('delete', table=_model_table)
+    def delete(self, model, execution_profile=WRITE_PROFILE):
+        model = _built(model)
+        self.__validate_model(model)
 
-    def delete_edge(self, models):
+        existing_edges = self._existing_edges(model, execution_profile=execution_profile)
+        self.delete_edge(self._edge_deletes(model, existing_edges), execution_profile=execution_profile)
+
+        cql_qry = CassandraQuery(self._primary_key_query(model)).delete()
+        self._execute(cql_qry, execution_profile=execution_profile)
+        self._invalidate_cached([model])
+
+    @instrumented('delete', table=_model_table)
+    @gen.coroutine
+    def delete_async(self, model, execution_profile=WRITE_PROFILE):
+        model = _built(model)
+        self.__validate_model(model)
+
+        existing_edges = yield self._existing_edges_async(model, execution_profile=execution_profile)
+        yield self.delete_edge_async(self._edge_deletes(model, existing_edges), execution_profile=execution_profile)
+
+        cql_qry = CassandraQuery(self._primary_key_query(model)).delete()
+        yield self._execute_async(cql_qry, execution_profile=execution_profile)
+        self._invalidate_cached([model])
+
+    def _delete_edge_query(self, edge):
+        if isinstance(edge, dict):
+            edge = self._edge_model(**edge)
+        return CassandraQuery(self._edge_model.query(self._edge_model.indoc == edge.indoc, self._edge_model.outdoc == edge.outdoc, self._edge_model.label == edge.label)).delete()
+
+    @instrumented('delete_edge', table=_edge_table)
+    def delete_edge(self, models, execution_profile=WRITE_PROFILE):
         if models and self.settings['protocol_version'] >= 2:
             batch = BatchStatement()
             for edge in models:
-                if isinstance(edge, dict):
-                    edge = self._edge_model(**edge)
-                cql_qry = CassandraQuery(self._edge_model.query(self._edge_model.indoc == edge.indoc, self._edge_model.outdoc == edge.outdoc, self._edge_model.label == edge.label)).delete()
-                batch.add(cql_qry.statement, parameters=cql_qry.condition_values)
+                for cql_qry in self._delete_edge_queries(edge):
+                    self._add_to_batch(batch, cql_qry)
 
-            self._execute_batch(batch)
+            self._execute_batch(batch, execution_profile=execution_profile)
         elif models:
             for edge in models:
-                if isinstance(edge, dict):
-                    edge = self._edge_model(**edge)
-                cql_qry = CassandraQuery(self._edge_model.query(self._edge_model.indoc == edge.indoc, self._edge_model.outdoc == edge.outdoc, self._edge_model.label == edge.label)).delete()
-                self._execute(cql_qry)
+                for cql_qry in self._delete_edge_queries(edge):
+                    self._execute(cql_qry, execution_profile=execution_profile)
+
+    @instrumented('delete_edge', table=_edge_table)
+    @gen.coroutine
+    def delete_edge_async(self, models, execution_profile=WRITE_PROFILE):
+        if models and self.settings['protocol_version'] >= 2:
+            batch = BatchStatement()
+            for edge in models:
+                for cql_qry in self._delete_edge_queries(edge):
+                    self._add_to_batch(batch, cql_qry)
 
-    def insert_edge(self, model):
-        cql_qry = CassandraQuery(self._edge_model.query()).insert({
+            yield self._execute_batch_async(batch, execution_profile=execution_profile)
+        elif models:
+            yield [self._execute_async(cql_qry, execution_profile=execution_profile) for edge in models for cql_qry in self._delete_edge_queries(edge)]
+
+    def _delete_edge_queries(self, edge):
+        if isinstance(edge, dict):
+            edge = self._edge_model(**edge)
+
+        queries = [self._delete_edge_query(edge)]
+        if self.settings['reverse_edges']:
+            reverse_edge = self._reverse_edge_model
+            queries.append(CassandraQuery(reverse_edge.query(reverse_edge.outdoc == edge.outdoc, reverse_edge.label == edge.label, reverse_edge.indoc == edge.indoc)).delete())
+        return queries
+
+    @staticmethod
+    def _edge_values(model):
+        return {
             'key': model.key.urlsafe(),
             'label': model.label,
             'indoc': model.indoc.urlsafe(),
             'outdoc': model.outdoc.urlsafe()
-        })
+        }
 
-        self._execute(cql_qry)
+    def _insert_edge_query(self, model):
+        return CassandraQuery(self._edge_model.query()).insert(self._edge_values(model))
 
-    def __insert(self, models, if_not_exists=None):
-        assert models, 'You can insert nothing, what good would that do?'
+    def _insert_reverse_edge_query(self, values):
+        return CassandraQuery(self._reverse_edge_model.query()).insert(values)
 
-        serial_consistency_level = None
-        if if_not_exists:
-            serial_consistency_level = ConsistencyLevel.SERIAL
+    def _insert_edge_queries(self, model):
+        queries = [self._insert_edge_query(model)]
+        if self.settings['reverse_edges']:
+            queries.append(self._insert_reverse_edge_query(self._edge_values(model)))
+        return queries
 
-        batch = BatchStatement(serial_consistency_level=serial_consistency_level)
+    def _edge_batch(self, queries):
+        # The edge and its reverse edge are in different partitions, a logged batch keeps them in step.
+        if len(queries) > 1 and self.settings['protocol_version'] >= 2:
+            batch = BatchStatement()
+            for cql_qry in queries:
+                self._add_to_batch(batch, cql_qry)
+            return batch
+        return None
+
+    def _execute_edge_queries(self, queries, execution_profile=WRITE_PROFILE):
+        batch = self._edge_batch(queries)
+        if batch is not None:
+            self._execute_batch(batch, execution_profile=execution_profile)
+        else:
+            for cql_qry in queries:
+                self._execute(cql_qry, execution_profile=execution_profile)
+
+    @gen.coroutine
+    def _execute_edge_queries_async(self, queries, execution_profile=WRITE_PROFILE):
+        batch = self._edge_batch(queries)
+        if batch is not None:
+            yield self._execute_batch_async(batch, execution_profile=execution_profile)
+        else:
+            yield [self._execute_async(cql_qry, execution_profile=execution_profile) for cql_qry in queries]
+
+    @instrumented('insert_edge', table=_edge_table)
+    def insert_edge(self, model, execution_profile=WRITE_PROFILE):
+        self._execute_edge_queries(self._insert_edge_queries(model), execution_profile=execution_profile)
+
+    def _edge_queries(self, model, existing_edges=None):
+        inserts, deletes = self._diff_edges(model, self.find_edges(model), existing_edges)
+        queries = []
+        for edge in inserts:
+            queries.extend(self._insert_edge_queries(edge))
+        for edge in deletes:
+            queries.extend(self._delete_edge_queries(edge))
+        return queries
+
+    def _referrers_query(self, key, label=None):
+        reverse_edge = self._reverse_edge_model
+        where = [reverse_edge.outdoc == key]
+        if label:
+            where.append(reverse_edge.label == label)
+        return CassandraQuery(reverse_edge.query(*where)).select(['label', 'indoc'], paged=True)
 
+    @staticmethod
+    def _referrer_keys(rows):
+        columns = row_columns(rows)
+        keys = OrderedDict()
+        for row in rows:
+            indoc = row_value(row, columns, 'indoc')
+            keys.setdefault(indoc, Key.from_string(indoc))
+        return keys.values()
+
+    def _models_for_keys(self, keys, fields=None, execution_profile=READ_PROFILE):
+        # Loaded with the IN queries of the referenced keys, keys without a model are left out.
+        loaded = {}
+        for cql_qry in self._referenced_key_queries(keys):
+            self._collect_referenced_models(self._execute(cql_qry, execution_profile=execution_profile), loaded)
+
+        models = [loaded[key.urlsafe()] for key in keys if key.urlsafe() in loaded]
+        return self.resolve_referenced_keys_multi(models, fields=fields, execution_profile=execution_profile)
+
+    @gen.coroutine
+    def _models_for_keys_async(self, keys, fields=None, execution_profile=READ_PROFILE):
+        loaded = {}
+        results = yield [self._execute_async(cql_qry, execution_profile=execution_profile) for cql_qry in self._referenced_key_queries(keys)]
+        for rows in results:
+            self._collect_referenced_models(rows, loaded)
+
+        models = [loaded[key.urlsafe()] for key in keys if key.urlsafe() in loaded]
+        yield self.resolve_referenced_keys_multi_async(models, fields=fields, execution_profile=execution_profile)
+        raise gen.Return(models)
+
+    def find_referrers(self, key, label=None, hydrate=False, fields=None, page_size=DEFAULT_PAGE_SIZE, paging_state=None, cursor=None, execution_profile=READ_PROFILE):
+        """
+        Page through the models that reference ``key`` (a Key, a model or an urlsafe key),
+        under ``label`` only if given, from the reverse edge table. The pager yields their
+        keys, or with ``hydrate`` the models, loaded in batches of db.reference_batch_size.
+        """
+        assert self.settings['reverse_edges'], 'find_referrers needs the reverse edge table, set db.reverse_edges'
+        if isinstance(key, Model):
+            key = key.key
+        return ReferrerPager(self, self._referrers_query(key, label=label), hydrate=hydrate, fields=fields, page_size=page_size, paging_state=paging_state, cursor=cursor, execution_profile=execution_profile)
+
+    def rebuild_reverse_edges(self, page_size=500, execution_profile=WRITE_PROFILE):
+        """
+        Write the reverse edge of every edge, for edges written before db.reverse_edges was set.
+        This reads the whole edge table, returns the number of edges written.
+        """
+        assert self.settings['reverse_edges'], 'rebuild_reverse_edges needs db.reverse_edges'
+        cql_qry = CassandraQuery(self._edge_model.query()).select(['key', 'label', 'indoc', 'outdoc'], paged=True)
+
+        count, paging_state = 0, None
+        while True:
+            result = self._execute_page(cql_qry, page_size, paging_state=paging_state, execution_profile=READ_PROFILE)
+            rows = result.current_rows
+            columns = row_columns(rows)
+
+            queries = [self._insert_reverse_edge_query(dict([(name, row_value(row, columns, name)) for name in ['key', 'label', 'indoc', 'outdoc']])) for row in rows]
+            if queries:
+                self._execute_batches(self._partition_batches(queries), execution_profile=execution_profile)
+            count += len(queries)
+
+            paging_state = result.paging_state
+            if not paging_state:
+                return count
+
+    @staticmethod
+    def _urlsafe(key):
+        if isinstance(key, Model):
+            key = key.key
+        return key.urlsafe() if isinstance(key, Key) else key
+
+    def _traversal_query(self, urlsafe_key, labels, max_fan_out):
+        edge_model = self._edge_model
+        query = edge_model.query(edge_model.indoc == urlsafe_key)
+
+        # The label is clustered after outdoc, so labels are filtered here and the partition is read up to the cap.
+        if labels:
+            return CassandraQuery(query).select(['label', 'outdoc'], paged=True)
+        return CassandraQuery(query.limit(max_fan_out)).select(['label', 'outdoc'])
+
+    def _traversal_options(self, keys, labels, depth, max_fan_out):
+        assert depth > 0, 'depth must be a positive integer, got %r' % depth
+        if isinstance(labels, basestring):
+            labels = [labels]
+        frontier = list(OrderedDict.fromkeys([self._urlsafe(key) for key in keys]))
+        return frontier, set(labels or []), int(max_fan_out or self.settings['traversal_max_fan_out'])
+
+    @staticmethod
+    def _next_level(results, labels, max_fan_out, seen):
+        # The keys first reached by this hop, at most max_fan_out edges are followed from a key.
+        level = OrderedDict()
+        for rows in results:
+            columns = row_columns(rows)
+            followed = 0
+            for row in rows:
+                if followed >= max_fan_out:
+                    break
+                if labels and row_value(row, columns, 'label') not in labels:
+                    continue
+
+                followed += 1
+                outdoc = row_value(row, columns, 'outdoc')
+                if outdoc not in seen:
+                    seen.add(outdoc)
+                    level[outdoc] = Key.from_string(outdoc)
+        return level
+
+    @staticmethod
+    def _hydrated_levels(levels, models):
+        loaded = dict([(model.key.urlsafe(), model) for model in models])
+        return [[loaded[key.urlsafe()] for key in level if key.urlsafe() in loaded] for level in levels]
+
+    @instrumented('traverse', table=_edge_table)
+    def traverse(self, keys, labels=None, depth=1, max_fan_out=None, hydrate=False, fields=None, execution_profile=READ_PROFILE):
+        """
+        Follow the edges out of ``keys`` (keys, models or urlsafe keys) for up to ``depth`` hops,
+        only edges with a label in ``labels`` if given. A hop reads the edge partitions of the keys
+        the previous hop reached concurrently. Keys are reached once, cycles end there, and at most
+        ``max_fan_out`` (db.traversal_max_fan_out) edges are followed out of a key.
+
+        Returns a list per hop of the keys it reached, up to the first hop that reaches none,
+        or with ``hydrate`` their models, loaded in batches after the last hop.
+        """
+        frontier, labels, max_fan_out = self._traversal_options(keys, labels, depth, max_fan_out)
+        seen = set(frontier)
+
+        levels = []
+        for _ in xrange(depth):
+            statements = [self._statement(self._traversal_query(key, labels, max_fan_out), execution_profile=execution_profile) for key in frontier]
+            level = self._next_level(_execute_concurrent(self.session, statements, self.settings['read_concurrency'], execution_profile=execution_profile), labels, max_fan_out, seen)
+            if not level:
+                break
+            levels.append(level.values())
+            frontier = level.keys()
+
+        if hydrate:
+            models = self._models_for_keys([key for level in levels for key in level], fields=fields, execution_profile=execution_profile)
+            return self._hydrated_levels(levels, models)
+        return levels
+
+    @instrumented('traverse', table=_edge_table)
+    @gen.coroutine
+    def traverse_async(self, keys, labels=None, depth=1, max_fan_out=None, hydrate=False, fields=None, execution_profile=READ_PROFILE):
+        frontier, labels, max_fan_out = self._traversal_options(keys, labels, depth, max_fan_out)
+        seen = set(frontier)
+        concurrency = self.settings['read_concurrency']
+
+        levels = []
+        for _ in xrange(depth):
+            results = []
+            for start in xrange(0, len(frontier), concurrency):
+                results.extend((yield [self._execute_async(self._traversal_query(key, labels, max_fan_out), execution_profile=execution_profile) for key in frontier[start:start + concurrency]]))
+
+            level = self._next_level(results, labels, max_fan_out, seen)
+            if not level:
+                break
+            levels.append(level.values())
+            frontier = level.keys()
+
+        if hydrate:
+            models = yield self._models_for_keys_async([key for level in levels for key in level], fields=fields, execution_profile=execution_profile)
+            raise gen.Return(self._hydrated_levels(levels, models))
+        raise gen.Return(levels)
+
+    def _edges_batch(self, models, existing_edges=None):
+        batch = BatchStatement()
+        for model in models:
+            for cql_qry in self._edge_queries(model, existing_edges):
+                self._add_to_batch(batch, cql_qry)
+        return batch
+
+    def _unset_nulls(self, fields, clear_fields=None):
+        """
+        Every null that is written leaves a tombstone. Protocol v4 prepared statements bind
+        None as UNSET, which keeps the statement shape, older protocols leave the column
+        out. Only the columns in ``clear_fields`` are written as null.
+        """
+        clear_fields = set(clear_fields or [])
+        bind_unset = self.settings['prepare_statements'] and self.settings['protocol_version'] >= 4
+
+        values = {}
+        for name, value in fields.items():
+            if value is not None or name in clear_fields:
+                values[name] = value
+            elif bind_unset:
+                values[name] = UNSET_VALUE
+        for name in clear_fields:
+            values.setdefault(name, None)
+        return values
+
+    def _partition_of(self, cql_qry):
+        plan = self._table_plan_for_table(cql_qry.query.table)
+        return plan.table_name, tuple([cql_qry.condition_values.get(name) for name in plan.partition_key])
+
+    @staticmethod
+    def _statement_size(cql_qry):
+        # A rough estimate of the mutation size, close enough to stay under batch_size_warn_threshold_in_kb.
+        return sum([len(value) if isinstance(value, basestring) else 8 for value in cql_qry.condition_values.values()])
+
+    def _partition_batches(self, queries, serial_consistency_level=None):
+        groups = OrderedDict()
+        for cql_qry in queries:
+            groups.setdefault(self._partition_of(cql_qry), []).append(cql_qry)
+
+        # A single partition batch is applied atomically without the batchlog. Conditional
+        # batches stay logged, Cassandra does not take conditions on unlogged batches.
+        batch_type = BatchType.LOGGED if serial_consistency_level else BatchType.UNLOGGED
+
+        batches = []
+        for group in groups.values():
+            batch, size = None, 0
+            for cql_qry in group:
+                statement_size = self._statement_size(cql_qry)
+                if batch is None or len(batch) >= self.settings['batch_max_statements'] or size + statement_size > self.settings['batch_max_bytes']:
+                    batch, size = BatchStatement(batch_type=batch_type, serial_consistency_level=serial_consistency_level), 0
+                    batches.append(batch)
+                self._add_to_batch(batch, cql_qry)
+                size += statement_size
+        return batches
+
+    def _insert_batches(self, models, if_not_exists=None, atomic=True):
+        """
+        The batches to write ``models`` and their edges with, as a list of stages.
+        The batches of a stage are independent and may run concurrently, a stage
+        only runs once the one before it has been applied.
+        """
+        assert models, 'You can insert nothing, what good would that do?'
+
+        inserts = []
+        edge_queries = []
         for model in models:
             self.__validate_model(model)
+            self.__validate_writable(model)
 
             model._pre_put_hook()
-            metadata = self._get_table_metadata(model.table())
 
             fields = self.denormalize(model)
-            fields.update(self.construct_primary_key(model, metadata))
+            fields.update(self._primary_key_values(model, self._table_plan(model)))
 
-            cql_qry = CassandraQuery(model.query()).insert(fields)
+            cql_qry = CassandraQuery(model.query()).insert(self._unset_nulls(fields))
             if if_not_exists:
                 cql_qry.if_not_exists()
-            batch.add(cql_qry.statement, parameters=cql_qry.condition_values)
-        self._execute_batch(batch)
+            inserts.append(cql_qry)
+            edge_queries.extend(self._edge_queries(model))
+
+        # A conditional batch can only touch the partition it is conditioned on,
+        # the edges follow in their own batches once the inserts have been applied.
+        if if_not_exists:
+            return [self._partition_batches(inserts, serial_consistency_level=ConsistencyLevel.SERIAL), self._partition_batches(edge_queries)]
+
+        if atomic:
+            batch = BatchStatement()
+            for cql_qry in inserts + edge_queries:
+                self._add_to_batch(batch, cql_qry)
+            return [[batch]]
+        return [self._partition_batches(inserts + edge_queries)]
+
+    def __insert(self, models, if_not_exists=None, atomic=True, execution_profile=WRITE_PROFILE):
+        models = [_built(model) for model in models]
+        # A stage with a batch that was not applied raises once all of its batches have
+        # been answered, the edges, the cache and the hooks are left alone then.
+        for batches in self._insert_batches(models, if_not_exists=if_not_exists, atomic=atomic):
+            if batches:
+                self._execute_batches(batches, execution_profile=execution_profile)
+        self._invalidate_cached(models)
 
         for model in models:
             model._post_put_hook()
 
-            edges = self.find_edges(model)
-            if edges:
-                self.set_edges_for_model(model, edges)
         if len(models) == 1:
             return models[0]
         return models
 
-    def insert(self, model, if_not_exists=None):
-        return self.__insert([model], if_not_exists=if_not_exists)
+    @gen.coroutine
+    def __insert_async(self, models, if_not_exists=None, atomic=True, execution_profile=WRITE_PROFILE):
+        models = [_built(model) for model in models]
+        for batches in self._insert_batches(models, if_not_exists=if_not_exists, atomic=atomic):
+            if batches:
+                yield self._execute_batches_async(batches, execution_profile=execution_profile)
+        self._invalidate_cached(models)
+
+        for model in models:
+            model._post_put_hook()
+
+        if len(models) == 1:
+            raise gen.Return(models[0])
+        raise gen.Return(models)
+
+    @instrumented('insert', table=_model_table)
+    def insert(self, model, if_not_exists=None, execution_profile=WRITE_PROFILE):
+        return self.__insert([model], if_not_exists=if_not_exists, execution_profile=execution_profile)
 
-    def insert_multi(self, models, if_not_exists=None):
-        return self.__insert(models, if_not_exists=if_not_exists)
+    @instrumented('insert', table=_model_table)
+    def insert_async(self, model, if_not_exists=None, execution_profile=WRITE_PROFILE):
+        return self.__insert_async([model], if_not_exists=if_not_exists, execution_profile=execution_profile)
 
-    def update(self, model, update_if=None):
+    @instrumented('insert_multi', table=_models_table)
+    def insert_multi(self, models, if_not_exists=None, atomic=False, execution_profile=WRITE_PROFILE):
+        return self.__insert(models, if_not_exists=if_not_exists, atomic=atomic, execution_profile=execution_profile)
+
+    @instrumented('insert_multi', table=_models_table)
+    def insert_multi_async(self, models, if_not_exists=None, atomic=False, execution_profile=WRITE_PROFILE):
+        return self.__insert_async(models, if_not_exists=if_not_exists, atomic=atomic, execution_profile=execution_profile)
+
+    def _update_query(self, model, update_if=None, clear_fields=None):
         self.__validate_model(model)
+        self.__validate_writable(model)
 
         model._pre_put_hook()
 
+        # Only write the columns that changed since the model was loaded, a conditional
+        # update is still sent to have its condition checked.
+        values = model.entity_to_db()
+        changed = model._db_changed_columns(values)
+        if changed is not None and not changed and not update_if and not clear_fields:
+            return None, None, values
+
         fields = self.denormalize(model)
-        where = []
+        plan = self._table_plan(model)
         serial_consistency_level = None
 
-        for field in self._get_primary_key_fields(model):
+        for field in plan.primary_key:
             if field in fields:
                 del fields[field]
-
-            where.append(getattr(model.__class__, field) == getattr(model, field))
         assert fields.keys(), 'Model has no properties.'
 
-        cql_qry = CassandraQuery(model.query(*where)).update(fields)
+        if changed is not None and not update_if:
+            fields = dict([(name, value) for name, value in fields.items() if name in changed])
+
+        written = self._unset_nulls(fields, clear_fields)
+        if not update_if and not [value for value in written.values() if value is not UNSET_VALUE]:
+            return None, None, values
+
+        # A None left out of the write keeps the old value in the row, the snapshot must not claim it.
+        skipped = set([name for name in fields if written.get(name, UNSET_VALUE) is UNSET_VALUE])
+        values = dict([(name, value) for name, value in values.items() if name not in skipped])
+        fields = written
+
+        cql_qry = CassandraQuery(model.query(*plan.primary_key_filters(model))).update(fields)
         if update_if:
             assert isinstance(update_if, tuple) and len(update_if) == 2, 'update_if should be a tuple (field, value) of length 2'
             cql_qry.update_if(update_if[0], update_if[1])
             serial_consistency_level = ConsistencyLevel.SERIAL
+        return cql_qry, serial_consistency_level, values
 
-        self._execute(cql_qry, serial_consistency_level=serial_consistency_level)
+    @staticmethod
+    def _track_update(model, values, update_if=None):
+        # Whether a conditional update was applied is not known here, so it is not tracked.
+        if update_if:
+            model._db_snapshot = None
+        else:
+            model._track_db_values(values)
+
+    def _update_batch(self, cql_qry, model, existing_edges):
+        batch = self._edges_batch([model], existing_edges)
+        self._add_to_batch(batch, cql_qry)
+        return batch
+
+    @instrumented('update', table=_model_table)
+    def update(self, model, update_if=None, clear_fields=None, execution_profile=WRITE_PROFILE):
+        model = _built(model)
+        cql_qry, serial_consistency_level, values = self._update_query(model, update_if=update_if, clear_fields=clear_fields)
+        if cql_qry is None:
+            model._post_put_hook()
+            return model
 
-        model._post_put_hook()
+        existing_edges = self._existing_edges(model, execution_profile=execution_profile)
 
-        existing_edges = self.fetch(self._edge_model.query(self._edge_model.indoc == model.key))
-        edges = self.find_edges(model)
-        if edges:
-            self.set_edges_for_model(model, edges, existing_edges)
+        if update_if:
+            # A condition that does not hold leaves the edges and the cache alone.
+            result = self._execute(cql_qry, serial_consistency_level=serial_consistency_level, execution_profile=execution_profile)
+            if not self._update_applied(result):
+                self._track_update(model, values, update_if=update_if)
+                model._post_put_hook()
+                return model
+
+            batch = self._edges_batch([model], existing_edges)
+            if batch:
+                self._execute_batch(batch, execution_profile=execution_profile)
+        else:
+            batch = self._update_batch(cql_qry, model, existing_edges)
+            if len(batch) > 1:
+                self._execute_batch(batch, execution_profile=execution_profile)
+            else:
+                self._execute(cql_qry, execution_profile=execution_profile)
+        self._invalidate_cached([model])
+        self._track_update(model, values, update_if=update_if)
+
+        model._post_put_hook()
         return model
+
+    @instrumented('update', table=_model_table)
+    @gen.coroutine
+    def update_async(self, model, update_if=None, clear_fields=None, execution_profile=WRITE_PROFILE):
+        model = _built(model)
+        cql_qry, serial_consistency_level, values = self._update_query(model, update_if=update_if, clear_fields=clear_fields)
+        if cql_qry is None:
+            model._post_put_hook()
+            raise gen.Return(model)
+
+        existing_edges = yield self._existing_edges_async(model, execution_profile=execution_profile)
+
+        if update_if:
+            # A condition that does not hold leaves the edges and the cache alone.
+            result = yield self._execute_async(cql_qry, serial_consistency_level=serial_consistency_level, execution_profile=execution_profile)
+            if not self._update_applied(result):
+                self._track_update(model, values, update_if=update_if)
+                model._post_put_hook()
+                raise gen.Return(model)
+
+            batch = self._edges_batch([model], existing_edges)
+            if batch:
+                yield self._execute_batch_async(batch, execution_profile=execution_profile)
+        else:
+            batch = self._update_batch(cql_qry, model, existing_edges)
+            if len(batch) > 1:
+                yield self._execute_batch_async(batch, execution_profile=execution_profile)
+            else:
+                yield self._execute_async(cql_qry, execution_profile=execution_profile)
+        self._invalidate_cached([model])
+        self._track_update(model, values, update_if=update_if)
+
+        model._post_put_hook()
+        raise gen.Return(model)
@@ -1,27 +1,56 @@
 import copy
 import json
+import os
 import unittest
 from cassandra import ConsistencyLevel
-from pysandraunit.testcasebase import CassandraTestCaseBase
+from cassandra.cluster import Cluster, ResultSet
+from cassandra.query import BatchType, UNSET_VALUE
 import mock
 import pytz
+from tornado.ioloop import IOLoop
 from furryninja import KeyProperty, AttributesProperty, IntegerProperty, StringProperty, Model, Key, key_ref
 from furryninja.model import DateTimeProperty
 from furryninja import Settings
 from furryninja import QueryNotFoundException
 from furryninja_cassandra.query import CassandraQuery
-from .repository import CassandraRepository, Edge
+from .repository import CassandraRepository, Edge, _execute_concurrent
 from .model import CassandraModelMixin
+from .plan import compile_key_paths
+from .cache import EntityCache
+from .connection import connections
+from .exceptions import InvalidCursorException, LightweightTransactionException, ModelValidationException
+from .metrics import Metrics, NullMetrics
+from .memory import memory_cluster
 
 __author__ = 'broken'
 
+SCHEMA_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_config', 'cassandra.schema.cql')
 
-class PYSANDRASettings:
-    PYSANDRA_SCHEMA_FILE_PATH = '/Users/broken/ef/development/furryninja-cassandra/test_config/cassandra.schema.cql'
-    PYSANDRA_TMP_DIR = '/tmp/cassandratmp'
-    PYSANDRA_CASSANDRA_YAML_OPTIONS = {}
 
-CassandraTestCaseBase.set_global_settings(PYSANDRASettings)
+class MemoryCassandraTestCase(object):
+    """
+    Runs the tests against the in-memory backend, every test gets an empty keyspace.
+    """
+    def _start_cassandra(self):
+        self.connection_class = memory_cluster(SCHEMA_FILE_PATH)
+
+    def _clean_cassandra(self):
+        pass
+
+
+# FURRYNINJA_CASSANDRA_TESTS=pysandra runs the tests against an embedded Cassandra instead, CI runs both.
+if os.environ.get('FURRYNINJA_CASSANDRA_TESTS') == 'pysandra':
+    from pysandraunit.testcasebase import CassandraTestCaseBase
+
+    class PYSANDRASettings:
+        PYSANDRA_SCHEMA_FILE_PATH = SCHEMA_FILE_PATH
+        PYSANDRA_TMP_DIR = '/tmp/cassandratmp'
+        PYSANDRA_CASSANDRA_YAML_OPTIONS = {}
+
+    CassandraTestCaseBase.set_global_settings(PYSANDRASettings)
+    CassandraTestCaseBase.connection_class = Cluster
+else:
+    CassandraTestCaseBase = MemoryCassandraTestCase
 
 
 Settings.set('db', {
@@ -140,11 +169,20 @@ class TestCassandraRepository(CassandraTestCaseBase, unittest.TestCase):
     def setUp(self):
 
         self._start_cassandra()
-        self.repo = CassandraRepository()
+        self.repo = CassandraRepository(connection_class=self.connection_class)
 
     def tearDown(self):
+        connections.shutdown()
         self._clean_cassandra()
 
+    def _repository(self, **settings):
+        db = Settings.get('db')
+        Settings.set('db', dict(db, shared_connection=False, **settings))
+        try:
+            return CassandraRepository(connection_class=self.connection_class)
+        finally:
+            Settings.set('db', db)
+
     def test_denormalize(self):
         image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
         expected = dict(IMAGE_ASSET.items() + {'key': image.key.urlsafe()}.items())
@@ -193,6 +231,19 @@ class TestCassandraRepository(CassandraTestCaseBase, unittest.TestCase):
         self.assertEqual(expected[1].label, 'attributes.imageFormat')
         self.assertEqual(expected[2].label, 'attributes.imageType')
 
+    def test_find_edges_compiles_key_paths_once(self):
+        with mock.patch('furryninja_cassandra.repository.compile_key_paths', wraps=compile_key_paths) as compile_paths:
+            self.repo.find_edges(ImageAsset(**copy.deepcopy(IMAGE_ASSET)))
+            edges = self.repo.find_edges(ImageAsset(**copy.deepcopy(IMAGE_ASSET)))
+            self.assertEqual(compile_paths.call_count, 1)
+
+        self.assertEqual(len(edges), 4)
+        self.assertItemsEqual([key_path.label for key_path in self.repo._get_key_paths(ImageAsset)], [
+            'topics',
+            'attributes.imageFormat',
+            'attributes.imageType'
+        ])
+
     def test_find_edges_with_complex_model(self):
         class Entity(Model):
             ref = KeyProperty(kind=Tag)
@@ -235,22 +286,43 @@ class TestCassandraRepository(CassandraTestCaseBase, unittest.TestCase):
         entities = self.repo.fetch(image.query())
         self.assertEqual(len(entities), 1)
 
-    # def test_create_model_if_not_exists(self):
-    #     image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
-    #     image.name = 'Immutable'
-    #     self.repo.insert(image)
-    #
-    #     entities = self.repo.fetch(image.query())
-    #     self.assertEqual(len(entities), 1)
-    #
-    #     image2 = ImageAsset(urlsafe=image.key.urlsafe())
-    #     image2.version = '42'
-    #     image2.name = 'Or is it?'
-    #     self.repo.insert(image2, if_not_exists=True)
-    #
-    #     entities = self.repo.fetch(image.query())
-    #     self.assertEqual(len(entities), 1)
-    #     self.assertEqual(entities[0].name, 'Immutable')
+    def test_create_model_if_not_exists(self):
+        image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
+        image.name = 'Immutable'
+        self.repo.insert(image, if_not_exists=True)
+
+        image2 = ImageAsset(**{'key': image.key.urlsafe(), 'name': 'Or is it?', 'version': '42'})
+        with self.assertRaises(LightweightTransactionException):
+            self.repo.insert(image2, if_not_exists=True)
+
+        entities = self.repo.fetch(image.query())
+        self.assertEqual(len(entities), 1)
+        self.assertEqual(entities[0].name, 'Immutable')
+
+    def test_create_model_if_not_exists_async(self):
+        image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
+        image.name = 'Immutable'
+        IOLoop.current().run_sync(lambda: self.repo.insert_async(image, if_not_exists=True))
+
+        image2 = ImageAsset(**{'key': image.key.urlsafe(), 'name': 'Or is it?'})
+        with self.assertRaises(LightweightTransactionException):
+            IOLoop.current().run_sync(lambda: self.repo.insert_async(image2, if_not_exists=True))
+        self.assertEqual(self.repo.get(image).name, 'Immutable')
+
+    def test_create_model_multi_if_not_exists_writes_no_edges(self):
+        image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
+        self.repo.insert(image)
+        self.assertEqual(len(self.repo.fetch(Edge.query())), 4)
+
+        images = [ImageAsset(**{'key': image.key.urlsafe(), 'title': 'Or is it?'}), ImageAsset(**copy.deepcopy(IMAGE_ASSET))]
+        for insert_multi in [self.repo.insert_multi, lambda models, **kwargs: IOLoop.current().run_sync(lambda: self.repo.insert_multi_async(models, **kwargs))]:
+            with mock.patch.object(ImageAsset, '_post_put_hook') as post_put_hook:
+                with self.assertRaises(LightweightTransactionException):
+                    insert_multi(images, if_not_exists=True)
+                self.assertFalse(post_put_hook.called)
+
+            self.assertEqual(len(self.repo.fetch(Edge.query())), 4)
+            self.assertEqual(self.repo.get(image).title, 'Lorem Ipsum')
 
     def test_create_model_multi(self):
         image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
@@ -299,6 +371,90 @@ class TestCassandraRepository(CassandraTestCaseBase, unittest.TestCase):
         with self.assertRaises(QueryNotFoundException):
             self.repo.get(en)
 
+    def test_get_model_from_entity_cache(self):
+        self.repo.entity_cache = EntityCache()
+        tag = Tag(**{'title': 'Hello, earth!'})
+
+        with self.assertRaises(QueryNotFoundException):
+            self.repo.get(Tag(key=tag.key))
+
+        self.repo.insert(tag)
+        self.assertEqual(self.repo.get(Tag(key=tag.key)).title, 'Hello, earth!')
+
+        with mock.patch.object(self.repo, '_execute') as execute:
+            self.assertEqual(self.repo.get(Tag(key=tag.key)).title, 'Hello, earth!')
+            self.assertFalse(execute.called)
+
+        tag.title = 'Hello, mars!'
+        self.repo.update(tag)
+        self.assertEqual(self.repo.get(Tag(key=tag.key)).title, 'Hello, mars!')
+
+        self.repo.delete(tag)
+        with self.assertRaises(QueryNotFoundException):
+            self.repo.get(Tag(key=tag.key))
+
+        self.assertEqual(self.repo.entity_cache.hits, 1)
+
+    def test_get_multi(self):
+        tags = [Tag(**{'title': 'Tag %d' % index}) for index in xrange(3)]
+        self.repo.insert_multi(tags[:2])
+
+        entities = self.repo.get_multi([Tag(key=tags[1].key), Tag(key=tags[2].key), Tag(key=tags[0].key)])
+        self.assertEqual(entities[0].title, 'Tag 1')
+        self.assertIsNone(entities[1])
+        self.assertEqual(entities[2].title, 'Tag 0')
+
+        entities = IOLoop.current().run_sync(lambda: self.repo.get_multi_async([Tag(key=tags[2].key), Tag(key=tags[0].key)]))
+        self.assertIsNone(entities[0])
+        self.assertEqual(entities[1].title, 'Tag 0')
+
+    def test_get_tuple_hydration(self):
+        repo = self._repository(hydration='tuple')
+        tags = [Tag(**{'title': 'Tag %d' % index}) for index in xrange(2)]
+        video = VideoAsset(**{'title': 'monkey', 'num': 1})
+        repo.insert_multi(tags)
+        repo.insert(video)
+
+        # The sync reads get a driver ResultSet, not a list of rows.
+        with mock.patch.object(repo, '_model_data_from_get', wraps=repo._model_data_from_get) as model_data_from_get:
+            self.assertEqual(repo.get(Tag(key=tags[0].key)).title, 'Tag 0')
+            self.assertIsInstance(model_data_from_get.call_args[0][1], ResultSet)
+        self.assertEqual(repo.get(VideoAsset(key=video.key)).num, 1)
+
+        entities = repo.get_multi([Tag(key=tags[1].key), VideoAsset(key=video.key), Tag(key=tags[0].key)])
+        self.assertEqual([entities[0].title, entities[1].num, entities[2].title], ['Tag 1', 1, 'Tag 0'])
+
+    def test_execution_profiles(self):
+        tag = Tag(**{'title': 'Hello, earth!'})
+
+        with mock.patch.object(self.repo.session, 'execute', wraps=self.repo.session.execute) as execute:
+            self.repo.insert(tag)
+            self.assertEqual(execute.call_args[1]['execution_profile'], 'write')
+
+            self.repo.get(Tag(key=tag.key))
+            self.assertEqual(execute.call_args[1]['execution_profile'], 'read')
+
+            self.repo.get(Tag(key=tag.key), execution_profile='write')
+            self.assertEqual(execute.call_args[1]['execution_profile'], 'write')
+
+    def test_metrics(self):
+        self.assertIsInstance(self.repo.metrics, NullMetrics)
+
+        repo = CassandraRepository(connection_class=self.connection_class, metrics=Metrics())
+        tag = Tag(**{'title': 'Hello, earth!'})
+        repo.insert(tag)
+        repo.get(Tag(key=tag.key))
+        self.assertRaises(QueryNotFoundException, repo.get, Tag(**{'title': 'Hello, mars!'}))
+        repo.fetch(Tag.query())
+
+        snapshot = repo.metrics.snapshot()
+        self.assertEqual(snapshot['insert:tag']['count'], 1)
+        self.assertEqual(snapshot['get:tag']['count'], 2)
+        self.assertEqual(snapshot['get:tag']['errors'], 1)
+        self.assertEqual(snapshot['fetch:tag']['count'], 1)
+        self.assertEqual(snapshot['rows:tag']['count'], 3)
+        self.assertEqual(snapshot['rows:tag']['max'], 1)
+
     def test_get_model_with_blob(self):
         tag = Tag(**{
             'key': 'G9dCxjCen-oJMYWaN2vjn18',
@@ -356,6 +512,112 @@ class TestCassandraRepository(CassandraTestCaseBase, unittest.TestCase):
         video = self.repo.get(video)
         self.assertEqual(video.title, 'Hello, earth!')
 
+    def test_conditional_writes_raise_sync_and_async(self):
+        for hydration in ['ordered_dict', 'tuple']:
+            for update_if_raises in [False, True]:
+                repo = self._repository(hydration=hydration, update_if_raises=update_if_raises)
+
+                video = VideoAsset(**{'title': 'monkey', 'num': 1})
+                repo.insert(video)
+
+                calls = [
+                    (repo.insert, repo.update),
+                    (lambda *args, **kwargs: IOLoop.current().run_sync(lambda: repo.insert_async(*args, **kwargs)),
+                     lambda *args, **kwargs: IOLoop.current().run_sync(lambda: repo.update_async(*args, **kwargs)))
+                ]
+                for insert, update in calls:
+                    with self.assertRaises(LightweightTransactionException):
+                        insert(VideoAsset(**{'key': video.key.urlsafe(), 'num': 2}), if_not_exists=True)
+
+                    video.title = 'Hello, earth!'
+                    if update_if_raises:
+                        with self.assertRaises(LightweightTransactionException):
+                            update(video, update_if=('num', 5))
+                    else:
+                        update(video, update_if=('num', 5))
+                    self.assertEqual(repo.get(VideoAsset(key=video.key)).title, 'monkey')
+
+                    video.title = 'monkey'
+                    update(video, update_if=('num', 1))
+                self.assertEqual(repo.get(video).num, 1)
+
+    def test_update_if_not_applied_writes_no_edges(self):
+        image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
+        self.repo.insert(image)
+
+        image.title = 'Hello, earth!'
+        image.topics = []
+        self.repo.update(image, update_if=('update_token', '1'))
+        IOLoop.current().run_sync(lambda: self.repo.update_async(image, update_if=('update_token', '1')))
+
+        self.assertEqual(len(self.repo._existing_edges(image)), 4)
+        self.assertEqual(self.repo.get(image).title, 'Lorem Ipsum')
+
+    def test_update_writes_changed_columns(self):
+        self.repo.insert(VideoAsset(**{'title': 'monkey', 'num': 1}))
+        video = self.repo.fetch(VideoAsset.query())[0]
+
+        with mock.patch.object(self.repo, '_execute') as execute:
+            self.repo.update(video)
+            self.assertFalse(execute.called)
+
+        video.title = 'Hello, earth!'
+        with mock.patch.object(self.repo, '_execute', wraps=self.repo._execute) as execute:
+            self.repo.update(video)
+            self.assertEqual(execute.call_args[0][0].statement, 'UPDATE videoasset SET title = %(title)s WHERE key = %(key)s')
+
+        video = self.repo.get(VideoAsset(key=video.key))
+        self.assertEqual(video.title, 'Hello, earth!')
+        self.assertEqual(video.num, 1)
+
+    def test_writes_leave_no_tombstones(self):
+        def tombstones(add_to_batch, execute):
+            queries = [call[0][1] for call in add_to_batch.call_args_list] + [call[0][0] for call in execute.call_args_list]
+            return len([value for cql_qry in queries for value in cql_qry.condition_values.values() if value is None])
+
+        video = VideoAsset(**{'title': 'monkey', 'num': None})
+        with mock.patch.object(self.repo, '_add_to_batch', wraps=self.repo._add_to_batch) as add_to_batch, \
+                mock.patch.object(self.repo, '_execute', wraps=self.repo._execute) as execute:
+            self.repo.insert(video)
+
+            video.title = None
+            video.num = 2
+            self.repo.update(video)
+            self.assertEqual(tombstones(add_to_batch, execute), 0)
+
+        video = self.repo.get(VideoAsset(key=video.key))
+        self.assertEqual(video.title, 'monkey')
+        self.assertEqual(video.num, 2)
+
+        video.num = None
+        with mock.patch.object(self.repo, '_execute', wraps=self.repo._execute) as execute:
+            self.repo.update(video, clear_fields=['num'])
+            self.assertEqual(execute.call_args[0][0].condition_values['num'], None)
+        self.assertIsNone(self.repo.get(VideoAsset(key=video.key)).num)
+
+    def test_update_does_not_snapshot_skipped_nulls(self):
+        self.repo.insert(VideoAsset(**{'title': 'monkey', 'num': 1}))
+        video = self.repo.fetch(VideoAsset.query())[0]
+
+        video.title = None
+        video.num = 2
+        self.repo.update(video)
+        self.assertNotIn('title', video._db_snapshot_values())
+        self.assertEqual(video._db_snapshot_values()['num'], 2)
+        self.assertEqual(video._db_changed_columns(), set(['title']))
+
+        untracked = VideoAsset(**{'key': video.key, 'title': None, 'num': 3})
+        self.repo.update(untracked)
+        self.assertNotIn('title', untracked._db_snapshot_values())
+        self.assertEqual(self.repo.get(VideoAsset(key=video.key)).title, 'monkey')
+
+    def test_unset_nulls(self):
+        self.assertDictEqual(self.repo._unset_nulls({'title': 'monkey', 'num': None}), {'title': 'monkey'})
+        self.assertDictEqual(self.repo._unset_nulls({'title': None, 'num': None}, clear_fields=['num']), {'num': None})
+
+        self.repo.settings['protocol_version'] = 4
+        self.assertDictEqual(self.repo._unset_nulls({'title': 'monkey', 'num': None}), {'title': 'monkey', 'num': UNSET_VALUE})
+
     def test_update_edges(self):
         image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
 
@@ -389,6 +651,59 @@ class TestCassandraRepository(CassandraTestCaseBase, unittest.TestCase):
         cql_edges = self.repo.fetch(Edge.query())
         self.assertEqual(len(cql_edges), 4)
 
+    def test_write_model_and_edges_in_one_batch(self):
+        image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
+
+        with mock.patch.object(self.repo, '_execute_batch', wraps=self.repo._execute_batch) as execute_batch:
+            self.repo.insert(image)
+            self.assertEqual(execute_batch.call_count, 1)
+
+        cql_edges = self.repo.fetch(Edge.query())
+        self.assertEqual(len(cql_edges), 4)
+
+        image.attributes.imageFormat = [image.attributes.imageFormat[0]]
+        with mock.patch.object(self.repo, '_execute_batch', wraps=self.repo._execute_batch) as execute_batch:
+            self.repo.update(image)
+            self.assertEqual(execute_batch.call_count, 1)
+
+        cql_edges = self.repo.fetch(Edge.query())
+        self.assertEqual(len(cql_edges), 3)
+
+    def test_insert_multi_splits_batches_by_partition(self):
+        images = [ImageAsset(**copy.deepcopy(IMAGE_ASSET)) for _ in xrange(3)]
+
+        # One batch per image and one for the edges of each image, edges are partitioned by indoc.
+        stages = self.repo._insert_batches(images, atomic=False)
+        self.assertEqual(len(stages), 1)
+        self.assertEqual(len(stages[0]), 6)
+        self.assertTrue(all([batch.batch_type == BatchType.UNLOGGED for batch in stages[0]]))
+
+        self.repo.settings['batch_max_statements'] = 2
+        self.assertEqual(len(self.repo._insert_batches(images, atomic=False)[0]), 9)
+        self.assertEqual(len(self.repo._insert_batches(images, atomic=True)[0]), 1)
+
+        self.repo.insert_multi(images)
+        self.assertEqual(len(self.repo.fetch(ImageAsset.query())), 3)
+        self.assertEqual(len(self.repo.fetch(Edge.query())), 12)
+
+    def test_update_unchanged_edges_writes_no_edges(self):
+        image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
+        self.repo.insert(image)
+
+        existing_edges = self.repo._existing_edges(image)
+        self.assertEqual(len(existing_edges), 4)
+        self.assertEqual(self.repo._edge_queries(image, existing_edges), [])
+
+        with mock.patch.object(self.repo, '_execute_batch') as execute_batch:
+            self.repo.update(image)
+            self.assertFalse(execute_batch.called)
+
+        image.attributes.imageFormat = [image.attributes.imageFormat[0]]
+        inserts, deletes = self.repo._diff_edges(image, self.repo.find_edges(image), existing_edges)
+        self.assertEqual(inserts, [])
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(deletes[0]['indoc'], image.key.urlsafe())
+
     def test_delete_model(self):
         image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
         self.repo.insert(image)
@@ -407,6 +722,63 @@ class TestCassandraRepository(CassandraTestCaseBase, unittest.TestCase):
         cql_edges = self.repo.fetch(Edge.query())
         self.assertEqual(len(cql_edges), 0)
 
+    def test_find_referrers(self):
+        self.repo.settings['reverse_edges'] = True
+        images = [ImageAsset(**copy.deepcopy(IMAGE_ASSET)) for _ in xrange(3)]
+        self.repo.insert_multi(images)
+
+        pager = self.repo.find_referrers('G9dCxjCen-4QD1ydlavEYj4', page_size=2)
+        self.assertItemsEqual([key.urlsafe() for key in pager], [image.key.urlsafe() for image in images])
+        self.assertEqual(len(list(self.repo.find_referrers('G9dCxjCen-4QD1ydlavEYj4', label='topics'))), 0)
+
+        # One IN query loads the referring models of the page, one the keys they reference.
+        with mock.patch.object(self.repo, '_execute', wraps=self.repo._execute) as execute:
+            referrers = list(self.repo.find_referrers('G9dCxjCen-oJMYWaN2vjn18', label='topics', hydrate=True))
+            self.assertEqual(execute.call_count, 2)
+        self.assertEqual([referrer.title for referrer in referrers], ['Lorem Ipsum'] * 3)
+
+        images[0].attributes.imageFormat = [images[0].attributes.imageFormat[1]]
+        self.repo.update(images[0])
+        self.repo.delete(images[1])
+        self.assertEqual([key.urlsafe() for key in self.repo.find_referrers('G9dCxjCen-4QD1ydlavEYj4')], [images[2].key.urlsafe()])
+
+    def test_rebuild_reverse_edges(self):
+        image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
+        self.repo.insert(image)
+
+        self.repo.settings['reverse_edges'] = True
+        self.assertEqual(len(list(self.repo.find_referrers(image.topics[0]))), 0)
+        self.assertEqual(self.repo.rebuild_reverse_edges(page_size=3), 4)
+        self.assertEqual([key.urlsafe() for key in self.repo.find_referrers(image.topics[0])], [image.key.urlsafe()])
+
+    def test_traverse(self):
+        tag_keys = ['G9dCxjCen-oJMYWaN2vjn18', 'G9dCxjCen-4QD1ydlavEYj4', 'G9dCxjCen-P5Ep0LbmbM7yy', 'G9dCxjCen-N5EXYgamnvPVn']
+        image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
+        parent = Tag(**{'title': 'Parent'})
+        self.repo.insert_multi([Tag(**{'key': key, 'title': key}) for key in tag_keys] + [image, parent])
+
+        # imageFormat -> imageType is reached in the first hop already, parent -> image closes a cycle.
+        self.repo.insert_edge(Edge(**{'label': 'parent', 'indoc': tag_keys[1], 'outdoc': tag_keys[3]}))
+        self.repo.insert_edge(Edge(**{'label': 'parent', 'indoc': tag_keys[3], 'outdoc': parent.key.urlsafe()}))
+        self.repo.insert_edge(Edge(**{'label': 'parent', 'indoc': parent.key.urlsafe(), 'outdoc': image.key.urlsafe()}))
+
+        with mock.patch('furryninja_cassandra.repository._execute_concurrent', wraps=_execute_concurrent) as execute_concurrent:
+            levels = self.repo.traverse([image], depth=5)
+            self.assertEqual(execute_concurrent.call_count, 3)
+
+        self.assertItemsEqual([key.urlsafe() for key in levels[0]], tag_keys)
+        self.assertEqual([[key.urlsafe() for key in level] for level in levels[1:]], [[parent.key.urlsafe()]])
+
+        levels = self.repo.traverse([image.key], labels=['attributes.imageType', 'parent'], depth=2, hydrate=True)
+        self.assertEqual([[tag.title for tag in level] for level in levels], [['G9dCxjCen-N5EXYgamnvPVn'], ['Parent']])
+
+        self.assertEqual(len(self.repo.traverse([image], max_fan_out=2)[0]), 2)
+        self.assertEqual(self.repo.traverse([image], labels='missing'), [])
+
+        levels = IOLoop.current().run_sync(lambda: self.repo.traverse_async([image.key.urlsafe()], depth=2))
+        self.assertEqual(len(levels[0]), 4)
+        self.assertEqual(levels[1][0].urlsafe(), parent.key.urlsafe())
+
     def test_fetch_query(self):
         image1 = ImageAsset(**{'title': 'title1'})
         image2 = ImageAsset(**{'title': 'title2'})
@@ -421,6 +793,116 @@ class TestCassandraRepository(CassandraTestCaseBase, unittest.TestCase):
         entities = self.repo.fetch(ImageAsset.query().limit(1))
         self.assertEqual(len(entities), 1)
 
+    def test_fetch_resolves_references_in_batch(self):
+        tag_keys = ['G9dCxjCen-oJMYWaN2vjn18', 'G9dCxjCen-4QD1ydlavEYj4', 'G9dCxjCen-P5Ep0LbmbM7yy', 'G9dCxjCen-N5EXYgamnvPVn']
+        self.repo.insert_multi([Tag(**{'key': key, 'title': key}) for key in tag_keys])
+        self.repo.insert_multi([ImageAsset(**copy.deepcopy(IMAGE_ASSET)) for _ in xrange(3)])
+
+        with mock.patch.object(self.repo, '_execute_page', wraps=self.repo._execute_page) as execute_page, \
+                mock.patch.object(self.repo, '_execute', wraps=self.repo._execute) as execute:
+            entities = self.repo.fetch(ImageAsset.query())
+            self.assertEqual(execute_page.call_count, 1)
+            self.assertEqual(execute.call_count, 1)
+
+        self.assertEqual(len(entities), 3)
+        for entity in entities:
+            self.assertEqual(entity.topics[0].title, 'G9dCxjCen-oJMYWaN2vjn18')
+            self.assertEqual(entity.attributes.imageType[0].title, 'G9dCxjCen-N5EXYgamnvPVn')
+
+        # A short last chunk binds fewer keys to the same statement.
+        self.repo.settings['reference_batch_size'] = 3
+        with mock.patch.object(self.repo, '_execute', wraps=self.repo._execute) as execute:
+            entity = self.repo.get(entities[0])
+            self.assertEqual(execute.call_count, 3)
+            statements = [call[0][0].statement for call in execute.call_args_list[1:]]
+            self.assertEqual(statements[0], statements[1])
+            self.assertNotIn('LIMIT', statements[0])
+        self.assertEqual(entity.topics[0].title, 'G9dCxjCen-oJMYWaN2vjn18')
+
+    def test_fetch_lazy(self):
+        self.repo.insert(ImageAsset(**copy.deepcopy(IMAGE_ASSET)))
+
+        entities = self.repo.fetch(ImageAsset.query(), lazy=True)
+        self.assertFalse(entities[0].is_materialized)
+        self.assertEqual(entities[0].title, 'Lorem Ipsum')
+        self.assertTrue(entities[0].is_materialized)
+
+        entities = self.repo.fetch(ImageAsset.query(), fields=['title'], lazy=True)
+        self.assertFalse(entities[0].is_materialized)
+        self.assertEqual(entities[0].title, 'Lorem Ipsum')
+        self.assertIsNone(entities[0].description)
+
+        image = self.repo.get(self.repo.fetch(ImageAsset.query(), lazy=True)[0])
+        self.assertEqual(image.title, 'Lorem Ipsum')
+
+    def test_fetch_lazy_projection_is_read_only(self):
+        self.repo.insert(ImageAsset(**copy.deepcopy(IMAGE_ASSET)))
+        self.repo.insert(VideoAsset(**{'title': 'monkey', 'num': 1}))
+
+        for model_cls in [ImageAsset, VideoAsset]:
+            entity = self.repo.fetch(model_cls.query(), fields=['title'], lazy=True)[0]
+            entity.title = 'Hello, earth!'
+            with self.assertRaises(ModelValidationException):
+                self.repo.update(entity)
+            with self.assertRaises(ModelValidationException):
+                self.repo.insert(entity)
+            with self.assertRaises(ModelValidationException):
+                IOLoop.current().run_sync(lambda: self.repo.update_async(entity))
+
+        image = self.repo.fetch(ImageAsset.query(), lazy=True)[0]
+        image.title = 'Hello, earth!'
+        self.repo.update(image)
+        self.assertEqual(self.repo.get(image).description, IMAGE_ASSET['description'])
+
+    def test_fetch_lazy_simple_model_projection(self):
+        self.repo.insert(VideoAsset(**{'title': 'monkey', 'num': 1}))
+
+        with mock.patch.object(self.repo, '_execute_page', wraps=self.repo._execute_page) as execute_page:
+            entities = self.repo.fetch(VideoAsset.query(), fields=['title'], lazy=True)
+            self.assertEqual(execute_page.call_args[0][0].statement, 'SELECT key, title FROM videoasset')
+            self.assertEqual(execute_page.call_args[0][1], 50)
+
+        self.assertEqual(entities[0].title, 'monkey')
+        self.assertIsNone(entities[0].num)
+
+    def test_fetch_cursor(self):
+        self.repo.insert_multi([ImageAsset(**{'title': 'title%i' % i}) for i in xrange(5)])
+
+        page = self.repo.fetch(ImageAsset.query().limit(2))
+        self.assertEqual(len(page), 2)
+        self.assertEqual(json.loads(json.dumps(page.cursor)), page.cursor)
+
+        titles = [entity.title for entity in page]
+        while page.cursor:
+            page = self.repo.fetch(ImageAsset.query().limit(2), cursor=page.cursor)
+            titles.extend([entity.title for entity in page])
+        self.assertEqual(sorted(titles), ['title%i' % i for i in xrange(5)])
+
+        page = self.repo.fetch(ImageAsset.query().limit(2))
+        resumed = IOLoop.current().run_sync(lambda: self.repo.fetch_async(ImageAsset.query().limit(2), cursor=page.cursor))
+        self.assertEqual(len(resumed), 2)
+        self.assertFalse(set([entity.key.urlsafe() for entity in page]) & set([entity.key.urlsafe() for entity in resumed]))
+
+        with self.assertRaises(InvalidCursorException):
+            self.repo.fetch(ImageAsset.query(ImageAsset.title == 'title1').limit(2), cursor=page.cursor)
+        with self.assertRaises(InvalidCursorException):
+            self.repo.fetch(ImageAsset.query().limit(2), cursor='garbage')
+        with self.assertRaises(AssertionError):
+            self.repo.fetch(ImageAsset.query().offset(2))
+
+    def test_iter_fetch(self):
+        images = [ImageAsset(**{'title': 'title%i' % i}) for i in xrange(5)]
+        self.repo.insert_multi(images)
+
+        pager = self.repo.iter_fetch(ImageAsset.query(), page_size=2)
+        pages = pager.pages()
+        self.assertEqual(len(next(pages)), 2)
+        self.assertIsNotNone(pager.paging_state)
+
+        resumed = self.repo.iter_fetch(ImageAsset.query(), page_size=2, paging_state=pager.paging_state)
+        self.assertEqual(len(list(resumed)), 3)
+        self.assertIsNone(resumed.paging_state)
+
     def test_model_pre_put_hook(self):
         video = VideoAsset(**{'title': 'monkey'})
         self.assertEqual(video.music, 'rock')
@@ -481,12 +963,46 @@ class TestCassandraRepository(CassandraTestCaseBase, unittest.TestCase):
                 'revision': 1234
             }
 
-        repo = CassandraRepository(construct_primary_key=custom_construct_primary_key)
+        repo = CassandraRepository(connection_class=self.connection_class, construct_primary_key=custom_construct_primary_key)
         self.assertDictEqual(repo.construct_primary_key(article, MetaData()), {
             'key': 'abc',
             'revision': 1234
         })
 
+    def test_get_model_async(self):
+        tag = Tag(**{
+            'key': 'G9dCxjCen-oJMYWaN2vjn18',
+            'title': 'Hello, earth!'
+        })
+        IOLoop.current().run_sync(lambda: self.repo.insert_async(tag))
+
+        image = ImageAsset(**copy.deepcopy(IMAGE_ASSET))
+        IOLoop.current().run_sync(lambda: self.repo.insert_async(image))
+
+        cql_edges = self.repo.fetch(Edge.query())
+        self.assertEqual(len(cql_edges), 4)
+
+        image = IOLoop.current().run_sync(lambda: self.repo.get_async(image))
+        self.assertEqual(image.topics[0].title, 'Hello, earth!')
+
+        with self.assertRaises(QueryNotFoundException):
+            IOLoop.current().run_sync(lambda: self.repo.get_async(Book()))
+
+    def test_fetch_update_delete_async(self):
+        images = [ImageAsset(**{'title': 'title1'}), ImageAsset(**{'title': 'title2'})]
+        IOLoop.current().run_sync(lambda: self.repo.insert_multi_async(images))
+
+        entities = IOLoop.current().run_sync(lambda: self.repo.fetch_async(ImageAsset.query()))
+        self.assertEqual(len(entities), 2)
+
+        images[0].title = 'Hello, earth!'
+        IOLoop.current().run_sync(lambda: self.repo.update_async(images[0]))
+        self.assertEqual(self.repo.get(images[0]).title, 'Hello, earth!')
+
+        IOLoop.current().run_sync(lambda: self.repo.delete_async(images[0]))
+        entities = self.repo.fetch(ImageAsset.query())
+        self.assertEqual(len(entities), 1)
+
     def test_zero_in_repeated_integer_property(self):
         class Entity(Model):
             a_list = IntegerProperty(repeated=True)
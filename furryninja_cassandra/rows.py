@@ -0,0 +1,57 @@
+__author__ = 'broken'
+
+
+class ColumnIndex(object):
+    __slots__ = ('names', 'positions')
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.positions = dict([(name, position) for position, name in enumerate(self.names)])
+
+
+_column_indexes = {}
+
+
+def column_index(names):
+    names = tuple(names)
+    index = _column_indexes.get(names)
+    if index is None:
+        index = _column_indexes[names] = ColumnIndex(names)
+    return index
+
+
+class Rows(list):
+    __slots__ = ('columns',)
+
+
+def indexed_tuple_factory(colnames, rows):
+    """
+    Row factory that keeps the driver's row tuples and attaches the column
+    positions of the result shape, shared by every result with the same columns.
+    """
+    result = Rows(rows)
+    result.columns = column_index(colnames or ())
+    return result
+
+
+def row_columns(result):
+    columns = getattr(result, 'columns', None)
+    if columns is None and hasattr(result, 'current_rows'):
+        columns = getattr(result.current_rows, 'columns', None)
+    return columns
+
+
+def row_value(row, columns, name, default=None):
+    if columns is None:
+        return row.get(name, default)
+
+    position = columns.positions.get(name)
+    if position is None:
+        return default
+    return row[position]
+
+
+def row_dicts(rows, columns):
+    if columns is None:
+        return list(rows)
+    return [dict(zip(columns.names, row)) for row in rows]
@@ -0,0 +1,32 @@
+import unittest
+from .rows import indexed_tuple_factory, row_columns, row_value, row_dicts
+
+__author__ = 'broken'
+
+
+class TestIndexedTupleFactory(unittest.TestCase):
+    def test_rows_keep_column_positions(self):
+        rows = indexed_tuple_factory(['key', 'blob'], [('a', '{}'), ('b', '{}')])
+
+        self.assertEqual(rows, [('a', '{}'), ('b', '{}')])
+        self.assertEqual(rows.columns.names, ('key', 'blob'))
+        self.assertEqual(rows.columns.positions, {'key': 0, 'blob': 1})
+
+    def test_column_index_is_shared_per_shape(self):
+        first = indexed_tuple_factory(['key', 'blob'], [('a', '{}')])
+        second = indexed_tuple_factory(['key', 'blob'], [('b', '{}')])
+
+        self.assertIs(first.columns, second.columns)
+
+    def test_row_value(self):
+        rows = indexed_tuple_factory(['[applied]'], [(False,)])
+
+        self.assertIs(row_value(rows[0], row_columns(rows), '[applied]'), False)
+        self.assertIsNone(row_value(rows[0], row_columns(rows), 'key'))
+        self.assertIs(row_value({'[applied]': False}, None, '[applied]'), False)
+
+    def test_row_dicts(self):
+        rows = indexed_tuple_factory(['key', 'label'], [('a', 'topics')])
+
+        self.assertEqual(row_dicts(rows, row_columns(rows)), [{'key': 'a', 'label': 'topics'}])
+        self.assertEqual(row_dicts([{'key': 'a'}], None), [{'key': 'a'}])
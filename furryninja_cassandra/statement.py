@@ -0,0 +1,57 @@
+from collections import OrderedDict
+from threading import Lock
+
+__author__ = 'broken'
+
+
+class PreparedStatementCache(object):
+    """
+    Bounded LRU of prepared statements keyed by CQL text.
+
+    Each distinct statement shape is prepared once per session, the least
+    recently used shapes are dropped when the cache grows past ``max_size``.
+    """
+    def __init__(self, session, max_size=500):
+        assert max_size > 0, 'max_size must be a positive integer, got %r' % max_size
+        self.session = session
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__statements = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, statement):
+        with self.__lock:
+            prepared = self.__statements.pop(statement, None)
+            if prepared is not None:
+                self.__statements[statement] = prepared
+                self.hits += 1
+                return prepared
+            self.misses += 1
+
+        prepared = self.session.prepare(statement)
+
+        with self.__lock:
+            self.__statements[statement] = prepared
+            while len(self.__statements) > self.max_size:
+                self.__statements.popitem(last=False)
+        return prepared
+
+    def clear(self):
+        with self.__lock:
+            self.__statements.clear()
+
+    def __len__(self):
+        return len(self.__statements)
+
+    def __contains__(self, statement):
+        return statement in self.__statements
+
+    @property
+    def stats(self):
+        return {
+            'size': len(self.__statements),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,41 @@
+import unittest
+import mock
+from .statement import PreparedStatementCache
+
+__author__ = 'broken'
+
+
+class TestPreparedStatementCache(unittest.TestCase):
+    def setUp(self):
+        self.session = mock.Mock()
+        self.session.prepare.side_effect = lambda statement: 'prepared:%s' % statement
+
+    def test_prepare_once_per_statement(self):
+        cache = PreparedStatementCache(self.session)
+
+        self.assertEqual(cache.get('SELECT * FROM tag WHERE key = :key LIMIT 1'), 'prepared:SELECT * FROM tag WHERE key = :key LIMIT 1')
+        self.assertEqual(cache.get('SELECT * FROM tag WHERE key = :key LIMIT 1'), 'prepared:SELECT * FROM tag WHERE key = :key LIMIT 1')
+        self.assertEqual(self.session.prepare.call_count, 1)
+
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = PreparedStatementCache(self.session, max_size=2)
+
+        cache.get('SELECT * FROM tag')
+        cache.get('SELECT * FROM book')
+        cache.get('SELECT * FROM tag')
+        cache.get('SELECT * FROM edge')
+
+        self.assertEqual(len(cache), 2)
+        self.assertIn('SELECT * FROM tag', cache)
+        self.assertIn('SELECT * FROM edge', cache)
+        self.assertNotIn('SELECT * FROM book', cache)
+
+        self.assertDictEqual(cache.stats, {
+            'size': 2,
+            'max_size': 2,
+            'hits': 1,
+            'misses': 3
+        })
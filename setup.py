@@ -18,8 +18,12 @@ setup(
         'tornado==4.5.1',
         'furryninja'
     ],
+    extras_require={
+        'binary': ['msgpack-python'],
+    },
     tests_require=[
         'mock==1.0.1',
+        'msgpack-python',
         'nose==1.3.3',
         'pysandra-unit==0.5',
     ],